@@ -1,45 +1,50 @@
-import time
 import json
-from datetime import datetime
-import traceback
-from io import BytesIO
-
-import numpy as np
+import logging
 
-from email.mime.text import MIMEText
 # from slack_sdk import WebClient
 import smtplib
+import time
+import traceback
+from datetime import datetime
+from email.mime.text import MIMEText
+from io import BytesIO
 
+import astropy_healpix as ah
+import numpy as np
+from astropy import units as u
+from astropy.table import Table
+from astropy.time import Time
+from candidate_vetting.vet import localization_sequence_from_name
+from django.conf import settings
 from django.contrib.auth.models import Group
 from django.contrib.sites.models import Site
-from django.conf import settings
-
-from tom_nonlocalizedevents.models import NonLocalizedEvent, EventSequence, EventCandidate
-from tom_nonlocalizedevents.alertstream_handlers.igwn_event_handler import handle_igwn_message
+from django.db import transaction
 from tom_dataproducts.tasks import atlas_query
+from tom_nonlocalizedevents.alertstream_handlers.igwn_event_handler import handle_igwn_message
+from tom_nonlocalizedevents.models import EventCandidate, EventSequence, NonLocalizedEvent
 
-from astropy.table import Table
-from astropy.time import Time
-import astropy_healpix as ah
+from scoring.config import DETECTION_HORIZON_DEFAULTS
+from trove_targets.models import Target
 
+from .healpix_utils import (
+    CREDIBLE_REGION_PROBABILITIES,
+    create_elliptical_localization,
+    create_localization_for_igwn_skymap,
+    encode_ranges,
+    pixels_to_ranges,
+)
 from .hooks import (
-    target_post_save,
     associate_targets_with_nle,
+    target_post_save,
 )
+from .models import CredibleRegionContour
 from .templatetags.nonlocalizedevent_extras import (
-    format_inverse_far,
-    format_distance,
     format_area,
+    format_distance,
+    format_inverse_far,
     get_most_likely_class,
 )
-from .healpix_utils import create_elliptical_localization
-from .models import CredibleRegionContour
 
-from candidate_vetting.vet import localization_sequence_from_name
-from scoring.config import DETECTION_HORIZON_DEFAULTS
-from trove_targets.models import Target
-
-import logging
 logger = logging.getLogger(__name__)
 
 
@@ -196,29 +201,42 @@ def send_email(subject, body, is_test_alert=False):
         logger.error(f'Email "{subject}" failed: {e}')
 
 
-def calculate_credible_region(skymap, localization, probability=0.9):
+def calculate_credible_regions(skymap, localization, probabilities=CREDIBLE_REGION_PROBABILITIES):
+    """store the credible region contours for skymap plotting, for every probability from a single sort and cumsum"""
     t0 = time.time()
-    """store the credible region contour for skymap plotting"""
     # Sort the pixels of the sky map by descending probability density
-    skymap.sort("PROBDENSITY", reverse=True)
+    order = np.argsort(-np.asarray(skymap["PROBDENSITY"]), kind="stable")
     # Find the area of each pixel
-    skymap["level"], skymap["ipix"] = ah.uniq_to_level_ipix(skymap["UNIQ"])
-    pixel_area = ah.nside_to_pixel_area(ah.level_to_nside(skymap["level"]))
+    level, ipix = ah.uniq_to_level_ipix(np.asarray(skymap["UNIQ"])[order])
+    pixel_area = ah.nside_to_pixel_area(ah.level_to_nside(level)).to_value(u.sr)
     # Calculate the probability within each pixel: the pixel area times the probability density
-    prob = pixel_area * skymap["PROBDENSITY"]
+    prob = pixel_area * np.asarray(skymap["PROBDENSITY"])[order]
     # Calculate the cumulative sum of the probability
     cumprob = np.cumsum(prob)
-    # Find the pixel for which the probability sums to 0.9
-    index_90 = cumprob.searchsorted(probability)
-    # Find the pixels included in this sum
-    skymap90 = skymap[:index_90].group_by("level")
-    credible_region_90 = {str(group["level"][0]): [ipix.item() for ipix in group["ipix"]] for group in skymap90.groups}
-    if "MOCORDER" in skymap.meta:
-        credible_region_90.setdefault(str(skymap.meta["MOCORDER"]), [])  # must include the highest order
-    # Create the CredibleRegionContour object
-    CredibleRegionContour(localization=localization, probability=probability, pixels=credible_region_90).save()
+    # Find the pixel for which the probability sums to each credible level
+    indices = cumprob.searchsorted(probabilities)
+    logger.info(f"Sorted skymap of {len(order)} pixels in {time.time() - t0:.2f} s")
+
+    contours = []
+    for probability, index in zip(probabilities, indices):
+        t1 = time.time()
+        # Merge the pixels included in this sum into contiguous ranges
+        ranges = pixels_to_ranges(level[:index], ipix[:index])
+        contours.append(CredibleRegionContour(localization=localization, probability=probability,
+                                              ranges=encode_ranges(ranges)))
+        logger.info(f"Calculated {probability:.0%} contour ({index} pixels, {len(ranges)} ranges) "
+                    f"in {time.time() - t1:.2f} s")
+
+    # Create the CredibleRegionContour objects
+    with transaction.atomic():
+        CredibleRegionContour.objects.bulk_create(contours, ignore_conflicts=True)
     dt = time.time() - t0
-    logger.info(f"Calculated skymap contours in {dt:.0f} s")
+    logger.info(f"Calculated {len(contours)} skymap contours in {dt:.0f} s")
+
+
+def calculate_credible_region(skymap, localization, probability=0.9):
+    """store a single credible region contour for skymap plotting"""
+    calculate_credible_regions(skymap, localization, probabilities=[probability])
 
 
 def pick_slack_channel(seq):
@@ -307,6 +325,31 @@ def _message_payload_for_json_dump(message):
     return message
 
 
+def preload_igwn_localizations(alert):
+    """create the localizations of the skymaps embedded in an IGWN alert, streaming their tiles into the database"""
+    superevent_id = alert.get("superevent_id", "")
+    if not superevent_id or alert.get("alert_type", "").upper() == "RETRACTION":
+        return
+    if superevent_id.startswith("M") and not getattr(settings, "SAVE_TEST_ALERTS", True):
+        return  # test alert that will not be saved
+
+    event = alert.get("event") or {}
+    external_coinc = alert.get("external_coinc") or {}
+    skymaps = [(event.get("skymap"), False), (external_coinc.get("combined_skymap"), True)]
+    if not any(skymap_bytes for skymap_bytes, _ in skymaps):
+        return
+
+    nle, _ = NonLocalizedEvent.objects.get_or_create(
+        event_id=superevent_id,
+        event_type=NonLocalizedEvent.NonLocalizedEventType.GRAVITATIONAL_WAVE,
+    )
+    for skymap_bytes, is_combined in skymaps:
+        if skymap_bytes:
+            create_localization_for_igwn_skymap(
+                nle, skymap_bytes, pipeline=event.get("pipeline", ""), is_combined=is_combined
+            )
+
+
 def handle_message_and_send_alerts(message, metadata):
     jname = str(Time.now()).replace(" ", "T") + "-alert.json"
     try:
@@ -335,6 +378,13 @@ def handle_message_and_send_alerts(message, metadata):
     except Exception as e:  # no matter what, do not crash the listener before ingesting the alert
         logger.error(f"Could not extract skymap from alert: {e}")
 
+    # load the skymap tiles in bulk before tom_nonlocalizedevents sees the alert,
+    # so that it finds the localizations already ingested
+    try:
+        preload_igwn_localizations(message.content[0])
+    except Exception as e:  # fall back to tom_nonlocalizedevents' own ingestion
+        logger.error(f"Could not preload skymap tiles from alert: {e}")
+
     # ingest NonLocalizedEvent into the TOM database
     nle, seq = handle_igwn_message(message, metadata)
 
@@ -350,7 +400,7 @@ def handle_message_and_send_alerts(message, metadata):
         else:
             if skymap_bytes is not None:
                 skymap = Table.read(BytesIO(skymap_bytes))
-                calculate_credible_region(skymap, localization)
+                calculate_credible_regions(skymap, localization)
     
     # check for targets over appropriate time horizon
     nle_eventseq = localization_sequence_from_name(nle.event_id)
@@ -415,7 +465,7 @@ def handle_einstein_probe_alert(message, metadata):
     else:
         if skymap is not None:
             skymap["PROBDENSITY"].unit = "1 / sr"
-            calculate_credible_region(skymap, localization)
+            calculate_credible_regions(skymap, localization)
 
     ep_ra = alert.get("ra")
     ep_dec = alert.get("dec")
@@ -483,6 +533,6 @@ def handle_icecube_alert(alert):
     else:
         if skymap is not None:
             skymap["PROBDENSITY"].unit = "1 / sr"
-            calculate_credible_region(skymap, localization)
+            calculate_credible_regions(skymap, localization)
 
     logger.info(f"Finished processing alert for {nonlocalizedevent.event_id}")
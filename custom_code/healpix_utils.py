@@ -1,26 +1,53 @@
-from django.conf import settings
-from django.db import transaction
-from django.db.utils import IntegrityError
-import sqlalchemy as sa
-from sqlalchemy.orm import declarative_base, Session
-from tom_nonlocalizedevents.models import EventCandidate, EventLocalization, SkymapTile
-from tom_nonlocalizedevents.healpix_utils import sa_engine, SaSkymapTile, uniq_to_bigintrange
-from tom_nonlocalizedevents.healpix_utils import update_all_credible_region_percents_for_candidates
-from trove_targets.models import Target
-import numpy as np
-from scipy.stats import multivariate_normal
-from ligo.skymap.moc import bayestar_adaptive_grid
-from datetime import datetime, timezone, timedelta
+import functools
 import hashlib
-import uuid
-import sys
 import json
 import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+
+import astropy_healpix as ah
+import numpy as np
+import sqlalchemy as sa
+import tom_nonlocalizedevents.healpix_utils as upstream_healpix_utils
+from astropy import units as u
+from astropy.table import Table
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Max, Q
+from django.db.utils import IntegrityError
+from healpix_alchemy.constants import LEVEL, PIXEL_AREA
+from ligo.skymap import distance
+from mocpy import MOC
+from scipy.stats import multivariate_normal
+from sqlalchemy.orm import Session, declarative_base
+from tom_nonlocalizedevents.healpix_utils import SaSkymapTile, create_localization_for_skymap, sa_engine
+from tom_nonlocalizedevents.models import CredibleRegion, EventCandidate, EventLocalization, SkymapTile
+
+from trove_targets.models import HEALPIX_COARSE_LEVEL, Target
+
+from .models import SkymapTail, SkymapTileRank
 
 logger = logging.getLogger(__name__)
 
 CREDIBLE_REGION_PROBABILITIES = sorted(json.loads(settings.CREDIBLE_REGION_PROBABILITIES), reverse=True)
 
+SKYMAP_TILE_TABLE = SkymapTile._meta.db_table
+
+# number of localizations whose tiles are kept in memory by get_localization_index
+LOCALIZATION_INDEX_CACHE_SIZE = 16
+
+# depth-29 range covering the whole sky
+ALL_SKY_RANGES = np.array([[0, 12 << (2 * LEVEL)]], dtype=np.int64)
+
+# credible regions covering more coarse pixels than this (about 8% of the sky) skip the coarse target prefilter
+COARSE_PREFILTER_MAX_PIXELS = 4096
+
 Base = declarative_base()
 
 
@@ -29,6 +56,365 @@ class SaTarget(Base):
     basetarget_ptr_id = sa.Column(sa.Integer, primary_key=True)
     healpix = sa.Column(sa.BigInteger)
 
+
+class SaSkymapTileRank(Base):
+    __tablename__ = 'custom_code_skymaptilerank'
+    tile_id = sa.Column(sa.BigInteger, primary_key=True)
+    localization_id = sa.Column(sa.Integer)
+    rank = sa.Column(sa.Integer)
+    cumprob = sa.Column(sa.Float)
+
+
+class LocalizationIndex:
+    """
+    In-memory view of the skymap tiles of one localization, sorted by the lower bound of each tile, with the
+    cumulative probability of every tile precomputed. Looking up a target is then a binary search on its healpix
+    index instead of a range-containment query against the database. If the tiles beyond the storage cutoff were
+    dropped, `tail_probability` is their total probability (see `SkymapTail`) and positions outside the stored tiles
+    get the cumulative probability `tail_cumprob` instead of being outside the localization.
+    """
+
+    def __init__(self, lower, upper, probdensity, cumprob=None, distance_mean=None, distance_std=None,
+                 tail_probability=0.):
+        order = np.argsort(lower, kind='stable')
+        self.lower = np.asarray(lower, dtype=np.int64)[order]
+        self.upper = np.asarray(upper, dtype=np.int64)[order]
+        self.probdensity = np.asarray(probdensity, dtype=float)[order]
+        # localizations without distance information (e.g. bursts, neutrinos) have null distances
+        self.distance_mean = np.full(len(order), np.nan) if distance_mean is None else \
+            np.asarray(distance_mean, dtype=float)[order]
+        self.distance_std = np.full(len(order), np.nan) if distance_std is None else \
+            np.asarray(distance_std, dtype=float)[order]
+        if cumprob is None:
+            area = (self.upper - self.lower) * PIXEL_AREA
+            self.cumprob = cumulative_probability(self.probdensity, area)
+        else:
+            self.cumprob = np.asarray(cumprob, dtype=float)[order]
+        self.tail_probability = float(tail_probability)
+        self._coarse_pixels = {}
+
+    def __len__(self):
+        return len(self.lower)
+
+    @classmethod
+    def from_localization_id(cls, localization_id):
+        """
+        Load every tile of the localization in a single query, reusing stored cumulative probabilities, along with
+        the probability of the tiles that were not stored
+        """
+        query = sa.select(
+            SaSkymapTile.tile.lower,
+            SaSkymapTile.tile.upper,
+            SaSkymapTile.probdensity,
+            SaSkymapTileRank.cumprob,
+            SaSkymapTile.distance_mean,
+            SaSkymapTile.distance_std,
+        ).outerjoin(
+            SaSkymapTileRank, SaSkymapTileRank.tile_id == SaSkymapTile.id
+        ).filter(
+            SaSkymapTile.localization_id == localization_id
+        )
+        with Session(sa_engine) as session:
+            rows = session.execute(query).fetchall()
+        tail_probability = SkymapTail.objects.filter(
+            localization_id=localization_id
+        ).values_list('probability', flat=True).first() or 0.
+        if not rows:
+            return cls(np.empty(0), np.empty(0), np.empty(0), tail_probability=tail_probability)
+        lower, upper, probdensity, cumprob, distance_mean, distance_std = zip(*rows)
+        if any(c is None for c in cumprob):  # not backfilled yet
+            cumprob = None
+        return cls(lower, upper, probdensity, cumprob,
+                   np.array(distance_mean, dtype=float), np.array(distance_std, dtype=float),
+                   tail_probability=tail_probability)
+
+    def tile_indices(self, healpix):
+        """Index of the tile containing each healpix index, or -1 if it falls outside the localization"""
+        healpix = np.atleast_1d(np.asarray(healpix, dtype=np.int64))
+        idx = np.searchsorted(self.lower, healpix, side='right') - 1
+        inside = idx >= 0
+        inside[inside] = healpix[inside] < self.upper[idx[inside]]
+        return np.where(inside, idx, -1)
+
+    def _take(self, values, healpix, fill):
+        """Value of the tile containing each healpix index, `fill` outside the localization"""
+        idx = self.tile_indices(healpix)
+        if not len(values):
+            return np.full(len(idx), fill, dtype=float)
+        return np.where(idx >= 0, values[idx], fill)
+
+    def covers(self, healpix):
+        """Boolean mask of the healpix indices inside the localization, including its dropped tail"""
+        return (self.tile_indices(healpix) >= 0) | (self.tail_probability > 0)
+
+    def cumprob_at(self, healpix):
+        """
+        Cumulative probability of the tile containing each healpix index, `tail_cumprob` outside the stored tiles
+        (1 if the localization has no tail)
+        """
+        return self._take(self.cumprob, healpix, tail_cumprob(self.tail_probability))
+
+    def distances_at(self, healpix):
+        """Distance mean and standard deviation of the tile containing each healpix index (NaN outside)"""
+        return self._take(self.distance_mean, healpix, np.nan), self._take(self.distance_std, healpix, np.nan)
+
+    def in_credible_region(self, healpix, prob=settings.SKYMAP_PROB_CONTOUR):
+        """Boolean mask of the healpix indices that fall within the `prob` credible region"""
+        return self.covers(healpix) & (self.cumprob_at(healpix) <= prob)
+
+    def credible_region_ranges(self, prob=settings.SKYMAP_PROB_CONTOUR):
+        """Merged depth-29 ranges of the `prob` credible region"""
+        inside = self.cumprob <= prob
+        if self.tail_probability and tail_cumprob(self.tail_probability) <= prob:
+            # everything but the stored tiles outside the region, including where the dropped tiles were
+            return ranges_symmetric_difference(
+                ALL_SKY_RANGES, merge_ranges(self.lower[~inside], self.upper[~inside])
+            )
+        return merge_ranges(self.lower[inside], self.upper[inside])
+
+    def coarse_pixels(self, prob=settings.SKYMAP_PROB_CONTOUR, level=HEALPIX_COARSE_LEVEL):
+        """Nested pixels at `level` that overlap the `prob` credible region, computed once per probability"""
+        key = (prob, level)
+        if key not in self._coarse_pixels:
+            self._coarse_pixels[key] = ranges_coarse_pixels(self.credible_region_ranges(prob), level)
+        return self._coarse_pixels[key]
+
+
+def tail_cumprob(tail_probability):
+    """
+    Cumulative probability of the positions outside the stored tiles of a localization whose least probable tiles,
+    with a total probability of `tail_probability`, were dropped. Their actual cumulative probabilities lie between
+    1 - tail_probability and 1, so the middle of that interval is used. Without a tail this is 1.
+    """
+    return 1. - tail_probability / 2 if tail_probability else 1.
+
+
+def cumulative_probability(probdensity, area):
+    """
+    Cumulative probability of each tile when summing from the highest probability density down. Tiles with equal
+    probability density share the same value, matching ``SUM(...) OVER (ORDER BY probdensity DESC)`` in SQL.
+    """
+    order = np.argsort(-probdensity, kind='stable')
+    cumsum = np.cumsum(probdensity[order] * area[order])
+    sorted_probdensity = probdensity[order]
+    # the last position of each group of equal probability densities
+    group_end = np.searchsorted(-sorted_probdensity, -sorted_probdensity, side='right') - 1
+    cumprob = np.empty_like(cumsum)
+    cumprob[order] = cumsum[group_end]
+    return cumprob
+
+
+def store_skymap_tile_ranks(localization, batch_size=10000):
+    """
+    Store the cumulative probability and rank of every tile of `localization`, so that the tiles inside a credible
+    region can be found with an index range scan. Returns the number of tiles ranked.
+    """
+    tiles = SkymapTile.objects.filter(localization=localization).values_list('id', 'tile', 'probdensity')
+    if not tiles:
+        return 0
+    tile_ids, tile_ranges, probdensity = zip(*tiles)
+    lower = np.array([tile_range.lower for tile_range in tile_ranges], dtype=np.int64)
+    upper = np.array([tile_range.upper for tile_range in tile_ranges], dtype=np.int64)
+    probdensity = np.array(probdensity, dtype=float)
+
+    cumprob = cumulative_probability(probdensity, (upper - lower) * PIXEL_AREA)
+    rank = np.empty(len(probdensity), dtype=int)
+    rank[np.argsort(-probdensity, kind='stable')] = np.arange(len(probdensity))
+
+    tile_ranks = [SkymapTileRank(tile_id=tile_id, localization=localization, rank=r, cumprob=c)
+                  for tile_id, r, c in zip(tile_ids, rank.tolist(), cumprob.tolist())]
+    SkymapTileRank.objects.bulk_create(tile_ranks, batch_size=batch_size, ignore_conflicts=True)
+    logger.info(f'Stored cumulative probabilities for {len(tile_ranks)} tiles of localization {localization.id}')
+    return len(tile_ranks)
+
+
+def drop_tiles_beyond_cutoff(localization, cutoff=settings.SKYMAP_TILE_PROB_CUTOFF):
+    """
+    Delete the stored tiles of `localization` outside the `cutoff` credible region, recording their total
+    probability in a `SkymapTail` like `load_skymap_tiles` does for new localizations. Needs the tile ranks (see
+    `store_skymap_tile_ranks`). Returns the number of tiles deleted.
+    """
+    if cutoff >= 1:
+        return 0
+    ranks = SkymapTileRank.objects.filter(localization=localization)
+    beyond = ranks.filter(cumprob__gt=cutoff)
+    ntiles = beyond.count()
+    if not ntiles:
+        return 0
+    # cumulative probabilities sum from the top, so the tail is what lies between the last kept tile and the total
+    total = ranks.aggregate(total=Max('cumprob'))['total']
+    kept = ranks.filter(cumprob__lte=cutoff).aggregate(kept=Max('cumprob'))['kept'] or 0.
+    tail_probability = total - kept
+    with transaction.atomic():
+        # also deletes their ranks
+        SkymapTile.objects.filter(tile_rank__localization=localization, tile_rank__cumprob__gt=cutoff).delete()
+        tail, created = SkymapTail.objects.get_or_create(
+            localization=localization,
+            defaults={'cutoff': cutoff, 'probability': tail_probability, 'ntiles': ntiles},
+        )
+        if not created:  # already trimmed at a larger cutoff
+            tail.cutoff = cutoff
+            tail.probability += tail_probability
+            tail.ntiles += ntiles
+            tail.save()
+    logger.info(f'Dropped {ntiles} tiles of localization {localization.id} beyond the {cutoff} credible region')
+    return ntiles
+
+
+def merge_ranges(lower, upper):
+    """Merge [lower, upper) ranges into the smallest sorted set of disjoint ranges, as an (N, 2) int64 array"""
+    lower = np.asarray(lower, dtype=np.int64)
+    upper = np.asarray(upper, dtype=np.int64)
+    if not len(lower):
+        return np.empty((0, 2), dtype=np.int64)
+    order = np.argsort(lower, kind='stable')
+    lower, upper = lower[order], upper[order]
+    running_upper = np.maximum.accumulate(upper)
+    starts = np.flatnonzero(np.r_[True, lower[1:] > running_upper[:-1]])
+    return np.column_stack([lower[starts], np.maximum.reduceat(upper, starts)])
+
+
+def ranges_coarse_pixels(ranges, level=HEALPIX_COARSE_LEVEL):
+    """Nested pixels at `level` that overlap depth-29 `ranges`"""
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    shift = 2 * (LEVEL - level)
+    first, last = ranges[:, 0] >> shift, (ranges[:, 1] - 1) >> shift
+    counts = last - first + 1
+    # every pixel from first to last of each range
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.unique(np.repeat(first, counts) + offsets)
+
+
+def credible_region_tiles(localization_id, prob=settings.SKYMAP_PROB_CONTOUR):
+    """
+    Ranks of the tiles inside the `prob` credible region of a localization, a range scan of the
+    tilerank_localization_cumprob index
+    """
+    return SkymapTileRank.objects.filter(
+        localization_id=localization_id,
+        cumprob__lte=prob,
+        # lets PostgreSQL prune the partitions of a partitioned tile table when joining the tiles
+        tile__localization_id=localization_id,
+    )
+
+
+def credible_region_ranges(localization_id, prob=settings.SKYMAP_PROB_CONTOUR):
+    """
+    Merged depth-29 ranges of the `prob` credible region of a localization, reading only the tiles inside it (see
+    `credible_region_tiles`) instead of loading and sorting the whole localization. Localizations whose tile ranks
+    have not been stored yet, and regions extending into the dropped tail of a localization (see `tail_cumprob`),
+    fall back to their `LocalizationIndex`.
+    """
+    tail_probability = SkymapTail.objects.filter(
+        localization_id=localization_id
+    ).values_list('probability', flat=True).first()
+    if tail_probability and tail_cumprob(tail_probability) <= prob:
+        return get_localization_index(localization_id).credible_region_ranges(prob)
+    tiles = list(credible_region_tiles(localization_id, prob).values_list('tile__tile', flat=True))
+    if not tiles and not SkymapTileRank.objects.filter(localization_id=localization_id).exists():
+        return get_localization_index(localization_id).credible_region_ranges(prob)
+    return merge_ranges([tile.lower for tile in tiles], [tile.upper for tile in tiles])
+
+
+def pixels_to_ranges(level, ipix):
+    """Merged depth-29 ranges covered by nested healpix pixels `ipix` at `level`"""
+    ipix = np.asarray(ipix, dtype=np.int64)
+    shift = 2 * (LEVEL - np.asarray(level, dtype=np.int64))
+    return merge_ranges(ipix << shift, (ipix + 1) << shift)
+
+
+def ranges_max_depth(ranges):
+    """Coarsest healpix level at which every range boundary falls on a pixel boundary"""
+    boundaries = np.asarray(ranges, dtype=np.int64).ravel()
+    boundaries = boundaries[boundaries > 0]
+    if not len(boundaries):
+        return 0
+    # number of trailing zero bits of each boundary, two bits per level
+    trailing_zeros = np.log2(boundaries & -boundaries).astype(int)
+    return int(LEVEL - trailing_zeros.min() // 2)
+
+
+def ranges_symmetric_difference(ranges1, ranges2):
+    """Merged depth-29 ranges covered by exactly one of two sets of disjoint ranges"""
+    moc1 = MOC.from_depth29_ranges(LEVEL, np.asarray(ranges1, dtype=np.uint64).reshape(-1, 2))
+    moc2 = MOC.from_depth29_ranges(LEVEL, np.asarray(ranges2, dtype=np.uint64).reshape(-1, 2))
+    return np.asarray(moc1.symmetric_difference(moc2).to_depth29_ranges, dtype=np.int64).reshape(-1, 2)
+
+
+def ranges_contain(ranges, healpix):
+    """Boolean mask of the depth-29 healpix indices that fall within sorted, disjoint `ranges`"""
+    ranges = np.asarray(ranges, dtype=np.int64).reshape(-1, 2)
+    healpix = np.asarray(healpix, dtype=np.int64)
+    idx = np.searchsorted(ranges[:, 0], healpix, side='right') - 1
+    inside = idx >= 0
+    inside[inside] = healpix[inside] < ranges[idx[inside], 1]
+    return inside
+
+
+def encode_ranges(ranges):
+    """Pack depth-29 ranges as little-endian int64 (lower, upper) pairs"""
+    return np.asarray(ranges, dtype='<i8').tobytes()
+
+
+def decode_ranges(data):
+    """Inverse of `encode_ranges`"""
+    return np.frombuffer(bytes(data), dtype='<i8').reshape(-1, 2)
+
+
+def get_localization_index(localization_id):
+    """
+    LocalizationIndex of a localization, memoized on its number of stored tiles: the tiles are only ever deleted
+    after a localization is ingested (by trim_skymap_tiles and prune_skymap_tiles, possibly in another process), and
+    counting them is a much cheaper query than loading them
+    """
+    ntiles = SkymapTile.objects.filter(localization_id=localization_id).count()
+    return _get_localization_index(localization_id, ntiles)
+
+
+@functools.lru_cache(maxsize=LOCALIZATION_INDEX_CACHE_SIZE)
+def _get_localization_index(localization_id, ntiles):
+    return LocalizationIndex.from_localization_id(localization_id)
+
+
+def get_localization(event_id, max_time=None):
+    """
+    Most recent localization of the nonlocalized event `event_id` created at or before `max_time` (a datetime or
+    astropy Time; the most recent one if None). If every localization is newer than `max_time`, the earliest one is
+    returned. This is a single index lookup; callers vetting many targets resolve the localization once and pass it
+    on rather than calling this per target.
+    """
+    if max_time is not None and not isinstance(max_time, datetime):
+        max_time = max_time.to_datetime(timezone=timezone.utc)
+    localizations = EventLocalization.objects.filter(nonlocalizedevent__event_id=event_id)
+    before = localizations if max_time is None else localizations.filter(date__lte=max_time)
+    # served by the (nonlocalizedevent_id, date DESC NULLS LAST) index
+    localization = (
+        before.order_by(F('date').desc(nulls_last=True), 'id').first()
+        or localizations.order_by(F('date').asc(nulls_last=True), 'id').first()
+    )
+    if localization is None:
+        raise EventLocalization.DoesNotExist(f'No localizations for {event_id}')
+    return localization
+
+
+def get_target_healpix(target_ids, coarse_pixels=None):
+    """
+    Target IDs and healpix indices as parallel arrays, skipping targets without a healpix. `target_ids` can also be
+    a queryset of target IDs. If `coarse_pixels` is given, only targets in those nested pixels at
+    HEALPIX_COARSE_LEVEL are returned (along with any whose coarse pixel has not been backfilled yet).
+    """
+    targets = Target.objects.filter(pk__in=target_ids, healpix__isnull=False)
+    if coarse_pixels is not None:
+        targets = targets.filter(
+            Q(healpix_coarse__in=np.asarray(coarse_pixels).tolist()) | Q(healpix_coarse__isnull=True)
+        )
+    rows = targets.values_list('pk', 'healpix')
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    ids, healpix = zip(*rows)
+    return np.array(ids, dtype=np.int64), np.array(healpix, dtype=np.int64)
+
+
 def get_target_ids_in_prob_credible_region(
         eventsequence,
         prob=settings.SKYMAP_PROB_CONTOUR,
@@ -49,43 +435,18 @@ def get_target_ids_in_prob_credible_region(
         logger.info("Target IDs not provided; filtering for targets created "+
                     f"after {nle_time + timedelta(tdelta)}")
         targets = Target.objects.filter(created__gte=nle_time + timedelta(tdelta))
-        target_ids = list(targets.values_list('pk', flat=True))
+        target_ids = targets.values('pk')
 
-    with Session(sa_engine) as session:
+    ranges = credible_region_ranges(eventsequence.localization.id, prob)
+    # cheap integer match on the coarse pixels of the region before the exact test on the full-resolution healpix,
+    # unless the region is so broad that the prefilter would not exclude much
+    coarse_pixels = ranges_coarse_pixels(ranges)
+    if len(coarse_pixels) > COARSE_PREFILTER_MAX_PIXELS:
+        coarse_pixels = None
+    ids, healpix = get_target_healpix(target_ids, coarse_pixels=coarse_pixels)
 
-        cum_prob = sa.func.sum(
-            SaSkymapTile.probdensity * SaSkymapTile.tile.area
-        ).over(
-            order_by=SaSkymapTile.probdensity.desc()
-        ).label(
-            'cum_prob'
-        )
+    return ids[ranges_contain(ranges, healpix)].tolist()
 
-        subquery = sa.select(
-            SaSkymapTile.probdensity,
-            cum_prob
-        ).filter(
-            SaSkymapTile.localization_id == eventsequence.localization.id
-        ).subquery()
-
-        min_probdensity = sa.select(
-            sa.func.min(subquery.columns.probdensity)
-        ).filter(
-            subquery.columns.cum_prob <= prob
-        ).scalar_subquery()
-
-        query = sa.select(
-            SaTarget.basetarget_ptr_id
-        ).filter(
-            SaTarget.basetarget_ptr_id.in_(target_ids),
-            SaSkymapTile.localization_id == eventsequence.localization.id,
-            SaSkymapTile.tile.contains(SaTarget.healpix),
-            SaSkymapTile.probdensity >= min_probdensity
-        )
-
-        results = session.execute(query)
-        
-        return results
 
 def create_candidates_from_targets(eventsequence, prob=0.95, target_ids=None):
     """
@@ -98,9 +459,9 @@ def create_candidates_from_targets(eventsequence, prob=0.95, target_ids=None):
                                                       prob, 
                                                       target_ids)
     new_candidates = []
-    for result in results:
+    for target_id in results:
         ec, created = EventCandidate.objects.get_or_create(
-            target=Target.objects.get(id=result[0]),
+            target=Target.objects.get(id=target_id),
             nonlocalizedevent=eventsequence.nonlocalizedevent,
         )
         if created:
@@ -108,14 +469,185 @@ def create_candidates_from_targets(eventsequence, prob=0.95, target_ids=None):
 
     logger.info(f'Linked {len(new_candidates)} new candidates to event {eventsequence.nonlocalizedevent.event_id}')
 
-    if len(new_candidates): # only do this (time-consuming) step if any new candidates were linked
-        localizations = eventsequence.nonlocalizedevent.localizations.all()
-        for localization in localizations:
-            update_all_credible_region_percents_for_candidates(localization, [cand.id for cand in new_candidates])
+    if len(new_candidates): # only do this step if any new candidates were linked
+        update_credible_region_percents(eventsequence.nonlocalizedevent.localizations.all(),
+                                        [cand.id for cand in new_candidates])
 
     return new_candidates
 
 
+def smallest_credible_region_percents(cumprob, probabilities=CREDIBLE_REGION_PROBABILITIES):
+    """
+    Smallest of `probabilities` (as an integer percent) whose credible region contains a tile with cumulative
+    probability `cumprob`, or -1 if it is outside all of them
+    """
+    ascending = np.sort(probabilities)
+    idx = np.searchsorted(ascending, np.asarray(cumprob, dtype=float), side='left')
+    percents = np.rint(100. * ascending[np.minimum(idx, len(ascending) - 1)]).astype(int)
+    return np.where(idx < len(ascending), percents, -1)
+
+
+def credible_region_percents(index, healpix, probabilities=CREDIBLE_REGION_PROBABILITIES):
+    """Smallest credible region percent of each healpix index in a `LocalizationIndex`, -1 outside all of them"""
+    percents = smallest_credible_region_percents(index.cumprob_at(healpix), probabilities)
+    percents[~index.covers(healpix)] = -1
+    return percents
+
+
+def changed_credible_region_ranges(old_ranges, new_ranges):
+    """
+    Merged depth-29 ranges of the pixels whose smallest credible region may differ between two localizations, given
+    the ranges of each of their credible regions at the same probabilities (`old_ranges` and `new_ranges`). Every
+    pixel outside them is inside exactly the same credible regions of both localizations.
+    """
+    changed = np.concatenate([np.empty((0, 2), dtype=np.int64)] + [
+        ranges_symmetric_difference(old, new) for old, new in zip(old_ranges, new_ranges)
+    ])
+    return merge_ranges(changed[:, 0], changed[:, 1])
+
+
+def update_credible_region_percents(localizations, event_candidate_ids, batch_size=10000):
+    """
+    Create or update the `CredibleRegion` of every candidate in every localization with the smallest credible
+    region it falls into. This is equivalent to calling tom_nonlocalizedevents'
+    ``update_all_credible_region_percents_for_candidates`` for each localization, but each localization is a single
+    lookup of all candidates in its `LocalizationIndex`, and the results are written with one bulk upsert.
+    """
+    candidates = EventCandidate.objects.filter(id__in=list(event_candidate_ids), healpix__isnull=False)
+    rows = np.array(list(candidates.values_list('id', 'healpix')), dtype=np.int64).reshape(-1, 2)
+    candidate_ids, healpix = rows[:, 0].tolist(), rows[:, 1]
+
+    credible_regions = []
+    for localization in localizations:
+        percents = credible_region_percents(get_localization_index(localization.id), healpix)
+        credible_regions.extend(
+            CredibleRegion(localization=localization, candidate_id=candidate_id, smallest_percent=percent)
+            for candidate_id, percent in zip(candidate_ids, percents.tolist()) if percent >= 0
+        )
+
+    CredibleRegion.objects.bulk_create(
+        credible_regions,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['localization', 'candidate'],
+        update_fields=['smallest_percent'],
+    )
+    logger.info(f'Updated {len(credible_regions)} credible regions for {len(candidate_ids)} candidates')
+    return credible_regions
+
+
+def update_candidates_from_targets(eventsequence, previous_localization, prob=0.95, target_ids=(), batch_size=10000):
+    """
+    Incremental version of `create_candidates_from_targets` for when `eventsequence` updates the localization of an
+    event from `previous_localization`. Targets that are not linked to the event yet go through
+    `create_candidates_from_targets`. Every candidate already linked to the event gets a `CredibleRegion` for the new
+    localization, but only those in pixels whose membership of any of the CREDIBLE_REGION_PROBABILITIES regions
+    changed between the two localizations are looked up again; the others keep their percent of the previous one.
+    """
+    nonlocalizedevent = eventsequence.nonlocalizedevent
+    localization = eventsequence.localization
+
+    ids, _ = get_target_healpix(target_ids)
+    linked = set(EventCandidate.objects.filter(
+        nonlocalizedevent=nonlocalizedevent,
+        target_id__in=ids.tolist(),
+    ).values_list('target_id', flat=True))
+    new_candidates = create_candidates_from_targets(
+        eventsequence, prob, target_ids=[tid for tid in ids.tolist() if tid not in linked]
+    )
+
+    # the smallest percent only depends on which credible regions contain a candidate
+    changed_ranges = changed_credible_region_ranges(
+        [credible_region_ranges(previous_localization.id, p) for p in CREDIBLE_REGION_PROBABILITIES],
+        [credible_region_ranges(localization.id, p) for p in CREDIBLE_REGION_PROBABILITIES],
+    )
+    candidates = EventCandidate.objects.filter(nonlocalizedevent=nonlocalizedevent, healpix__isnull=False).exclude(
+        id__in=[candidate.id for candidate in new_candidates]
+    )
+    rows = np.array(list(candidates.values_list('id', 'healpix')), dtype=np.int64).reshape(-1, 2)
+    changed = ranges_contain(changed_ranges, rows[:, 1])
+
+    previous_percents = dict(CredibleRegion.objects.filter(
+        localization=previous_localization,
+        candidate_id__in=rows[~changed, 0].tolist(),
+    ).values_list('candidate_id', 'smallest_percent'))
+    CredibleRegion.objects.bulk_create(
+        [CredibleRegion(localization_id=localization.id, candidate_id=candidate_id, smallest_percent=percent)
+         for candidate_id, percent in previous_percents.items()],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['localization', 'candidate'],
+        update_fields=['smallest_percent'],
+    )
+    # candidates without a percent for the previous localization are looked up too
+    lookup_ids = [cid for cid in rows[:, 0].tolist() if cid not in previous_percents]
+    logger.info(f'{np.sum(changed)} candidates of {nonlocalizedevent.event_id} changed credible regions between '
+                f'localizations {previous_localization.id} and {localization.id}; kept the percents of '
+                f'{len(previous_percents)}')
+    if lookup_ids:
+        update_credible_region_percents([localization], lookup_ids)
+
+    return new_candidates
+
+
+def elliptical_gaussian_grid(center, cov, sigma_clip=5., pixels_per_sigma=4, max_order=12):
+    """
+    Multiorder healpix grid of a 2D Gaussian in (ra, dec), generated analytically instead of by adaptive refinement:
+    pixels within `sigma_clip` standard deviations of the center are evaluated at the resolution resolving the
+    narrowest axis with `pixels_per_sigma` pixels, and the rest of the sky is covered by the coarsest pixels that do
+    not overlap them. Returns a normalized table with UNIQ and PROBDENSITY columns, like ``bayestar_adaptive_grid``.
+
+    :param center: center of the Gaussian [ra, dec] in radians
+    :param cov: covariance matrix of the Gaussian in radians^2
+    """
+    std = np.sqrt(np.diag(cov))
+    resolution = ah.nside_to_pixel_resolution(ah.level_to_nside(np.arange(max_order + 1))).to_value(u.rad)
+    target_order = int(min(np.searchsorted(-resolution, -std.min() / pixels_per_sigma), max_order))
+
+    # fine pixels around the center
+    hpx = ah.HEALPix(nside=ah.level_to_nside(target_order), order='nested')
+    fine = np.unique(hpx.cone_search_lonlat(center[0] * u.rad, center[1] * u.rad, sigma_clip * std.max() * u.rad))
+    levels, pixels = [np.full(len(fine), target_order)], [fine]
+
+    # the coarsest pixels covering the rest of the sky, level by level
+    covered = np.arange(12)
+    for level in range(target_order + 1):
+        parents = np.unique(fine >> 2 * (target_order - level))
+        free = np.setdiff1d(covered, parents, assume_unique=True)
+        levels.append(np.full(len(free), level))
+        pixels.append(free)
+        covered = (parents[:, np.newaxis] * 4 + np.arange(4)).ravel()
+    levels, pixels = np.concatenate(levels), np.concatenate(pixels)
+
+    nside = ah.level_to_nside(levels)
+    ra, dec = ah.healpix_to_lonlat(pixels, nside, order='nested')
+    probdensity = multivariate_normal(center, cov).pdf(np.column_stack((ra.to_value(u.rad), dec.to_value(u.rad))))
+    probdensity /= np.sum(probdensity * ah.nside_to_pixel_area(nside).to_value(u.sr))
+    return Table([ah.level_ipix_to_uniq(levels, pixels), probdensity], names=['UNIQ', 'PROBDENSITY'])
+
+
+def _elliptical_grid_cache_path(skymap_hash):
+    return os.path.join(settings.SKYMAP_GRID_CACHE_DIR, f'{skymap_hash}.npz')
+
+
+def read_cached_elliptical_grid(skymap_hash):
+    """Previously generated grid for this parameter hash, or None"""
+    try:
+        with np.load(_elliptical_grid_cache_path(skymap_hash)) as cached:
+            return Table([cached['uniq'], cached['probdensity']], names=['UNIQ', 'PROBDENSITY'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def write_cached_elliptical_grid(skymap_hash, skymap):
+    """Keep a generated grid on disk, keyed by its parameter hash"""
+    try:
+        os.makedirs(settings.SKYMAP_GRID_CACHE_DIR, exist_ok=True)
+        np.savez(_elliptical_grid_cache_path(skymap_hash), uniq=skymap['UNIQ'], probdensity=skymap['PROBDENSITY'])
+    except OSError as e:
+        logger.warning(f'Could not cache elliptical localization grid {skymap_hash}: {e}')
+
+
 def create_elliptical_localization(nonlocalizedevent, center, radius, conf_inv=0.9):
     """
     Create an elliptical healpix localization with a Gaussian probability distribution
@@ -124,51 +656,204 @@ def create_elliptical_localization(nonlocalizedevent, center, radius, conf_inv=0
     :param center: center of the ellipse [ra, dec] in degrees
     :param radius: radius of the ellipse [ra, dec] in degrees (a single float can be given for a circular localization)
     :param conf_inv: confidence interval corresponding to the given radius (default: 0.9 = 90%)
+    :returns: the localization and its grid (None if the localization already existed and its grid is not cached)
     """
     logger.info(f"Creating localization for {nonlocalizedevent.event_id} at {center} with radius {radius}")
 
-    center = np.deg2rad(center)
+    center = np.deg2rad(np.asarray(center, dtype=float))
     if isinstance(radius, float) or isinstance(radius, int):
         radius = np.tile(radius, 2)
     sigma = np.deg2rad(radius) / np.sqrt(-2. * np.log(1. - conf_inv))  # converting from conf_inv to 2D Gaussian sigma
-    distribution = multivariate_normal(center, np.diag(sigma))
-    skymap = bayestar_adaptive_grid(distribution.pdf)
+    cov = np.diag(sigma)
 
     # rather than make a fake skymap file, encode the unique parameters in a short string
-    skymap_bytes = '{:f}_{:f}_{:f}_{:f}_{:f}_{:f}'.format(*distribution.mean, *distribution.cov.flat).encode('utf-8')
+    skymap_bytes = '{:f}_{:f}_{:f}_{:f}_{:f}_{:f}'.format(*center, *cov.flat).encode('utf-8')
     skymap_hash = hashlib.md5(skymap_bytes).hexdigest()
     skymap_uuid = uuid.UUID(skymap_hash)
     try:
         localization = EventLocalization.objects.get(nonlocalizedevent=nonlocalizedevent, skymap_hash=skymap_uuid)
+        return localization, read_cached_elliptical_grid(skymap_hash)
     except EventLocalization.DoesNotExist:
-        date = datetime.now(tz=timezone.utc)
-
-        # calculate localization areas analytically, assuming localization is small (so we can pretend it's Euclidean)
-        radius_50 = np.rad2deg(distribution.cov) * np.sqrt(-2. * np.log(0.5))
-        radius_90 = np.rad2deg(distribution.cov) * np.sqrt(-2. * np.log(0.1))
-        area_50 = np.pi * np.linalg.det(radius_50)
-        area_90 = np.pi * np.linalg.det(radius_90)
-
-        with transaction.atomic():
-            try:
-                localization, is_new = EventLocalization.objects.get_or_create(
-                    nonlocalizedevent=nonlocalizedevent,
-                    skymap_hash=skymap_uuid,
-                    defaults={
-                        'area_50': area_50,
-                        'area_90': area_90,
-                        'date': date
-                    }
-                )
-                if is_new:  # protect against race conditions where the localization has already been added
-                    tiles = [SkymapTile(localization=localization,
-                                        tile=uniq_to_bigintrange(row['UNIQ']),
-                                        probdensity=row['PROBDENSITY'])
-                             for row in skymap[skymap['PROBDENSITY'] > sys.float_info.min]]  # avoid underflow error
-                    SkymapTile.objects.bulk_create(tiles)
-            except IntegrityError as e:
-                if 'unique constraint' in e.message:
-                    return EventLocalization.objects.get(nonlocalizedevent=nonlocalizedevent, skymap_hash=skymap_hash)
-                raise e
+        pass
+
+    skymap = read_cached_elliptical_grid(skymap_hash)
+    if skymap is None:
+        skymap = elliptical_gaussian_grid(center, cov)
+        write_cached_elliptical_grid(skymap_hash, skymap)
+
+    date = datetime.now(tz=timezone.utc)
+
+    # calculate localization areas analytically, assuming localization is small (so we can pretend it's Euclidean)
+    radius_50 = np.rad2deg(cov) * np.sqrt(-2. * np.log(0.5))
+    radius_90 = np.rad2deg(cov) * np.sqrt(-2. * np.log(0.1))
+    area_50 = np.pi * np.linalg.det(radius_50)
+    area_90 = np.pi * np.linalg.det(radius_90)
+
+    with transaction.atomic():
+        try:
+            localization, is_new = EventLocalization.objects.get_or_create(
+                nonlocalizedevent=nonlocalizedevent,
+                skymap_hash=skymap_uuid,
+                defaults={
+                    'area_50': area_50,
+                    'area_90': area_90,
+                    'date': date
+                }
+            )
+            if is_new:  # protect against race conditions where the localization has already been added
+                keep = skymap['PROBDENSITY'] > sys.float_info.min  # avoid underflow error
+                load_skymap_tiles(localization, skymap['UNIQ'][keep], skymap['PROBDENSITY'][keep])
+                store_skymap_tile_ranks(localization)
+        except IntegrityError as e:
+            if 'unique constraint' in str(e):
+                localization = EventLocalization.objects.get(nonlocalizedevent=nonlocalizedevent,
+                                                             skymap_hash=skymap_uuid)
+                return localization, skymap
+            raise e
 
     return localization, skymap
+
+
+def skymap_tile_partition_name(localization_id):
+    """Name of the partition of the skymap tile table holding the tiles of one localization"""
+    return f'{SKYMAP_TILE_TABLE}_l{int(localization_id)}'
+
+
+def skymap_tiles_partitioned():
+    """Whether the skymap tile table has been partitioned by localization (see the partition_skymap_tiles command)"""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)', [SKYMAP_TILE_TABLE])
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def create_skymap_tile_partition(localization_id):
+    """
+    Create the partition for the tiles of a localization if the tile table is partitioned. Tiles of localizations
+    without their own partition end up in the default partition. Returns whether a partition exists.
+    """
+    if not skymap_tiles_partitioned():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {skymap_tile_partition_name(localization_id)} '
+            f'PARTITION OF {SKYMAP_TILE_TABLE} FOR VALUES IN ({int(localization_id)})'
+        )
+    return True
+
+
+def tiles_within_cutoff(probdensity, area, cutoff=settings.SKYMAP_TILE_PROB_CUTOFF):
+    """
+    Mask of the tiles within the `cutoff` credible region, and the total probability of the others. Dropping the
+    least probable tiles leaves the cumulative probability of every other tile unchanged.
+    """
+    if cutoff >= 1:
+        return np.ones(len(probdensity), dtype=bool), 0.
+    keep = cumulative_probability(probdensity, area) <= cutoff
+    return keep, float(np.sum((probdensity * area)[~keep]))
+
+
+def load_skymap_tiles(localization, uniq, probdensity, distmu=None, distsigma=None,
+                      cutoff=settings.SKYMAP_TILE_PROB_CUTOFF):
+    """
+    Write the tiles of a multiorder skymap for `localization` from its UNIQ, PROBDENSITY and (optionally) DISTMU and
+    DISTSIGMA columns. The tile ranges and distance moments are computed in vectorized form, and on PostgreSQL the
+    rows are streamed into the table with COPY instead of going through the ORM. Tiles outside the `cutoff` credible
+    region are not stored, and their total probability is recorded in a `SkymapTail`.
+    """
+    t0 = time.time()
+    level, ipix = ah.uniq_to_level_ipix(np.asarray(uniq, dtype=np.int64))
+    shift = 2 * (LEVEL - level)
+    lower = ipix << shift
+    upper = (ipix + 1) << shift
+    probdensity = np.asarray(probdensity, dtype=float)
+    # This is necessary to make sure we don't get an underflow error in postgres
+    probdensity = np.where(probdensity > sys.float_info.min, probdensity, 0.)
+    if distmu is not None and distsigma is not None:
+        distance_mean, distance_std, _ = distance.parameters_to_moments(np.asarray(distmu), np.asarray(distsigma))
+    else:
+        distance_mean = distance_std = np.zeros(len(probdensity))
+
+    keep, tail_probability = tiles_within_cutoff(probdensity, (upper - lower) * PIXEL_AREA, cutoff)
+    if not keep.all():
+        SkymapTail.objects.update_or_create(
+            localization=localization,
+            defaults={'cutoff': cutoff, 'probability': tail_probability, 'ntiles': int(np.sum(~keep))},
+        )
+        lower, upper, probdensity = lower[keep], upper[keep], probdensity[keep]
+        distance_mean, distance_std = distance_mean[keep], distance_std[keep]
+
+    rows = zip(lower.tolist(), upper.tolist(), probdensity.tolist(), distance_mean.tolist(), distance_std.tolist())
+    if connection.vendor == 'postgresql':
+        create_skymap_tile_partition(localization.id)
+        buffer = StringIO()
+        buffer.writelines(f'{localization.id}\t[{lo},{hi})\t{pd!r}\t{dm!r}\t{ds!r}\n' for lo, hi, pd, dm, ds in rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {SKYMAP_TILE_TABLE} (localization_id, tile, probdensity, distance_mean, distance_std) '
+                'FROM STDIN',
+                buffer
+            )
+    else:  # SQLite for local development and tests
+        SkymapTile.objects.bulk_create(
+            [SkymapTile(localization=localization, tile=(lo, hi), probdensity=pd, distance_mean=dm, distance_std=ds)
+             for lo, hi, pd, dm, ds in rows],
+            batch_size=10000,
+        )
+    logger.info(f'Loaded {len(probdensity)} tiles for localization {localization.id} in {time.time() - t0:.2f} s')
+
+
+class _RowTileInserts:
+    """
+    Manager standing in for ``SkymapTile.objects`` in ``tom_nonlocalizedevents.healpix_utils``, whose
+    `create_localization_for_skymap` inserts the tiles of a skymap one row at a time. The inserts are skipped in a
+    thread that loads the tiles with `load_skymap_tiles` instead, and go through to the `SkymapTile` table otherwise.
+    """
+    skip = threading.local()
+
+    def create(self, **kwargs):
+        if getattr(self.skip, 'active', False):
+            return None
+        return SkymapTile.objects.create(**kwargs)
+
+
+upstream_healpix_utils.SkymapTile = SimpleNamespace(objects=_RowTileInserts())
+
+
+def create_localization_for_igwn_skymap(nonlocalizedevent, skymap_bytes, pipeline='', is_combined=False):
+    """
+    Create the localization for an IGWN multiorder skymap with ``tom_nonlocalizedevents.healpix_utils.
+    create_localization_for_skymap``, but load its tiles with `load_skymap_tiles` and rank them in the same
+    transaction. When this runs before the alert is handed to tom_nonlocalizedevents, that finds the existing
+    localization (by skymap hash) and skips its own row-by-row tile inserts.
+    """
+    skymap_uuid = uuid.UUID(hashlib.md5(skymap_bytes).hexdigest())
+    try:
+        return EventLocalization.objects.get(nonlocalizedevent=nonlocalizedevent, skymap_hash=skymap_uuid)
+    except EventLocalization.DoesNotExist:
+        pass
+
+    with transaction.atomic():
+        _RowTileInserts.skip.active = True
+        try:
+            localization = create_localization_for_skymap(
+                nonlocalizedevent, skymap_bytes, pipeline=pipeline, is_combined=is_combined
+            )
+        finally:
+            _RowTileInserts.skip.active = False
+        if not SkymapTile.objects.filter(localization=localization).exists():
+            # protect against race conditions where the localization has already been added
+            skymap = Table.read(BytesIO(skymap_bytes))
+            is_burst = pipeline in ['CWB', 'oLIB', 'MLy']
+            load_skymap_tiles(
+                localization,
+                skymap['UNIQ'],
+                skymap['PROBDENSITY'],
+                distmu=None if is_burst else skymap['DISTMU'],
+                distsigma=None if is_burst else skymap['DISTSIGMA'],
+            )
+            store_skymap_tile_ranks(localization)
+    return localization
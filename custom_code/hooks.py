@@ -1,21 +1,21 @@
 import logging
 from datetime import datetime, timedelta, timezone
+
+from astropy.coordinates import SkyCoord
+from astropy.time import Time, TimezoneInfo
+from astroquery.ipac.irsa.irsa_dust import IrsaDust
 from django.db.models import Min
-from tom_targets.models import TargetExtra
-from tom_nonlocalizedevents.models import NonLocalizedEvent
 from tom_dataproducts.models import ReducedDatum
+from tom_nonlocalizedevents.models import NonLocalizedEvent
+from tom_targets.models import TargetExtra
 
-from scoring.vet_bns import vet_bns
-from scoring.vet_kn_in_sn import vet_kn_in_sn
-from scoring.vet_super_kn import vet_super_kn
+from custom_code.healpix_utils import create_candidates_from_targets, update_candidates_from_targets
+from scoring.config import FORM_CHOICE_PARAM_RANGES
+from scoring.cosmology import luminosity_distance
+from scoring.light_curve import get_light_curve
 from scoring.vet_basic import vet_basic
-
-from custom_code.healpix_utils import create_candidates_from_targets
+from scoring.vet_transients import vet_transients
 from trove_targets.models import Target
-from astropy.time import Time, TimezoneInfo
-from astropy.coordinates import SkyCoord
-from astroquery.ipac.irsa.irsa_dust import IrsaDust
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 new_format = logging.Formatter("[%(asctime)s] %(levelname)s : s%(message)s")
@@ -54,7 +54,10 @@ def process_reduced_ztf_data(target, candidates):
         )
         if created:  # do this afterward, in case there are duplicate candidates with distinct ZIDs
             rd.source_location = candidate["zid"]
-            rd.save()
+            rd.save(update_fields=["source_location"])
+
+    # add the new points to the cached light curve
+    get_light_curve(target.id)
 
 
 def update_or_create_target_extra(target, key, value):
@@ -117,9 +120,27 @@ def associate_nle_with_target(
 
     return new_candidates
 
+
+def previous_localization(nle:NonLocalizedEvent, seq):
+    """The localization of the latest sequence of `nle` before `seq` that has a different localization"""
+    previous = nle.sequences.filter(
+        sequence_id__lt=seq.sequence_id,
+        localization__isnull=False,
+    ).exclude(
+        localization_id=seq.localization_id
+    ).order_by("sequence_id").last()
+    return previous.localization if previous is not None else None
+
+
 def associate_targets_with_nle(
-    nle:NonLocalizedEvent, first_det_min, first_det_max   
+    nle:NonLocalizedEvent, first_det_min, first_det_max, incremental=True
 ):
+    """
+    Link the targets first detected within (first_det_min, first_det_max) days of
+    the event to it. If `incremental`, and the latest sequence updated the
+    localization, only targets whose credible-region membership may have changed
+    are re-evaluated.
+    """
     # get info on the NLE
     seq = nle.sequences.last()
     try:
@@ -144,6 +165,9 @@ def associate_targets_with_nle(
     )
 
     # then create candidates from these targets and return them
+    previous = previous_localization(nle, seq) if incremental and seq.localization is not None else None
+    if previous is not None:
+        return update_candidates_from_targets(seq, previous, target_ids=list(targets))
     return create_candidates_from_targets(seq, target_ids=list(targets)) 
     
 def target_post_save(
@@ -188,9 +212,11 @@ def target_post_save(
         #       For now we are just always all types of vetting
         if len(new_candidates):
             for cand in new_candidates:
-                vet_bns(cand.target.id, cand.nonlocalizedevent.event_id)
-                vet_kn_in_sn(cand.target.id, cand.nonlocalizedevent.event_id)
-                vet_super_kn(cand.target.id, cand.nonlocalizedevent.event_id)
+                vet_transients(
+                    cand.target.id,
+                    cand.nonlocalizedevent.event_id,
+                    FORM_CHOICE_PARAM_RANGES,
+                )
         else:
             messages.append(
                 "Did not run NLE vetting on this target because there are no NLEs associated with it!"
@@ -199,9 +225,7 @@ def target_post_save(
     redshift = target.targetextra_set.filter(key="Redshift")
     if redshift.exists() and target.distance is None:
         messages.append(f"Updating distance of {target.name} based on redshift")
-        target.distance = (
-            settings.COSMO.luminosity_distance(target.redshift).to("Mpc").value
-        )
+        target.distance = luminosity_distance(target.redshift)
         target.save()
 
     for message in messages:
@@ -1,17 +1,16 @@
-import numpy as np
-from datetime import datetime, timedelta
 import logging
+from datetime import datetime, timedelta
 
-from django.core.management.base import BaseCommand
+import numpy as np
 from django.conf import settings
+from django.core.management.base import BaseCommand
+from tom_nonlocalizedevents.models import NonLocalizedEvent
 
-from tom_nonlocalizedevents.models import NonLocalizedEvent 
-
-from trove_targets.models import Target
 from custom_code.healpix_utils import (
-    get_target_ids_in_prob_credible_region,
     create_candidates_from_targets,
-    )
+    get_target_ids_in_prob_credible_region,
+)
+from trove_targets.models import Target
 
 logger = logging.getLogger(__name__)
 new_format = logging.Formatter("[%(asctime)s] %(levelname)s : s%(message)s")
@@ -83,12 +82,10 @@ class Command(BaseCommand):
         logger.info("Getting targets in the "+
                     f"{settings.SKYMAP_PROB_CONTOUR*100:.0f}% localization "+
                     f"region of {nle.event_id}")
-        tids = get_target_ids_in_prob_credible_region(
+        tids_ls = get_target_ids_in_prob_credible_region(
             seq,
             prob=settings.SKYMAP_PROB_CONTOUR,
             tdelta=first_det_tmin)
-        tids_ls = list(tids)
-        tids_ls = [tid[0] for tid in tids_ls]
         targets = Target.objects.filter(id__in=tids_ls,
                                         created__gte=nle_time+timedelta(first_det_tmin)).order_by("name")
         logger.info(f"Found {len(targets)} targets")
@@ -0,0 +1,51 @@
+"""
+Store the cumulative probability and rank of the skymap tiles of localizations
+that were ingested before these were computed at ingest time.
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from tom_nonlocalizedevents.models import EventLocalization
+
+from custom_code.healpix_utils import store_skymap_tile_ranks
+
+logger = logging.getLogger(__name__)
+new_format = logging.Formatter("[%(asctime)s] %(levelname)s : s%(message)s")
+for handler in logger.handlers:
+    handler.setFormatter(new_format)
+
+
+class Command(BaseCommand):
+    help = ("Backfill the cumulative probability and rank of skymap tiles "+
+            "for localizations that do not have them yet")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--nle-id",
+            help="Only backfill the localizations of this nonlocalized event "+
+            "(event ID, e.g. S250206dm)",
+            type=str,
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the localizations that would be backfilled without "+
+            "writing anything",
+        )
+
+    def handle(self, nle_id=None, dry_run=False, **kwargs):
+        localizations = EventLocalization.objects.filter(tile_ranks__isnull=True)
+        if nle_id is not None:
+            localizations = localizations.filter(nonlocalizedevent__event_id=nle_id)
+        localizations = localizations.distinct().order_by("id")
+
+        logger.info(f"Found {localizations.count()} localizations without tile ranks")
+        nranked = 0
+        for localization in localizations:
+            if dry_run:
+                self.stdout.write(f"Would backfill localization {localization.id} "+
+                                  f"of {localization.nonlocalizedevent.event_id}")
+                continue
+            nranked += store_skymap_tile_ranks(localization)
+
+        self.stdout.write(f"Ranked {nranked} tiles")
@@ -0,0 +1,42 @@
+"""
+Fill in the coarse (nside 64) healpix pixel of targets that were saved before
+Target.healpix_coarse existed, so that candidate discovery can prefilter them
+with an integer match before the exact containment test.
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from healpix_alchemy.constants import LEVEL
+
+from trove_targets.models import HEALPIX_COARSE_LEVEL, Target
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Backfill the coarse healpix pixel of targets that do not have it yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            help="Number of targets to update per statement (default: 50000)",
+            type=int,
+            default=50000,
+        )
+
+    def handle(self, batch_size=50000, **kwargs):
+        # healpix indices are non-negative, so integer division is the same as the bit shift in Target.save
+        divisor = 1 << 2 * (LEVEL - HEALPIX_COARSE_LEVEL)
+        targets = Target.objects.filter(healpix__isnull=False, healpix_coarse__isnull=True)
+        logger.info(f"Found {targets.count()} targets without a coarse healpix pixel")
+
+        nupdated = 0
+        while True:
+            batch = list(targets.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not batch:
+                break
+            nupdated += Target.objects.filter(pk__in=batch).update(healpix_coarse=F("healpix") / divisor)
+            logger.info(f"Updated {nupdated} targets")
+
+        self.stdout.write(f"Backfilled the coarse healpix pixel of {nupdated} targets")
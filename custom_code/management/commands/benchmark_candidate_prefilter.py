@@ -0,0 +1,82 @@
+"""
+Compare finding the targets inside a credible region with and without the
+coarse healpix prefilter (Target.healpix_coarse), e.g. on a database with a
+few hundred thousand TNS targets. With --explain, also print the query plan
+of reading the credible region from the stored tile ranks.
+"""
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from tom_nonlocalizedevents.models import EventLocalization
+
+from custom_code.healpix_utils import (
+    credible_region_ranges,
+    credible_region_tiles,
+    get_target_healpix,
+    ranges_coarse_pixels,
+    ranges_contain,
+)
+from trove_targets.models import Target
+
+
+class Command(BaseCommand):
+    help = "Benchmark the coarse healpix prefilter for candidate discovery"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--localization-id",
+            help="Localization to search (default: the most recent one)",
+            type=int,
+        )
+        parser.add_argument(
+            "--prob",
+            help="Credible region probability (default: 0.95)",
+            type=float,
+            default=0.95,
+        )
+        parser.add_argument(
+            "--repeat",
+            help="Number of times to run each search; the median is reported (default: 3)",
+            type=int,
+            default=3,
+        )
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="Print the query plan of the credible region tile scan",
+        )
+
+    def handle(self, localization_id=None, prob=0.95, repeat=3, explain=False, **kwargs):
+        localizations = EventLocalization.objects.order_by("-date")
+        if localization_id is not None:
+            localizations = localizations.filter(id=localization_id)
+        localization = localizations.first()
+        if localization is None:
+            raise CommandError("No localization to search")
+
+        if explain:
+            self.stdout.write(credible_region_tiles(localization.id, prob).values_list("tile__tile").explain(analyze=True))
+
+        t0 = time.perf_counter()
+        ranges = credible_region_ranges(localization.id, prob)
+        dt = time.perf_counter() - t0
+        coarse_pixels = ranges_coarse_pixels(ranges)
+        target_ids = Target.objects.values("pk")
+        self.stdout.write(
+            f"Localization {localization.id}: {len(ranges)} ranges read in {1e3 * dt:.1f} ms, "
+            f"{len(coarse_pixels)} coarse pixels "
+            f"in the {prob} credible region; {Target.objects.count()} targets"
+        )
+
+        for label, pixels in [("exact only", None), ("coarse prefilter", coarse_pixels)]:
+            times = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                ids, healpix = get_target_healpix(target_ids, coarse_pixels=pixels)
+                inside = ids[ranges_contain(ranges, healpix)]
+                times.append(time.perf_counter() - t0)
+            self.stdout.write(
+                f"{label:>16}: {len(ids):>8} targets fetched, {len(inside):>6} inside, "
+                f"{1e3 * np.median(times):.1f} ms"
+            )
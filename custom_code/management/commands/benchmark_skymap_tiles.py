@@ -0,0 +1,88 @@
+"""
+Time the per-localization skymap tile queries used by candidate linking and
+scoring, to check that their latency stays flat as the tile table grows (e.g.
+before and after partition_skymap_tiles, or as more events are ingested).
+
+For each sampled localization this times loading all of its tiles (what
+LocalizationIndex does), and the credible-region window query that
+tom_nonlocalizedevents runs when linking candidates.
+"""
+import time
+
+import numpy as np
+import sqlalchemy as sa
+from django.core.management.base import BaseCommand
+from sqlalchemy.orm import Session
+from tom_nonlocalizedevents.healpix_utils import SaSkymapTile, sa_engine
+from tom_nonlocalizedevents.models import EventLocalization, SkymapTile
+
+from custom_code.healpix_utils import LocalizationIndex, skymap_tiles_partitioned
+
+
+def _credible_region_query(localization_id, prob):
+    cum_prob = sa.func.sum(
+        SaSkymapTile.probdensity * SaSkymapTile.tile.area
+    ).over(
+        order_by=SaSkymapTile.probdensity.desc()
+    ).label('cum_prob')
+    subquery = sa.select(cum_prob).filter(SaSkymapTile.localization_id == localization_id).subquery()
+    return sa.select(sa.func.count()).select_from(subquery).filter(subquery.columns.cum_prob <= prob)
+
+
+def _median_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return np.median(times)
+
+
+class Command(BaseCommand):
+    help = "Benchmark per-localization skymap tile queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--samples",
+            help="Number of most recent localizations to time (default: 10)",
+            type=int,
+            default=10,
+        )
+        parser.add_argument(
+            "--repeat",
+            help="Number of times to run each query; the median is reported (default: 5)",
+            type=int,
+            default=5,
+        )
+        parser.add_argument(
+            "--prob",
+            help="Credible region probability (default: 0.95)",
+            type=float,
+            default=0.95,
+        )
+
+    def handle(self, samples=10, repeat=5, prob=0.95, **kwargs):
+        self.stdout.write(
+            f"{SkymapTile.objects.count()} tiles in {EventLocalization.objects.count()} localizations "
+            f"({'partitioned' if skymap_tiles_partitioned() else 'unpartitioned'})"
+        )
+        self.stdout.write(f"{'localization':>12} {'tiles':>8} {'load [ms]':>10} {'region [ms]':>12}")
+
+        load_times, region_times = [], []
+        localization_ids = EventLocalization.objects.order_by("-date").values_list("id", flat=True)[:samples]
+        with Session(sa_engine) as session:
+            for localization_id in localization_ids:
+                ntiles = SkymapTile.objects.filter(localization_id=localization_id).count()
+                load_time = _median_time(lambda: LocalizationIndex.from_localization_id(localization_id), repeat)
+                query = _credible_region_query(localization_id, prob)
+                region_time = _median_time(lambda: session.execute(query).scalar(), repeat)
+                load_times.append(load_time)
+                region_times.append(region_time)
+                self.stdout.write(
+                    f"{localization_id:>12} {ntiles:>8} {1e3 * load_time:>10.1f} {1e3 * region_time:>12.1f}"
+                )
+
+        if load_times:
+            self.stdout.write(
+                f"{'median':>12} {'':>8} {1e3 * np.median(load_times):>10.1f} {1e3 * np.median(region_times):>12.1f}"
+            )
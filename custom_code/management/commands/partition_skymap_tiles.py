@@ -0,0 +1,117 @@
+"""
+Convert the skymap tile table into a table list-partitioned by localization,
+with one partition per existing localization and a default partition for
+anything else. Every credible-region and distance query filters on one
+localization, so it then only scans that localization's tiles and indexes,
+however many events have been ingested. New localizations get their own
+partition when their tiles are loaded (custom_code.healpix_utils.load_skymap_tiles),
+and old ones can be dropped wholesale with the prune_skymap_tiles command.
+
+PostgreSQL only. The table is rewritten inside one transaction, so run it
+while the alert listener is stopped.
+"""
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from custom_code.healpix_utils import (
+    SKYMAP_TILE_TABLE,
+    skymap_tile_partition_name,
+    skymap_tiles_partitioned,
+)
+
+logger = logging.getLogger(__name__)
+
+UNPARTITIONED_TABLE = f"{SKYMAP_TILE_TABLE}_unpartitioned"
+ID_SEQUENCE = f"{SKYMAP_TILE_TABLE}_partitioned_id_seq"
+
+
+def partition_statements(localization_ids, index_definitions):
+    """SQL that rebuilds the tile table as a partitioned table, given the localizations that have tiles and the
+    CREATE INDEX statements of the existing table"""
+    statements = [
+        f"ALTER TABLE {SKYMAP_TILE_TABLE} RENAME TO {UNPARTITIONED_TABLE}",
+        f"CREATE TABLE {SKYMAP_TILE_TABLE} (LIKE {UNPARTITIONED_TABLE}) PARTITION BY LIST (localization_id)",
+        f"CREATE SEQUENCE {ID_SEQUENCE} AS bigint OWNED BY {SKYMAP_TILE_TABLE}.id",
+        f"ALTER TABLE {SKYMAP_TILE_TABLE} ALTER COLUMN id SET DEFAULT nextval('{ID_SEQUENCE}')",
+        f"CREATE TABLE {SKYMAP_TILE_TABLE}_default PARTITION OF {SKYMAP_TILE_TABLE} DEFAULT",
+    ]
+    statements += [
+        f"CREATE TABLE {skymap_tile_partition_name(localization_id)} "
+        f"PARTITION OF {SKYMAP_TILE_TABLE} FOR VALUES IN ({int(localization_id)})"
+        for localization_id in localization_ids
+    ]
+    statements += [
+        f"INSERT INTO {SKYMAP_TILE_TABLE} SELECT * FROM {UNPARTITIONED_TABLE}",
+        f"SELECT setval('{ID_SEQUENCE}', COALESCE(MAX(id), 0) + 1, false) FROM {SKYMAP_TILE_TABLE}",
+        f"DROP TABLE {UNPARTITIONED_TABLE}",
+        # the primary key of a partitioned table has to include the partition key
+        f"ALTER TABLE {SKYMAP_TILE_TABLE} ADD PRIMARY KEY (id, localization_id)",
+        f"ALTER TABLE {SKYMAP_TILE_TABLE} ADD CONSTRAINT {SKYMAP_TILE_TABLE}_localization_id_fk "
+        "FOREIGN KEY (localization_id) REFERENCES tom_nonlocalizedevents_eventlocalization (id) "
+        "DEFERRABLE INITIALLY DEFERRED",
+    ]
+    # recreate the existing indexes, with their original names, on the partitioned table and all partitions
+    statements += list(index_definitions)
+    statements.append(f"ANALYZE {SKYMAP_TILE_TABLE}")
+    return statements
+
+
+class Command(BaseCommand):
+    help = "Partition the skymap tile table by localization (PostgreSQL only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the SQL that would be run without changing anything",
+        )
+
+    def handle(self, dry_run=False, **kwargs):
+        if connection.vendor != "postgresql":
+            raise CommandError(f"Database is {connection.vendor!r}; partitioning requires PostgreSQL")
+        if skymap_tiles_partitioned():
+            self.stdout.write(self.style.WARNING(f"{SKYMAP_TILE_TABLE} is already partitioned; nothing to do."))
+            return
+
+        with connection.cursor() as cursor:
+            # foreign keys to the tile id cannot point at a partitioned table
+            cursor.execute(
+                "SELECT conname, conrelid::regclass FROM pg_constraint "
+                "WHERE contype = 'f' AND confrelid = to_regclass(%s)",
+                [SKYMAP_TILE_TABLE],
+            )
+            referencing = cursor.fetchall()
+            if referencing:
+                raise CommandError(
+                    "Foreign keys reference the tile table, drop them first: "
+                    + ", ".join(f"{name} on {table}" for name, table in referencing)
+                )
+
+            cursor.execute(f"SELECT DISTINCT localization_id FROM {SKYMAP_TILE_TABLE} ORDER BY localization_id")
+            localization_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(
+                "SELECT indexdef FROM pg_indexes i JOIN pg_index x ON x.indexrelid = to_regclass(i.indexname) "
+                "WHERE i.tablename = %s AND NOT x.indisprimary",
+                [SKYMAP_TILE_TABLE],
+            )
+            index_definitions = [row[0] for row in cursor.fetchall()]
+
+        statements = partition_statements(localization_ids, index_definitions)
+        if dry_run:
+            for statement in statements:
+                self.stdout.write(f"{statement};")
+            return
+
+        t0 = time.time()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for statement in statements:
+                logger.info(statement)
+                cursor.execute(statement)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Partitioned {SKYMAP_TILE_TABLE} into {len(localization_ids)} localization partitions "
+            f"in {time.time() - t0:.1f} s"
+        ))
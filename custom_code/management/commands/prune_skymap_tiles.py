@@ -0,0 +1,86 @@
+"""
+Remove the skymap tiles of retracted and mock (MS*) events, which are never
+vetted again but would otherwise stay in the tile table forever. The
+localizations themselves and their credible region contours are kept, so the
+event pages still show the skymap outline.
+
+When the tile table is partitioned by localization (partition_skymap_tiles),
+each localization's partition is detached and dropped, which is instant and
+leaves no dead rows behind. With --detach-only the detached partitions are
+kept as standalone tables, e.g. to be archived with pg_dump before dropping.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+from tom_nonlocalizedevents.models import EventLocalization, NonLocalizedEvent, SkymapTile
+
+from custom_code.healpix_utils import (
+    SKYMAP_TILE_TABLE,
+    skymap_tile_partition_name,
+    skymap_tiles_partitioned,
+)
+from custom_code.models import SkymapTileRank
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Drop the skymap tiles of retracted and mock (MS*) events"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            help="Only prune localizations created more than this many days ago (default: 7)",
+            type=float,
+            default=7.,
+        )
+        parser.add_argument(
+            "--detach-only",
+            action="store_true",
+            help="Detach the partitions of a partitioned tile table instead of dropping them",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the localizations that would be pruned without changing anything",
+        )
+
+    @staticmethod
+    def _has_partition(partition):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", [partition])
+            return cursor.fetchone()[0] is not None
+
+    def handle(self, older_than=7., detach_only=False, dry_run=False, **kwargs):
+        localizations = EventLocalization.objects.filter(
+            Q(nonlocalizedevent__state=NonLocalizedEvent.NonLocalizedEventState.RETRACTED)
+            | Q(nonlocalizedevent__event_id__startswith="MS"),
+            date__lt=datetime.now(tz=timezone.utc) - timedelta(days=older_than),
+            tiles__isnull=False,
+        ).distinct().select_related("nonlocalizedevent").order_by("id")
+
+        partitioned = skymap_tiles_partitioned()
+        npruned = 0
+        for localization in localizations:
+            event_id = localization.nonlocalizedevent.event_id
+            if dry_run:
+                self.stdout.write(f"Would prune localization {localization.id} of {event_id}")
+                continue
+
+            with transaction.atomic():
+                SkymapTileRank.objects.filter(localization=localization).delete()
+                partition = skymap_tile_partition_name(localization.id)
+                if partitioned and self._has_partition(partition):
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"ALTER TABLE {SKYMAP_TILE_TABLE} DETACH PARTITION {partition}")
+                        if not detach_only:
+                            cursor.execute(f"DROP TABLE {partition}")
+                else:  # unpartitioned table, or tiles in the default partition
+                    SkymapTile.objects.filter(localization=localization).delete()
+            logger.info(f"Pruned the tiles of localization {localization.id} of {event_id}")
+            npruned += 1
+
+        self.stdout.write(f"Pruned the tiles of {npruned} localizations")
@@ -0,0 +1,59 @@
+"""
+Delete the stored skymap tiles outside the SKYMAP_TILE_PROB_CUTOFF credible
+region of localizations that were ingested before tiles were cut off at
+ingest time. Nothing in TROVE looks beyond SKYMAP_PROB_CONTOUR, and the
+probability of the deleted tiles is recorded in SkymapTail.
+"""
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from tom_nonlocalizedevents.models import EventLocalization
+
+from custom_code.healpix_utils import drop_tiles_beyond_cutoff, store_skymap_tile_ranks
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ("Delete the skymap tiles outside the storage cutoff credible region "+
+            "of localizations that still have them")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cutoff",
+            help="Cumulative probability beyond which tiles are deleted "+
+            f"(default: SKYMAP_TILE_PROB_CUTOFF = {settings.SKYMAP_TILE_PROB_CUTOFF})",
+            type=float,
+            default=settings.SKYMAP_TILE_PROB_CUTOFF,
+        )
+        parser.add_argument(
+            "--nle-id",
+            help="Only trim the localizations of this nonlocalized event "+
+            "(event ID, e.g. S250206dm)",
+            type=str,
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="List the localizations that would be trimmed without "+
+            "deleting anything",
+        )
+
+    def handle(self, cutoff=settings.SKYMAP_TILE_PROB_CUTOFF, nle_id=None, dry_run=False, **kwargs):
+        localizations = EventLocalization.objects.all()
+        if nle_id is not None:
+            localizations = localizations.filter(nonlocalizedevent__event_id=nle_id)
+        localizations = localizations.order_by("id")
+
+        ndropped = 0
+        for localization in localizations:
+            if dry_run:
+                nbeyond = localization.tile_ranks.filter(cumprob__gt=cutoff).count()
+                self.stdout.write(f"Would delete {nbeyond} ranked tiles of localization {localization.id}")
+                continue
+            if not localization.tile_ranks.exists():
+                store_skymap_tile_ranks(localization)
+            ndropped += drop_tiles_beyond_cutoff(localization, cutoff)
+
+        self.stdout.write(f"Deleted {ndropped} tiles")
@@ -0,0 +1,46 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_nonlocalizedevents", "0018_alter_eventlocalization_date"),
+        ("custom_code", "0015_alter_credibleregioncontour_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SkymapTileRank",
+            fields=[
+                (
+                    "tile",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="tile_rank",
+                        serialize=False,
+                        to="tom_nonlocalizedevents.skymaptile",
+                    ),
+                ),
+                ("rank", models.IntegerField()),
+                ("cumprob", models.FloatField()),
+                (
+                    "localization",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tile_ranks",
+                        to="tom_nonlocalizedevents.eventlocalization",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["localization", "cumprob"], name="tilerank_localization_cumprob"),
+                    models.Index(fields=["localization", "rank"], name="tilerank_localization_rank"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import numpy as np
+from django.db import migrations, models
+
+LEVEL = 29
+
+
+def pixels_to_ranges(apps, schema_editor):
+    """Encode the existing {level: [ipix, ...]} contours as merged depth-29 ranges"""
+    CredibleRegionContour = apps.get_model("custom_code", "CredibleRegionContour")
+    for contour in CredibleRegionContour.objects.filter(ranges__isnull=True).iterator():
+        lower, upper = [], []
+        for level, ipix in (contour.pixels or {}).items():
+            ipix = np.asarray(ipix, dtype=np.int64)
+            shift = 2 * (LEVEL - int(level))
+            lower.append(ipix << shift)
+            upper.append((ipix + 1) << shift)
+        lower = np.concatenate(lower) if lower else np.empty(0, dtype=np.int64)
+        upper = np.concatenate(upper) if upper else np.empty(0, dtype=np.int64)
+        order = np.argsort(lower, kind="stable")
+        lower, upper = lower[order], upper[order]
+        if len(lower):
+            starts = np.flatnonzero(np.r_[True, lower[1:] > np.maximum.accumulate(upper)[:-1]])
+            ranges = np.column_stack([lower[starts], np.maximum.reduceat(upper, starts)])
+        else:
+            ranges = np.empty((0, 2), dtype=np.int64)
+        contour.ranges = ranges.astype("<i8").tobytes()
+        contour.save(update_fields=["ranges"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("custom_code", "0016_skymaptilerank"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="credibleregioncontour",
+            name="ranges",
+            field=models.BinaryField(
+                help_text="Merged depth-29 healpix ranges, packed as little-endian int64 (lower, upper) pairs",
+                null=True,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="credibleregioncontour",
+            name="pixels",
+            field=models.JSONField(blank=True, help_text="Legacy {level: [ipix, ...]} encoding", null=True),
+        ),
+        migrations.RunPython(pixels_to_ranges, migrations.RunPython.noop),
+    ]
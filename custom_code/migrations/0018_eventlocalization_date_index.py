@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index the localizations of each event by date, so that the latest localization before a given time
+    (custom_code.healpix_utils.get_localization) is a single index lookup. EventLocalization belongs to
+    tom_nonlocalizedevents, so the index is created with raw SQL.
+    """
+
+    dependencies = [
+        ("tom_nonlocalizedevents", "0018_alter_eventlocalization_date"),
+        ("custom_code", "0017_credibleregioncontour_ranges"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE INDEX IF NOT EXISTS eventlocalization_nle_date "
+                "ON tom_nonlocalizedevents_eventlocalization (nonlocalizedevent_id, date DESC)",
+            reverse_sql="DROP INDEX IF EXISTS eventlocalization_nle_date",
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_nonlocalizedevents", "0018_alter_eventlocalization_date"),
+        ("custom_code", "0018_eventlocalization_date_index"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="skymaptilerank",
+            name="tile",
+            field=models.OneToOneField(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                primary_key=True,
+                related_name="tile_rank",
+                serialize=False,
+                to="tom_nonlocalizedevents.skymaptile",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_nonlocalizedevents", "0018_alter_eventlocalization_date"),
+        ("custom_code", "0019_skymaptilerank_tile_no_db_constraint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SkymapTail",
+            fields=[
+                (
+                    "localization",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="skymap_tail",
+                        serialize=False,
+                        to="tom_nonlocalizedevents.eventlocalization",
+                    ),
+                ),
+                (
+                    "cutoff",
+                    models.FloatField(help_text="Cumulative probability beyond which tiles were not stored"),
+                ),
+                (
+                    "probability",
+                    models.FloatField(help_text="Total probability of the tiles that were not stored"),
+                ),
+                ("ntiles", models.IntegerField(help_text="Number of tiles that were not stored")),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Rebuild the (nonlocalizedevent_id, date) index of the localizations with NULL dates last, matching the
+    ORDER BY of custom_code.healpix_utils.get_localization.
+    """
+
+    dependencies = [
+        ("custom_code", "0020_skymaptail"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                "DROP INDEX IF EXISTS eventlocalization_nle_date",
+                "CREATE INDEX eventlocalization_nle_date "
+                "ON tom_nonlocalizedevents_eventlocalization (nonlocalizedevent_id, date DESC NULLS LAST)",
+            ],
+            reverse_sql=[
+                "DROP INDEX IF EXISTS eventlocalization_nle_date",
+                "CREATE INDEX eventlocalization_nle_date "
+                "ON tom_nonlocalizedevents_eventlocalization (nonlocalizedevent_id, date DESC)",
+            ],
+        ),
+    ]
@@ -1,14 +1,49 @@
-from django.db import models
 from django.contrib.auth.models import User
-from tom_nonlocalizedevents.models import EventLocalization
+from django.db import models
+from tom_nonlocalizedevents.models import EventLocalization, SkymapTile
 
 
 class CredibleRegionContour(models.Model):
     localization = models.ForeignKey(EventLocalization, related_name='credible_region_contours', on_delete=models.CASCADE)
     probability = models.FloatField()
-    pixels = models.JSONField()
+    pixels = models.JSONField(null=True, blank=True, help_text='Legacy {level: [ipix, ...]} encoding')
+    ranges = models.BinaryField(
+        null=True,
+        help_text='Merged depth-29 healpix ranges, packed as little-endian int64 (lower, upper) pairs'
+    )
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['localization', 'probability'], name='unique_localization_probability')
         ]
+
+
+class SkymapTileRank(models.Model):
+    """Cumulative probability and rank (by descending probability density) of a skymap tile, stored at ingest"""
+    # no database foreign key: the tile table may be partitioned by localization, and PostgreSQL cannot reference
+    # the id of a partitioned table on its own (see the partition_skymap_tiles command)
+    tile = models.OneToOneField(SkymapTile, related_name='tile_rank', on_delete=models.CASCADE, primary_key=True,
+                                db_constraint=False)
+    localization = models.ForeignKey(EventLocalization, related_name='tile_ranks', on_delete=models.CASCADE)
+    rank = models.IntegerField()
+    cumprob = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['localization', 'cumprob'], name='tilerank_localization_cumprob'),
+            models.Index(fields=['localization', 'rank'], name='tilerank_localization_rank'),
+        ]
+
+
+class SkymapTail(models.Model):
+    """
+    Skymap tiles beyond the storage cutoff (SKYMAP_TILE_PROB_CUTOFF) of a localization, which are not stored. The
+    cumulative probability of every stored tile is unaffected; any position outside them has a cumulative probability
+    between 1 - probability and 1.
+    """
+    localization = models.OneToOneField(
+        EventLocalization, related_name='skymap_tail', on_delete=models.CASCADE, primary_key=True
+    )
+    cutoff = models.FloatField(help_text='Cumulative probability beyond which tiles were not stored')
+    probability = models.FloatField(help_text='Total probability of the tiles that were not stored')
+    ntiles = models.IntegerField(help_text='Number of tiles that were not stored')
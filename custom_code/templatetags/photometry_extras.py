@@ -1,15 +1,17 @@
+import re
+from datetime import datetime
+
+import numpy as np
+import plotly.graph_objs as go
+import plotly.io as pio
 from django import forms, template
 from django.conf import settings
 from guardian.shortcuts import get_objects_for_user
-import plotly.io as pio
-import plotly.graph_objs as go
 from plotly import colors
+from tom_dataproducts.forms import DataShareForm
 from tom_dataproducts.models import ReducedDatum
-import numpy as np
-from datetime import datetime
-import re
 
-from tom_dataproducts.forms import DataShareForm
+from scoring.light_curve import get_light_curve
 
 register = template.Library()
 
@@ -102,6 +104,32 @@ def get_marker_for_photometry_point(label, marker_map, others):
                 return marker
 
 
+def light_curve_plot_data(light_curve):
+    """
+    The detections and limits of a ``scoring.light_curve.LightCurve`` for ``photometry_for_target``, as dictionaries
+    of telescope: filter: lists of times and magnitudes/errors or limits, sorted by telescope/filter name.
+    """
+    detections = {}
+    limits = {}
+    photdf = light_curve.to_frame()
+    photdf['time'] = light_curve.timestamps()
+    for (source_name, filter_name), points in photdf.groupby(['telescope', 'filter'], sort=True):
+        dets = points[~points.upperlimit]
+        if len(dets):
+            detections.setdefault(source_name, {})[filter_name] = {
+                'time': dets.time.tolist(),
+                'magnitude': dets.mag.tolist(),
+                'error': dets.magerr.tolist(),
+            }
+        lims = points[points.upperlimit]
+        if len(lims):
+            limits.setdefault(source_name, {})[filter_name] = {
+                'time': lims.time.tolist(),
+                'limit': lims.mag.tolist(),
+            }
+    return detections, limits
+
+
 @register.inclusion_tag('tom_dataproducts/partials/recent_photometry.html', takes_context=True)
 def recent_photometry(context, target, limit=1):
     """
@@ -158,29 +186,35 @@ def photometry_for_target(context, target, width=700, height=600, background=Non
     :type grid: bool
     """
     if settings.TARGET_PERMISSIONS_ONLY:
-        datums = ReducedDatum.objects.filter(target=target, data_type=settings.DATA_PRODUCT_TYPES['photometry'][0])
+        # everyone sees all the photometry, so it can come from the cached light curve (without saving it on a page
+        # view), plus the points without a filter, which the light curve leaves out
+        detections, limits = light_curve_plot_data(get_light_curve(target.id, update_cache=False))
+        datums = ReducedDatum.objects.filter(
+            target=target,
+            data_type=settings.DATA_PRODUCT_TYPES['photometry'][0],
+        ).exclude(value__has_key='filter').order_by("source_name")
     else:
         datums = get_objects_for_user(context['request'].user,
                                       'tom_dataproducts.view_reduceddatum',
                                       klass=ReducedDatum.objects.filter(
                                         target=target,
                                         data_type=settings.DATA_PRODUCT_TYPES['photometry'][0]))
-    datums = datums.order_by("source_name", "value__filter") # sort data by telescope/filter name
+        datums = datums.order_by("source_name", "value__filter") # sort data by telescope/filter name
+        detections = {}
+        limits = {}
 
-    detections = {}
-    limits = {}
     for datum in datums:
         if 'magnitude' in datum.value:
             detections.setdefault(datum.source_name, {})
-            detections[datum.source_name].setdefault(datum.value['filter'], {})
-            filter_data = detections[datum.source_name][datum.value['filter']]
+            detections[datum.source_name].setdefault(datum.value.get('filter', 'unknown'), {})
+            filter_data = detections[datum.source_name][datum.value.get('filter', 'unknown')]
             filter_data.setdefault('time', []).append(datum.timestamp)
             filter_data.setdefault('magnitude', []).append(datum.value['magnitude'])
             filter_data.setdefault('error', []).append(datum.value.get('error', 0.))
         elif 'limit' in datum.value:
             limits.setdefault(datum.source_name, {})
-            limits[datum.source_name].setdefault(datum.value['filter'], {})
-            filter_data = limits[datum.source_name][datum.value['filter']]
+            limits[datum.source_name].setdefault(datum.value.get('filter', 'unknown'), {})
+            filter_data = limits[datum.source_name][datum.value.get('filter', 'unknown')]
             filter_data.setdefault('time', []).append(datum.timestamp)
             filter_data.setdefault('limit', []).append(datum.value['limit'])
 
@@ -1,10 +1,11 @@
-from django import template
-from tom_nonlocalizedevents.models import NonLocalizedEvent
-from astropy.coordinates import get_body
-from astropy.time import Time
 from datetime import timedelta
-from astroplan import moon_illumination
 
+from astroplan import moon_illumination
+from astropy.coordinates import get_body
+from astropy.time import Time
+from django import template
+from django.urls import reverse
+from tom_nonlocalizedevents.models import NonLocalizedEvent
 
 register = template.Library()
 
@@ -33,11 +34,7 @@ def skymap(context, localization):
     }
 
     # GW skymap
-    contour = localization.credible_region_contours.filter(probability=0.9)
-    if contour.exists():
-        extras["credible_region"] = contour.last().pixels
-    else:
-        extras["credible_region"] = []
+    extras["credible_region_url"] = credible_region_url(localization)
 
     print("Finished fetching skymap")
 
@@ -55,17 +52,19 @@ def skymap_simple(context, localization):
     }
 
     # GW skymap
-    contour = localization.credible_region_contours.filter(probability=0.9)
-    if contour.exists():
-        extras["credible_region"] = contour.last().pixels
-    else:
-        extras["credible_region"] = []
+    extras["credible_region_url"] = credible_region_url(localization)
 
     print("Finished fetching skymap")
 
     return extras
 
 
+def credible_region_url(localization, probability=0.9):
+    """URL of the encoded credible region contour, or None if it has not been computed"""
+    if localization.credible_region_contours.filter(probability=probability, ranges__isnull=False).exists():
+        return reverse("trove_nonlocalizedevents:skymap-moc", args=[localization.id]) + f"?probability={probability}"
+
+
 def get_preferred_localization(nle):
     seq = nle.sequences.last()
     if seq is not None:
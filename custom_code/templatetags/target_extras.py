@@ -1,8 +1,10 @@
+import re
+
+from astropy.coordinates import SkyCoord
 from django import template
 from django.template.defaultfilters import stringfilter
-from astropy.coordinates import SkyCoord
-import json
-import re
+
+from scoring.host_galaxies import get_host_galaxy_records
 
 register = template.Library()
 
@@ -41,9 +43,5 @@ def aladin_custom(target):
     Displays Aladin skyview of the given target along with basic finder chart annotations and circles around potential
     host galaxies. The resulting image is downloadable. This templatetag only works for sidereal targets.
     """
-    target_extra = target.targetextra_set.filter(key='Host Galaxies')
-    if target_extra.exists():
-        galaxies = json.loads(target_extra.first().value)
-    else:
-        galaxies = []
+    galaxies = get_host_galaxy_records(target.id) or []
     return {'target': target, 'galaxy_ras': [g['RA'] for g in galaxies], 'galaxy_decs': [g['Dec'] for g in galaxies]}
@@ -1,9 +1,10 @@
-from django import template
-from django.utils.safestring import mark_safe
-from tom_targets.models import TargetExtra
 import math
+
 import numpy as np
-import json
+from django import template
+from django.utils.safestring import mark_safe
+
+from scoring.host_galaxies import get_host_galaxy_records
 
 register = template.Library()
 
@@ -137,11 +138,8 @@ def galaxy_table(target):
     """
     Displays the most likely host galaxy matches.
     """
-    te = TargetExtra.objects.filter(target=target, key="Host Galaxies")
-    if te.exists():
-        galaxies = json.loads(te.first().value)
+    galaxies = get_host_galaxy_records(target.id)
+    if galaxies is not None:
         for galaxy in galaxies:
             _apply_redshift_formatting(galaxy)
-    else:
-        galaxies = None
     return {"galaxies": galaxies}
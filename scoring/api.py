@@ -1,17 +1,21 @@
 from typing import List
+
 from ninja import Router, Schema
 from ninja.orm import create_schema
 from tom_nonlocalizedevents.models import EventCandidate
 from tom_targets.utils import cone_search_filter
+
 from trove_targets.models import Target
+
 from .util import get_event_candidate_scores
 
 router = Router()
 
-def _compute_scores(ecs):
+
+def _compute_scores(ecs, limit=None, offset=0):
     # calculate the final scores, sorted by decreasing score, and return
     # Add agn scoring potentially here
-    ecs_with_scores = get_event_candidate_scores(ecs)
+    ecs_with_scores = get_event_candidate_scores(ecs, limit=limit, offset=offset)
 
     return [
         {
@@ -36,13 +40,17 @@ def _compute_scores(ecs):
 
 
 @router.get("/{nle_name}")
-def get_scores_from_nle_name(request, nle_name:str, candidate_names:str|None=None):
+def get_scores_from_nle_name(
+    request, nle_name:str, candidate_names:str|None=None, limit:int|None=None, offset:int=0
+):
     """
     Endpoint to get the score based on the nle name
 
     *Args*:
     - nle_name (str): The name of the poorly localized event
     - candidate_names (str): A comma separated list of candidate names (ex. "AT2025xyz,AT2026qwe")
+    - limit (int): Only return this many of the highest scoring candidates
+    - offset (int): Skip this many of the highest scoring candidates (default 0)
 
     *Returns*:
     A list of dictionaries containing information on the candidates. This has keys
@@ -75,6 +83,14 @@ def get_scores_from_nle_name(request, nle_name:str, candidate_names:str|None=Non
     -u <username>:<password>
     ```
 
+    - For the top 10 candidates
+    ```
+    curl -X 'GET' \
+    'http://localhost:8000/api/score/S251112cm?limit=10' \
+    -H 'accept: */*' \
+    -u <username>:<password>
+    ```
+
     """
     
     # get the event candidates associated with this NLE
@@ -88,7 +104,7 @@ def get_scores_from_nle_name(request, nle_name:str, candidate_names:str|None=Non
     if candidate_names is not None:
         ecs = ecs.filter(target__name__in = candidate_names.split(","))
         
-    return _compute_scores(ecs) 
+    return _compute_scores(ecs, limit=limit, offset=offset)
 
 @router.get("/{nle_name}/cone_search")
 def get_scores_from_cone_search(request, nle_name:str, ra:float, dec:float, radius:float=2):
@@ -5,6 +5,12 @@ class CustomCodeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "scoring"
 
+    def ready(self):
+        from . import (
+            light_curve,  # noqa: F401 connects the light curve cache signals
+            snapshots,  # noqa: F401 connects the score snapshot signals
+        )
+
     def target_detail_buttons(self):
         return [
             {
@@ -2,8 +2,11 @@
 Some config variables for vetting that are used in multiple places
 """
 from .vet_basic import vet_basic
+from .vet_bns import PARAM_RANGES as BNS_PARAM_RANGES
 from .vet_bns import vet_bns
+from .vet_kn_in_sn import PARAM_RANGES as KN_IN_SN_PARAM_RANGES
 from .vet_kn_in_sn import vet_kn_in_sn
+from .vet_super_kn import PARAM_RANGES as SUPER_KN_PARAM_RANGES
 from .vet_super_kn import vet_super_kn
 
 VETTING_FORM_CHOICES = { # these tuples are (value to save, value to show)
@@ -52,6 +55,12 @@ FORM_CHOICE_FUNC_MAP = { # this should have the same keys as the first value in
     # "AGN-flare":???,
 }
 
+FORM_CHOICE_PARAM_RANGES = { # default param_ranges of the transient vetting functions in FORM_CHOICE_FUNC_MAP
+    "KN":BNS_PARAM_RANGES,
+    "KN-in-SN":KN_IN_SN_PARAM_RANGES,
+    "super-KN":SUPER_KN_PARAM_RANGES,
+}
+
 
 DETECTION_HORIZON_DEFAULTS = { # time horizon (min, max) for first detections, dependent on NLE
     "": (0, 10), # if NLE most likely class not known, 0, 10
@@ -0,0 +1,61 @@
+"""
+Fast redshift <-> luminosity distance conversions for settings.COSMO.
+
+The astropy cosmology integrates the distance for every redshift it is given
+and wraps the result in a Quantity. Scoring converts redshifts of targets and
+host galaxies constantly, so the conversions here interpolate dense tables of
+log luminosity distance against log redshift, built once per process, and take
+and return plain floats / arrays in Mpc. Values outside the tables (negative,
+non-finite or very high redshifts) fall back to astropy, so they behave
+exactly as before.
+"""
+
+import functools
+
+import numpy as np
+from astropy import units as u
+from astropy.cosmology import z_at_value
+from django.conf import settings
+from scipy.interpolate import CubicSpline
+
+# redshift range and number of points of the interpolation tables
+Z_MIN = 1e-8
+Z_MAX = 20.
+N_GRID = 4000
+
+
+@functools.lru_cache(maxsize=None)
+def _tables():
+    """Splines of log luminosity distance as a function of log redshift, and the inverse"""
+    log_z = np.linspace(np.log(Z_MIN), np.log(Z_MAX), N_GRID)
+    log_d = np.log(settings.COSMO.luminosity_distance(np.exp(log_z)).to_value(u.Mpc))
+    return CubicSpline(log_z, log_d), CubicSpline(log_d, log_z)
+
+
+def luminosity_distance(z):
+    """Luminosity distance in Mpc of redshift(s) `z` (same shape as `z`)"""
+    z = np.asarray(z, dtype=float)
+    flat = np.atleast_1d(z).ravel()
+    d_of_z, _ = _tables()
+    in_table = (flat >= Z_MIN) & (flat <= Z_MAX)
+    dist = np.empty_like(flat)
+    dist[in_table] = np.exp(d_of_z(np.log(flat[in_table])))
+    if not in_table.all():
+        dist[~in_table] = settings.COSMO.luminosity_distance(flat[~in_table]).to_value(u.Mpc)
+    return dist.reshape(z.shape) if z.ndim else float(dist[0])
+
+
+def redshift_at_distance(dist):
+    """Redshift(s) at luminosity distance(s) `dist` in Mpc (same shape as `dist`)"""
+    dist = np.asarray(dist, dtype=float)
+    flat = np.atleast_1d(dist).ravel()
+    _, z_of_d = _tables()
+    in_table = (flat >= np.exp(z_of_d.x[0])) & (flat <= np.exp(z_of_d.x[-1]))
+    z = np.full_like(flat, np.nan)
+    z[in_table] = np.exp(z_of_d(np.log(flat[in_table])))
+    # D_L is proportional to z below the tables
+    below = (flat >= 0) & (flat < np.exp(z_of_d.x[0]))
+    z[below] = flat[below] * Z_MIN / np.exp(z_of_d.x[0])
+    for i in np.nonzero(flat > np.exp(z_of_d.x[-1]))[0]:
+        z[i] = z_at_value(settings.COSMO.luminosity_distance, flat[i] * u.Mpc).value
+    return z.reshape(dist.shape) if dist.ndim else float(z[0])
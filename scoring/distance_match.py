@@ -0,0 +1,106 @@
+"""
+Closed-form distance overlap between a nonlocalized event and potential hosts.
+
+The Bhattacharyya coefficient of two (piecewise) Gaussian distance
+distributions is the integral of the square root of their product, which on
+each side of the host mean is itself a Gaussian. It can therefore be written
+with error functions for any number of hosts at once, instead of evaluating
+both PDFs on a dense distance grid for every host.
+"""
+
+import numpy as np
+from scipy.special import erf
+
+SQRT2 = np.sqrt(2.)
+
+
+def _gaussian_integral(mean, std, lower, upper):
+    """Integral of exp(-(x - mean)^2 / (2 std^2)) from lower to upper (0 if upper <= lower)"""
+    upper = np.maximum(upper, lower)
+    return std * np.sqrt(np.pi / 2) * (erf((upper - mean) / (SQRT2 * std)) - erf((lower - mean) / (SQRT2 * std)))
+
+
+def asymmetric_gaussian_norm(mean, unc_minus, unc_plus, lower, upper):
+    """
+    Integral of the unnormalized asymmetric Gaussian (a Gaussian of width
+    `unc_minus` below `mean` and `unc_plus` above it) from `lower` to `upper`.
+    This is the analytic version of the normalization of
+    ``scoring.scoring.AsymmetricGaussian``.
+    """
+    return (
+        _gaussian_integral(mean, unc_minus, lower, np.minimum(mean, upper))
+        + _gaussian_integral(mean, unc_plus, np.maximum(mean, lower), upper)
+    )
+
+
+def _sqrt_product_integral(mean1, std1, mean2, std2, lower, upper):
+    """
+    Integral of sqrt(exp(-(x - mean1)^2 / (2 std1^2)) * exp(-(x - mean2)^2 / (2 std2^2)))
+    from lower to upper. The integrand is a Gaussian of precision (1/std1^2 + 1/std2^2) / 2
+    centered on the precision-weighted mean, scaled by the mismatch of the two means.
+    """
+    prec1, prec2 = std1 ** -2., std2 ** -2.
+    mean = (mean1 * prec1 + mean2 * prec2) / (prec1 + prec2)
+    std = np.sqrt(2. / (prec1 + prec2))
+    scale = np.exp(-(mean1 - mean2) ** 2 / (4. * (std1 ** 2 + std2 ** 2)))
+    return scale * _gaussian_integral(mean, std, lower, upper)
+
+
+def bhattacharyya_coefficients(
+    nle_mean,
+    nle_std,
+    host_mean,
+    host_unc_minus,
+    host_unc_plus,
+    lower,
+    upper,
+    host_norm_range=None,
+):
+    """
+    Bhattacharyya coefficient between the Gaussian distance distribution of a
+    nonlocalized event and the asymmetric Gaussian distance distribution of
+    each host, integrated from `lower` to `upper`.
+
+    Parameters
+    ----------
+    nle_mean, nle_std : float or np.ndarray
+        Mean and standard deviation of the nonlocalized event distance
+    host_mean, host_unc_minus, host_unc_plus : np.ndarray
+        Distance of each host and its lower and upper uncertainties
+    lower, upper : float
+        Distance range of the integral
+    host_norm_range : tuple, optional
+        Range over which the host distributions are normalized; by default
+        over all distances, i.e. a plain Gaussian normalization
+
+    Returns
+    -------
+    np.ndarray
+        Coefficient for each host; NaN where the event distance or the host
+        distance and uncertainties are not positive (or not finite)
+    """
+    nle_mean, nle_std = np.asarray(nle_mean, dtype=float), np.asarray(nle_std, dtype=float)
+    host_mean = np.asarray(host_mean, dtype=float)
+    host_unc_minus = np.asarray(host_unc_minus, dtype=float)
+    host_unc_plus = np.asarray(host_unc_plus, dtype=float)
+
+    valid = (nle_std > 0) & (host_mean > 0) & (host_unc_minus > 0) & (host_unc_plus > 0)
+    # keep invalid rows finite while computing, they are masked at the end
+    nle_std = np.where(valid, nle_std, 1.)
+    host_unc_minus = np.where(valid, host_unc_minus, 1.)
+    host_unc_plus = np.where(valid, host_unc_plus, 1.)
+
+    if host_norm_range is None:
+        host_norm = np.sqrt(np.pi / 2) * (host_unc_minus + host_unc_plus)
+    else:
+        host_norm = asymmetric_gaussian_norm(host_mean, host_unc_minus, host_unc_plus, *host_norm_range)
+    nle_norm = np.sqrt(2 * np.pi) * nle_std
+
+    # split the integral at the host mean, where the host distribution changes width
+    overlap = (
+        _sqrt_product_integral(host_mean, host_unc_minus, nle_mean, nle_std, lower, np.minimum(host_mean, upper))
+        + _sqrt_product_integral(host_mean, host_unc_plus, nle_mean, nle_std, np.maximum(host_mean, lower), upper)
+    )
+    with np.errstate(invalid='ignore', divide='ignore'):
+        coefficients = overlap / np.sqrt(host_norm * nle_norm)
+    return np.where(valid, coefficients, np.nan)
@@ -2,14 +2,11 @@
 Dynamic catalogs
 """
 
-from astropy import units as u
-
-from django.conf import settings
-
-cosmo = settings.COSMO
+from candidate_vetting.public_catalogs.catalog import StaticCatalog
 
+from .cosmology import luminosity_distance
 from .models import UserGalaxyQ3C
-from candidate_vetting.public_catalogs.catalog import StaticCatalog
+
 
 class UserGalaxy(StaticCatalog):
     name = "user-submitted"
@@ -37,10 +34,10 @@ class UserGalaxy(StaticCatalog):
 
     def to_standardized_catalog(self, df):
         df = self._standardize_df(df)
-        df["lumdist"] = cosmo.luminosity_distance(df.z).to(u.Mpc).value
-        df["lumdist_err"] = cosmo.luminosity_distance(df.z_err).to(u.Mpc).value
-        df["lumdist_neg_err"] = cosmo.luminosity_distance(df.z_neg_err).to(u.Mpc).value
-        df["lumdist_pos_err"] = cosmo.luminosity_distance(df.z_pos_err).to(u.Mpc).value
+        df["lumdist"] = luminosity_distance(df.z)
+        df["lumdist_err"] = luminosity_distance(df.z_err)
+        df["lumdist_neg_err"] = luminosity_distance(df.z_neg_err)
+        df["lumdist_pos_err"] = luminosity_distance(df.z_pos_err)
         df["z_type"] = "user spec-z"
         return df
 
@@ -0,0 +1,81 @@
+"""
+Read the potential host galaxies of a target.
+
+Host association stores the host list of a target as a JSON string in its
+"Host Galaxies" TargetExtra, which the scoring code, the target page and the
+GCN report all need, often several times per request. The parsed list and
+its DataFrame are cached per process, keyed on a digest of the stored JSON,
+so each version of a host list is only parsed once; callers get copies they
+are free to modify.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+
+import pandas as pd
+from tom_targets.models import TargetExtra
+
+HOST_GALAXIES_KEY = "Host Galaxies"
+
+# number of parsed host lists kept in memory
+HOST_GALAXIES_CACHE_SIZE = 1024
+
+_parsed_host_galaxies = OrderedDict()
+
+
+class _ParsedHostGalaxies:
+    def __init__(self, value):
+        records = json.loads(value)
+        # a single host may be stored on its own
+        self.records = records if isinstance(records, list) else [records]
+        self._df = None
+
+    @property
+    def df(self):
+        if self._df is None:
+            self._df = pd.DataFrame.from_records(self.records)
+        return self._df
+
+
+def _parse(value):
+    key = hashlib.blake2b(value.encode(), digest_size=16).digest()
+    if key in _parsed_host_galaxies:
+        _parsed_host_galaxies.move_to_end(key)
+        return _parsed_host_galaxies[key]
+
+    parsed = _ParsedHostGalaxies(value)
+    _parsed_host_galaxies[key] = parsed
+    if len(_parsed_host_galaxies) > HOST_GALAXIES_CACHE_SIZE:
+        _parsed_host_galaxies.popitem(last=False)
+    return parsed
+
+
+def _host_galaxies_value(target_id):
+    return (
+        TargetExtra.objects.filter(target_id=target_id, key=HOST_GALAXIES_KEY)
+        .values_list("value", flat=True)
+        .first()
+    )
+
+
+def get_host_galaxy_records(target_id):
+    """
+    The potential hosts of target_id as a list of dictionaries, most likely
+    first, or None if host association has not stored any
+    """
+    value = _host_galaxies_value(target_id)
+    if value is None:
+        return None
+    return [dict(record) for record in _parse(value).records]
+
+
+def get_host_galaxies(target_id):
+    """
+    The potential hosts of target_id as a DataFrame with one row per host,
+    most likely first, or None if host association has not stored any
+    """
+    value = _host_galaxies_value(target_id)
+    if value is None:
+        return None
+    return _parse(value).df.copy()
@@ -0,0 +1,226 @@
+"""
+Load the photometry of a target as a columnar light curve.
+
+The photometry of a target is stored as one ReducedDatum per point with the
+measurement in a JSON value. Only the JSON keys the scoring needs are pulled
+from the database, and the timestamps are converted to MJD all at once, into
+read-only NumPy columns sorted by MJD. Anything slicing the light curve by
+time can then take views instead of copies.
+
+Rebuilding the light curve of a target with years of forced photometry is
+still slow, so get_light_curve keeps a copy of it per target in
+TargetLightCurve. The copy is checked against the photometry ReducedDatums of
+the target with one aggregate query: new points are read and appended, and
+the light curve is rebuilt if any point it was built from has been deleted or
+changed. The stored copy is refreshed where photometry is ingested; readers
+such as the target page only bring it up to date in memory.
+"""
+
+import io
+import logging
+
+import numpy as np
+import pandas as pd
+from django.db.models import BooleanField, Count, ExpressionWrapper, Max, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from tom_dataproducts.models import ReducedDatum
+
+from .models import TargetLightCurve
+
+logger = logging.getLogger(__name__)
+
+MJD_EPOCH = pd.Timestamp("1858-11-17", tz="UTC")
+
+# ReducedDatum fields the light curve is built from
+LIGHT_CURVE_FIELDS = {"target", "data_type", "timestamp", "source_name", "value"}
+
+
+class LightCurve:
+    """
+    The photometry of a target as read-only columns sorted by MJD:
+    telescope, mjd, mag, magerr, upperlimit and filter. Upper limits have the
+    limit as mag and a NaN magerr. Detections without an error have a magerr of
+    0, and those with a null error (or magnitude) a NaN one.
+    """
+
+    COLUMNS = ("telescope", "mjd", "mag", "magerr", "upperlimit", "filter")
+
+    def __init__(self, telescope, mjd, mag, magerr, upperlimit, filter):
+        order = np.argsort(np.asarray(mjd, dtype=float), kind="stable")
+        self.telescope = np.asarray(telescope, dtype=object)[order]
+        self.mjd = np.asarray(mjd, dtype=float)[order]
+        self.mag = np.asarray(mag, dtype=float)[order]
+        self.magerr = np.asarray(magerr, dtype=float)[order]
+        self.upperlimit = np.asarray(upperlimit, dtype=bool)[order]
+        self.filter = np.asarray(filter, dtype=object)[order]
+        for column in self.COLUMNS:
+            getattr(self, column).flags.writeable = False
+
+    def __len__(self):
+        return len(self.mjd)
+
+    def to_frame(self) -> pd.DataFrame:
+        """The light curve as a DataFrame on top of the (read-only) columns"""
+        return pd.DataFrame(
+            {column: getattr(self, column) for column in self.COLUMNS}, copy=False
+        )
+
+    def timestamps(self) -> pd.DatetimeIndex:
+        """The UTC times of the points"""
+        return MJD_EPOCH + pd.to_timedelta(self.mjd, unit="D")
+
+    def append(self, other: "LightCurve") -> "LightCurve":
+        """A new light curve with the points of both"""
+        return LightCurve(
+            **{
+                column: np.concatenate([getattr(self, column), getattr(other, column)])
+                for column in self.COLUMNS
+            }
+        )
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            **{
+                column: getattr(self, column).astype(str)
+                if column in ("telescope", "filter")
+                else getattr(self, column)
+                for column in self.COLUMNS
+            },
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data) -> "LightCurve":
+        with np.load(io.BytesIO(bytes(data)), allow_pickle=False) as arrays:
+            return cls(**{column: arrays[column] for column in cls.COLUMNS})
+
+
+def timestamps_to_mjd(timestamps) -> np.ndarray:
+    """MJD of each of the datetimes in timestamps, naive ones taken as UTC"""
+    if not len(timestamps):
+        return np.empty(0)
+    elapsed = pd.to_datetime(list(timestamps), utc=True) - MJD_EPOCH
+    return np.asarray(elapsed / pd.Timedelta(days=1), dtype=float)
+
+
+def load_light_curve(target_id: int, after_id: int = None, last_id: int = None) -> LightCurve:
+    """
+    The light curve of target_id, from its photometry ReducedDatums with a
+    filter and either a magnitude or a limit (only those with an id in
+    (after_id, last_id], if given), read from the database
+    """
+    rows = ReducedDatum.objects.filter(
+        target_id=target_id,
+        data_type="photometry",
+        value__has_key="filter",
+    ).filter(value__has_any_keys=["magnitude", "limit"])
+    if after_id is not None:
+        rows = rows.filter(id__gt=after_id)
+    if last_id is not None:
+        rows = rows.filter(id__lte=last_id)
+    rows = list(
+        rows.annotate(
+            has_magnitude=ExpressionWrapper(Q(value__has_key="magnitude"), output_field=BooleanField()),
+            has_error=ExpressionWrapper(Q(value__has_key="error"), output_field=BooleanField()),
+        ).values_list(
+            "timestamp",
+            "source_name",
+            "value__filter",
+            "value__magnitude",
+            "value__error",
+            "value__limit",
+            "has_magnitude",
+            "has_error",
+        )
+    )
+    return _light_curve_from_rows(rows)
+
+
+def _light_curve_from_rows(rows) -> LightCurve:
+    # points with a magnitude key are detections, even if they also have a
+    # limit or the magnitude is null
+    timestamp, telescope, filt, magnitude, error, limit, has_magnitude, has_error = (
+        zip(*rows) if rows else ((),) * 8
+    )
+    magnitude = pd.to_numeric(pd.Series(magnitude, dtype=object), errors="coerce")
+    error = pd.to_numeric(pd.Series(error, dtype=object), errors="coerce")
+    limit = pd.to_numeric(pd.Series(limit, dtype=object), errors="coerce")
+    upperlimit = ~np.asarray(has_magnitude, dtype=bool)
+
+    return LightCurve(
+        telescope=telescope,
+        mjd=timestamps_to_mjd(timestamp),
+        mag=np.where(upperlimit, limit, magnitude),
+        magerr=np.where(upperlimit, np.nan, np.where(np.asarray(has_error, dtype=bool), error, 0.)),
+        upperlimit=upperlimit,
+        filter=[str(f) for f in filt],
+    )
+
+
+def get_light_curve(target_id: int, update_cache: bool = True) -> LightCurve:
+    """
+    The light curve of target_id from its cached copy, after bringing the
+    copy up to date with the photometry ReducedDatums of the target. With
+    update_cache=False the database is only read, and a stale copy is
+    updated in memory without being saved.
+    """
+    cached = TargetLightCurve.objects.filter(target_id=target_id).first()
+    datums = ReducedDatum.objects.filter(target_id=target_id, data_type="photometry").aggregate(
+        last_datum_id=Max("id"),
+        n_datums=Count("id"),
+        n_new=Count("id", filter=Q(id__gt=cached.last_datum_id if cached else 0)),
+    )
+    if datums["last_datum_id"] is None:
+        # no photometry (anymore)
+        if cached is not None and update_cache:
+            cached.delete()
+        return LightCurve(*[[]] * len(LightCurve.COLUMNS))
+
+    if (
+        cached is not None
+        and cached.last_datum_id == datums["last_datum_id"]
+        and cached.n_datums == datums["n_datums"]
+    ):
+        return LightCurve.from_bytes(cached.data)
+
+    if cached is not None and cached.n_datums == datums["n_datums"] - datums["n_new"]:
+        # none of the cached points were removed, only add the new ones
+        light_curve = LightCurve.from_bytes(cached.data).append(
+            load_light_curve(
+                target_id, after_id=cached.last_datum_id, last_id=datums["last_datum_id"]
+            )
+        )
+    else:
+        light_curve = load_light_curve(target_id, last_id=datums["last_datum_id"])
+
+    if not update_cache:
+        return light_curve
+    TargetLightCurve.objects.update_or_create(
+        target_id=target_id,
+        defaults=dict(
+            data=light_curve.to_bytes(),
+            last_datum_id=datums["last_datum_id"],
+            n_datums=datums["n_datums"],
+        ),
+    )
+    logger.debug(f"Updated the cached light curve of target {target_id} ({len(light_curve)} points)")
+    return light_curve
+
+
+@receiver(post_save, sender=ReducedDatum)
+def _reduced_datum_saved(sender, instance, created, update_fields=None, **kwargs):
+    # new points are picked up by get_light_curve, changed ones need a rebuild
+    if created or instance.data_type != "photometry":
+        return
+    if update_fields is not None and not LIGHT_CURVE_FIELDS & set(update_fields):
+        return
+    TargetLightCurve.objects.filter(target_id=instance.target_id).delete()
+
+
+@receiver(post_delete, sender=ReducedDatum)
+def _reduced_datum_deleted(sender, instance, **kwargs):
+    if instance.data_type == "photometry":
+        TargetLightCurve.objects.filter(target_id=instance.target_id).delete()
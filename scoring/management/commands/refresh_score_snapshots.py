@@ -0,0 +1,50 @@
+"""
+Recompute the score snapshots (scoring.models.EventCandidateScoreSnapshot) of
+event candidates, e.g. to fill them in for the candidates scored before the
+snapshots existed, or after changing the transient parameter ranges. Candidates
+without a snapshot are scored from their score factors when read, so this is
+never needed for correctness, only for speed.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from tom_nonlocalizedevents.models import EventCandidate
+
+from scoring.snapshots import refresh_score_snapshots
+
+
+class Command(BaseCommand):
+    help = "Recompute the score snapshots of event candidates"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event",
+            help="Only refresh the candidates of this nonlocalized event (e.g. S250818k)",
+            default=None,
+        )
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            help="Only refresh the candidates that do not have snapshots yet",
+        )
+        parser.add_argument(
+            "--batch-size",
+            help="Number of candidates scored per query (default: 1000)",
+            type=int,
+            default=1000,
+        )
+
+    def handle(self, event=None, missing_only=False, batch_size=1000, **kwargs):
+        candidates = EventCandidate.objects.all()
+        if event is not None:
+            candidates = candidates.filter(nonlocalizedevent__event_id=event)
+        if missing_only:
+            candidates = candidates.filter(score_snapshots__isnull=True)
+        event_candidate_ids = list(candidates.values_list("id", flat=True).distinct())
+
+        t0 = time.time()
+        refresh_score_snapshots(event_candidate_ids, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed the score snapshots of {len(event_candidate_ids)} event candidates "
+            f"in {time.time() - t0:.1f} s"
+        ))
@@ -0,0 +1,50 @@
+"""
+Build or update the cached light curves (scoring.models.TargetLightCurve) of
+the targets of the candidates of active nonlocalized events, so vetting and
+plotting them does not have to read their photometry from scratch. The cache
+is updated whenever it is read, so this is never needed for correctness, only
+for speed.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from tom_nonlocalizedevents.models import EventCandidate
+
+from custom_code.hooks import get_active_nonlocalizedevents
+from scoring.light_curve import get_light_curve
+
+
+class Command(BaseCommand):
+    help = "Build or update the cached light curves of the candidates of active nonlocalized events"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--event",
+            help="Warm the candidates of this nonlocalized event (e.g. S250818k) instead of the active ones",
+            default=None,
+        )
+        parser.add_argument(
+            "--lookback-days",
+            help="Events that happened up to this many days ago are active (default: 3)",
+            type=float,
+            default=3.0,
+        )
+
+    def handle(self, event=None, lookback_days=3.0, **kwargs):
+        candidates = EventCandidate.objects.all()
+        if event is not None:
+            candidates = candidates.filter(nonlocalizedevent__event_id=event)
+        else:
+            candidates = candidates.filter(
+                nonlocalizedevent__in=get_active_nonlocalizedevents(lookback_days=lookback_days)
+            )
+        target_ids = list(candidates.values_list("target_id", flat=True).distinct())
+
+        t0 = time.time()
+        n_points = 0
+        for target_id in target_ids:
+            n_points += len(get_light_curve(target_id))
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed the light curves of {len(target_ids)} targets ({n_points} points) "
+            f"in {time.time() - t0:.1f} s"
+        ))
@@ -0,0 +1,83 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FLOAT_KEYS = (
+    "skymap_score",
+    "host_distance_score",
+    "agn_score",
+    "predetection_score",
+    "phot_peak_lum",
+    "phot_peak_time",
+    "phot_decay_rate",
+)
+TEXT_KEYS = ("host_name",)
+BATCH_SIZE = 5000
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def backfill_scores(apps, schema_editor):
+    """Pivot the existing ScoreFactor rows into one EventCandidateScore row per event candidate"""
+    ScoreFactor = apps.get_model("scoring", "ScoreFactor")
+    EventCandidateScore = apps.get_model("scoring", "EventCandidateScore")
+
+    columns = {}
+    score_factors = ScoreFactor.objects.filter(key__in=FLOAT_KEYS + TEXT_KEYS).values_list(
+        "event_candidate_id", "key", "value"
+    )
+    for event_candidate_id, key, value in score_factors.iterator(chunk_size=BATCH_SIZE):
+        columns.setdefault(event_candidate_id, {})[key] = (
+            _to_float(value) if key in FLOAT_KEYS else value[:200]
+        )
+
+    EventCandidateScore.objects.bulk_create(
+        [
+            EventCandidateScore(event_candidate_id=event_candidate_id, **values)
+            for event_candidate_id, values in columns.items()
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_nonlocalizedevents", "0018_alter_eventlocalization_date"),
+        ("scoring", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventCandidateScore",
+            fields=[
+                (
+                    "event_candidate",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="typed_score",
+                        serialize=False,
+                        to="tom_nonlocalizedevents.eventcandidate",
+                    ),
+                ),
+                ("skymap_score", models.FloatField(blank=True, null=True)),
+                ("host_distance_score", models.FloatField(blank=True, null=True)),
+                ("agn_score", models.FloatField(blank=True, null=True)),
+                ("predetection_score", models.FloatField(blank=True, null=True)),
+                ("phot_peak_lum", models.FloatField(blank=True, null=True)),
+                ("phot_peak_time", models.FloatField(blank=True, null=True)),
+                ("phot_decay_rate", models.FloatField(blank=True, null=True)),
+                ("host_name", models.CharField(blank=True, max_length=200, null=True)),
+                ("modified", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_nonlocalizedevents", "0018_alter_eventlocalization_date"),
+        ("scoring", "0002_eventcandidatescore"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EventCandidateScoreSnapshot",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("transient", models.CharField(max_length=20)),
+                ("score", models.FloatField()),
+                ("score_without_agn", models.FloatField()),
+                ("modified", models.DateTimeField(auto_now=True)),
+                (
+                    "event_candidate",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="score_snapshots",
+                        to="tom_nonlocalizedevents.eventcandidate",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("event_candidate", "transient")},
+            },
+        ),
+    ]
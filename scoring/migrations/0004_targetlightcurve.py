@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tom_targets", "0026_alter_basetarget_permissions"),
+        ("scoring", "0003_eventcandidatescoresnapshot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TargetLightCurve",
+            fields=[
+                (
+                    "target",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="cached_light_curve",
+                        serialize=False,
+                        to="tom_targets.basetarget",
+                    ),
+                ),
+                ("data", models.BinaryField()),
+                ("last_datum_id", models.BigIntegerField()),
+                ("n_datums", models.IntegerField()),
+                ("modified", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from tom_nonlocalizedevents.models import EventCandidate
+from tom_targets.models import BaseTarget
 
 
 ## score factors
@@ -12,6 +13,95 @@ class ScoreFactor(models.Model):
     class Meta:
         unique_together = ("event_candidate", "key")
 
+
+## typed copy of the score factors, one row per event candidate
+class EventCandidateScore(models.Model):
+    """
+    The score factors of one event candidate as typed columns, so they can be
+    read, filtered and sorted without casting and pivoting the ScoreFactor
+    key/value rows. Written alongside ScoreFactor by scoring.scoring.ScoreWriter;
+    a NULL column means that score factor is not set.
+    """
+    FLOAT_KEYS = (
+        "skymap_score",
+        "host_distance_score",
+        "agn_score",
+        "predetection_score",
+        "phot_peak_lum",
+        "phot_peak_time",
+        "phot_decay_rate",
+    )
+    TEXT_KEYS = ("host_name",)
+
+    event_candidate = models.OneToOneField(
+        EventCandidate, on_delete=models.CASCADE, primary_key=True, related_name="typed_score"
+    )
+    skymap_score = models.FloatField(null=True, blank=True)
+    host_distance_score = models.FloatField(null=True, blank=True)
+    agn_score = models.FloatField(null=True, blank=True)
+    predetection_score = models.FloatField(null=True, blank=True)
+    phot_peak_lum = models.FloatField(null=True, blank=True)
+    phot_peak_time = models.FloatField(null=True, blank=True)
+    phot_decay_rate = models.FloatField(null=True, blank=True)
+    host_name = models.CharField(max_length=200, null=True, blank=True)
+    modified = models.DateTimeField(auto_now=True)
+
+
+## final scores of each event candidate, per transient
+class EventCandidateScoreSnapshot(models.Model):
+    """
+    The final score of an event candidate as each transient type, with and
+    without the AGN score, as computed by scoring.util.score_expressions. The
+    rows are refreshed by scoring.snapshots whenever the candidate's score
+    factors, or its target's ps_score or mpc_match_name, change.
+    """
+    event_candidate = models.ForeignKey(
+        EventCandidate, on_delete=models.CASCADE, related_name="score_snapshots"
+    )
+    transient = models.CharField(max_length=20)
+    score = models.FloatField()
+    score_without_agn = models.FloatField()
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("event_candidate", "transient")
+
+
+def score_columns(score_factors):
+    """
+    Map score factor keys to EventCandidateScore column values, dropping keys
+    without a column. Values that do not parse as floats are stored as NULL.
+    """
+    columns = {}
+    for key, value in score_factors.items():
+        if key in EventCandidateScore.FLOAT_KEYS:
+            try:
+                columns[key] = None if value is None else float(value)
+            except (TypeError, ValueError):
+                columns[key] = None
+        elif key in EventCandidateScore.TEXT_KEYS:
+            columns[key] = None if value is None else str(value)[:200]
+    return columns
+
+
+## cached photometry of each target
+class TargetLightCurve(models.Model):
+    """
+    The light curve of a target (scoring.light_curve.LightCurve) stored as an
+    npz blob, with the photometry ReducedDatums it was built from: the
+    largest id and the number of them. scoring.light_curve.get_light_curve
+    appends newer ReducedDatums to it, and rebuilds it if any of those it was
+    built from have been deleted.
+    """
+    target = models.OneToOneField(
+        BaseTarget, on_delete=models.CASCADE, primary_key=True, related_name="cached_light_curve"
+    )
+    data = models.BinaryField()
+    last_datum_id = models.BigIntegerField()
+    n_datums = models.IntegerField()
+    modified = models.DateTimeField(auto_now=True)
+
+
 ## catalog of user-provided host galaxies
 class UserGalaxyQ3C(models.Model):
     id = models.AutoField(primary_key=True)
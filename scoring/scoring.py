@@ -1,42 +1,26 @@
-from .models import ScoreFactor
-from .dynamic_catalogs import UserGalaxy
-from .healpix_utils import SaTarget
-
-from candidate_vetting.vet import GALAXY_CATALOGS
-
-import io
+import functools
 import logging
+from datetime import datetime, timedelta, timezone
 
 import numpy as np
 import pandas as pd
-from scipy.stats import norm, rv_continuous
-from scipy.integrate import trapezoid
-
 from astropy.utils.introspection import minversion
+from candidate_vetting.vet import GALAXY_CATALOGS
+from dateutil.parser import parse
+from django.db import transaction
+from scipy.stats import rv_continuous
+from tom_nonlocalizedevents.models import EventLocalization, EventSequence, NonLocalizedEvent
 
-import warnings
-
-import sqlalchemy as sa
-from sqlalchemy.orm import Session
-from tom_nonlocalizedevents.healpix_utils import (
-    sa_engine,
-    SaSkymapTile,
-    # uniq_to_bigintrange,
-    # update_all_credible_region_percents_for_candidates
-)
-
-
-from tom_nonlocalizedevents.models import NonLocalizedEvent, EventLocalization
-from tom_targets.models import TargetExtra
-
-from astropy import units as u
-from astropy.time import Time
-
+from custom_code.healpix_utils import get_localization, get_localization_index, get_target_healpix
 from trove_targets.models import Target
 
-from django.conf import settings
+from .cosmology import luminosity_distance
+from .distance_match import bhattacharyya_coefficients
+from .dynamic_catalogs import UserGalaxy
+from .host_galaxies import get_host_galaxies
+from .models import EventCandidateScore, ScoreFactor, score_columns
+from .snapshots import schedule_score_snapshot_refresh
 
-cosmo = settings.COSMO
 logger = logging.getLogger(__name__)
 
 GALAXY_CATALOG_RANKING = {c.__name__: i for i, c in enumerate([UserGalaxy] + GALAXY_CATALOGS)}
@@ -46,6 +30,16 @@ GALAXY_CATALOG_RANKING = {c.__name__: i for i, c in enumerate([UserGalaxy] + GAL
 D_LIM_LOWER = 1e-5  # 0.00001 Mpc
 D_LIM_UPPER = 1e4  # 10,000 Mpc
 
+# placeholder redshifts the galaxy catalogs use for a missing value
+FILLER_REDSHIFTS = (
+    -99.0,  # LS DR9 North; DELVE DR3
+    -999.0,  # PS1-STRM
+    -9999.0,  # SDSS DR12 photo-z; DELVE DR3
+)
+
+# number of (localization, healpix) GW distances memoized by _distance_at_healpix
+NLE_DISTANCE_CACHE_SIZE = 4096
+
 if minversion(np, "2.0.0"):
     np_trapz_fn = np.trapezoid
 else:
@@ -90,49 +84,97 @@ class AsymmetricGaussian(rv_continuous):
 
 
 def update_score_factor(event_candidate, key, value):
-    ScoreFactor.objects.update_or_create(
-        event_candidate=event_candidate, key=key, defaults=dict(value=value)
-    )
+    with ScoreWriter(event_candidate) as scores:
+        scores.set(key, value)
 
 
 def delete_score_factor(event_candidate, key):
     """This is basically only used since we are updating various scores
     and may want to delete some, rather than update them, in the process"""
-    # first get any score factors that match this event candidate and key
-    matches = ScoreFactor.objects.filter(event_candidate=event_candidate, key=key)
+    with ScoreWriter(event_candidate) as scores:
+        scores.delete(key)
 
-    if matches.count():
-        matches.delete()
 
+class ScoreWriter:
+    """
+    Collects the score factors set and deleted for one event candidate, and
+    writes them on exit as one upsert and one DELETE in a single transaction,
+    instead of a round trip per score factor::
 
-def _get_nle_distance_pdf(
-    lumdist_array: np.ndarray,
-    nonlocalized_event_name: str,
-    target_id,
-    max_time=Time.now(),
-):
-    # find the distance at the healpix
-    dist, dist_err = _distance_at_healpix(
-        nonlocalized_event_name, target_id, max_time=max_time
-    )
+        with ScoreWriter(event_candidate) as scores:
+            scores.set("skymap_score", 0.9)
+            scores.delete("host_name")
 
-    # let user know about hard-coded bounds on luminosity distance array
-    warnings.warn(
-        f"Using hard-coded D_LIM_LOWER = {D_LIM_LOWER} and "
-        + f"D_LIM_UPPER = {D_LIM_UPPER} to construct log-spaced "
-        + "distance array for calculating distance probability "
-        + "distribution functions"
-    )
+    Whatever was collected is also written if the block raises, like the
+    score factors written one at a time before an error.
+
+    The typed columns of the candidate's EventCandidateScore row are updated in
+    the same transaction, so both stores always agree, and its score snapshots
+    are refreshed once the transaction commits.
+    """
 
-    test_pdf = norm.pdf(lumdist_array, loc=dist, scale=dist_err)
-    return test_pdf
+    def __init__(self, event_candidate):
+        self.event_candidate = event_candidate
+        self._values = {}
+        self._deleted = set()
+
+    def set(self, key, value):
+        self._values[key] = value
+        self._deleted.discard(key)
+
+    def delete(self, key):
+        self._values.pop(key, None)
+        self._deleted.add(key)
+
+    def flush(self):
+        with transaction.atomic():
+            if self._deleted:
+                ScoreFactor.objects.filter(
+                    event_candidate=self.event_candidate, key__in=self._deleted
+                ).delete()
+            if self._values:
+                ScoreFactor.objects.bulk_create(
+                    [
+                        ScoreFactor(event_candidate=self.event_candidate, key=key, value=value)
+                        for key, value in self._values.items()
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["event_candidate", "key"],
+                    update_fields=["value"],
+                )
+            columns = score_columns({**dict.fromkeys(self._deleted), **self._values})
+            if columns:
+                EventCandidateScore.objects.bulk_create(
+                    [EventCandidateScore(event_candidate=self.event_candidate, **columns)],
+                    update_conflicts=True,
+                    unique_fields=["event_candidate"],
+                    update_fields=[*columns, "modified"],
+                )
+            schedule_score_snapshot_refresh([self.event_candidate.id])
+        self._values, self._deleted = {}, set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+        return False
+
+
+def drop_filler_redshifts(host_df: pd.DataFrame) -> pd.DataFrame:
+    """Drop the potential hosts without a redshift: NaN or one of the FILLER_REDSHIFTS"""
+    if not len(host_df):
+        return host_df
+    return host_df[~host_df.z.isin(FILLER_REDSHIFTS) & host_df.z.notna()]
 
 
 def host_distance_match(
     host_df: pd.DataFrame,
     target_id: int,
     nonlocalized_event_name: str,
-    max_time: Time = Time.now(),
+    max_time: datetime = None,
+    localization: EventLocalization = None,
+    gw_distance: tuple = None,
 ):
     """
     Compute integrated joint probability (Bhattacharyya coefficient) of
@@ -147,9 +189,14 @@ def host_distance_match(
         ID for target
     nonlocalized_event_name : str
         Name for nonlocalized event
-    max_time : Time, optional
+    max_time : datetime, optional
         Time at which to extract nonlocalized event localization;
-        default is Time.now()
+        default is the most recent localization
+    localization : EventLocalization, optional
+        Localization to use instead of looking it up from the name and max_time
+    gw_distance : tuple, optional
+        GW distance mean and standard deviation at the target, e.g. from
+        distances_at_healpix, instead of looking it up in the localization
 
     Returns
     -------
@@ -164,62 +211,74 @@ def host_distance_match(
         return host_df  # continue to return an empty dataframe here, but with the correct columns
 
     # now crossmatch this distance to the host galaxy dataframe
-    _lumdist = np.linspace(D_LIM_LOWER, D_LIM_UPPER, int(10 * D_LIM_UPPER))
-
-    test_pdf = _get_nle_distance_pdf(
-        _lumdist, nonlocalized_event_name, target_id, max_time=max_time
-    )
-    host_pdfs = np.array(
-        [
-            AsymmetricGaussian().pdf(
-                _lumdist,
-                mean=row.lumdist,
-                unc_minus=row.lumdist_neg_err,
-                unc_plus=row.lumdist_pos_err,
-                integ_a=1e-9,
-                integ_b=_lumdist[-1],
-            )
-            for _, row in host_df.iterrows()
-        ]
-    )
-    joint_prob = host_pdfs * test_pdf
+    if gw_distance is None:
+        gw_distance = _distance_at_healpix(
+            nonlocalized_event_name, target_id, max_time=max_time, localization=localization
+        )
+    dist, dist_err = gw_distance
+    if np.isnan(dist) or np.isnan(dist_err):
+        # the target is outside the stored localization tiles, so there is no overlap to compute
+        host_df["dist_norm_joint_prob"] = np.nan
+        return host_df
 
     # finally, compute the Bhattacharyya coefficient for the overlap of these
     # two distributions. https://en.wikipedia.org/wiki/Bhattacharyya_distance
     # This coefficient is non-parametric which is good for our Asymmetric Gaussian
     # Original paper: http://www.jstor.org/stable/25047806
-    host_df["dist_norm_joint_prob"] = trapezoid(np.sqrt(joint_prob), x=_lumdist, axis=1)
+    # It is evaluated in closed form for all hosts at once, with the host
+    # distributions normalized like AsymmetricGaussian(integ_a=1e-9, integ_b=D_LIM_UPPER)
+    host_df["dist_norm_joint_prob"] = bhattacharyya_coefficients(
+        dist,
+        dist_err,
+        host_df.lumdist.to_numpy(),
+        host_df.lumdist_neg_err.to_numpy(),
+        host_df.lumdist_pos_err.to_numpy(),
+        lower=D_LIM_LOWER,
+        upper=D_LIM_UPPER,
+        host_norm_range=(1e-9, D_LIM_UPPER),
+    )
     return host_df
 
 
-def get_distance_score(host_df, target_id, nonlocalized_event_name):
+def get_distance_score(host_df, target_id, nonlocalized_event_name, localization=None, gw_distance=None):
     """
     This gets the host score from the input host_df by first prioritizing target specific redshifts,
     then spec-z's, and then photo-z's. It assumes that any potential host within a
     Pcc < PCC_THRESHOLD is equally probable. It also uses the maximum probability galaxy
-    to soften the effects of poor distance associations.
+    to soften the effects of poor distance associations. gw_distance, if given, is the GW
+    distance mean and standard deviation at the target. Returns a None score when there
+    is no GW distance at the target (it is outside the stored localization tiles).
     """
     # first check if this target has a measured redshift
     targ = Target.objects.get(id=target_id)
     if targ.redshift is not None and not np.isnan(targ.redshift):
-        _lumdist = np.linspace(D_LIM_LOWER, D_LIM_UPPER, int(10 * D_LIM_UPPER))
-        nle_pdf = _get_nle_distance_pdf(_lumdist, nonlocalized_event_name, target_id)
-        targ_dist = cosmo.luminosity_distance(targ.redshift).to(u.Mpc).value
-        targ_dist_err = cosmo.luminosity_distance(1e-3).to(u.Mpc).value
-        targ_pdf = norm.pdf(_lumdist, loc=targ_dist, scale=targ_dist_err)
-        return trapezoid(
-            np.sqrt(targ_pdf * nle_pdf), x=_lumdist
-        ), None  # None because there is no host name
+        if gw_distance is None:
+            gw_distance = _distance_at_healpix(
+                nonlocalized_event_name, target_id, localization=localization
+            )
+        dist, dist_err = gw_distance
+        if np.isnan(dist) or np.isnan(dist_err):
+            return None, None  # no GW distance at the target, so no score
+        targ_dist = luminosity_distance(targ.redshift)
+        targ_dist_err = luminosity_distance(1e-3)
+        return float(bhattacharyya_coefficients(
+            dist,
+            dist_err,
+            targ_dist,
+            targ_dist_err,
+            targ_dist_err,
+            lower=D_LIM_LOWER,
+            upper=D_LIM_UPPER,
+        )), None  # None because there is no host name
 
     # first, some cleanup
-    # this is already done in vet_bns, vet_kn_in_sn, and vet_super_kn,
+    # this is already done in vet_transients (vet_bns, vet_kn_in_sn, and vet_super_kn),
     # but we need to account for users calling this function for arbitrary
     # host_df, target, and NLE without prior filtering on host_df
-    if len(host_df): ### TODO: these are filler values, should just change them to nulls in our database
-        host_df = host_df[host_df.z != -99.0] # LS DR9 North; DELVE DR3
-        host_df = host_df[host_df.z != -999.0] # PS1-STRM
-        host_df = host_df[host_df.z != -9999.0] # SDSS DR12 photo-z; DELVE DR3
-        host_df = host_df[~np.isnan(host_df.z)]
+    host_df = drop_filler_redshifts(host_df)
+
+    if len(host_df) and host_df.dist_norm_joint_prob.isna().all():
+        return None, None  # no GW distance at the target (see host_distance_match)
 
     # then use the redshift of user-uploaded host galaxies
     userz_distance_hosts = host_df[host_df.z_type == "user spec-z"]
@@ -268,7 +327,7 @@ def get_distance_score(host_df, target_id, nonlocalized_event_name):
 def skymap_association(
     nonlocalized_event_name: str,
     target_id: int,
-    max_time=Time.now(),
+    max_time=None,
     prob: float = 0.95,
 ) -> float:
 
@@ -276,63 +335,82 @@ def skymap_association(
     localization = _localization_from_name(nonlocalized_event_name, max_time=max_time)
     print(f"Localization Used: {localization} ({localization.date}; {max_time})")
 
-    # find the healpix where this target is located
-    target_hpx_subq = (
-        sa.select(SaTarget.healpix)
-        .filter(SaTarget.basetarget_ptr_id == target_id)
-        .lateral()
-    )
+    return skymap_association_batch(localization, [target_id])[target_id]
 
-    # find the probdensity at the tile of the target_id
-    # and for this localization id
-    probdensity_subq = sa.select(
-        sa.func.min(SaSkymapTile.probdensity).label("min_probdensity")
-    ).filter(
-        SaSkymapTile.tile.contains(target_hpx_subq.c.healpix),
-        SaSkymapTile.localization_id == localization.id,
-    )
 
-    # then we can sum from that probability density to the maximum
-    cumprob_query = sa.select(
-        sa.func.sum(SaSkymapTile.probdensity * SaSkymapTile.tile.area)
-    ).filter(
-        SaSkymapTile.probdensity >= probdensity_subq.c.min_probdensity,
-        SaSkymapTile.localization_id == localization.id,
+def skymap_association_batch(localization: EventLocalization, target_ids: list) -> dict:
+    """
+    Skymap association score (1 - cumulative probability at the target position)
+    for many targets at once, from one pass over the in-memory tiles of
+    `localization`. Targets without a healpix index get a score of 0.
+    """
+    index = get_localization_index(localization.id)
+    ids, healpix = get_target_healpix(target_ids)
+    scores = dict.fromkeys(target_ids, 0.0)
+    scores.update(zip(ids.tolist(), (1 - index.cumprob_at(healpix)).tolist()))
+    return scores
+
+
+def skymap_max_time(nonlocalized_event: NonLocalizedEvent, t_post: float) -> datetime:
+    """Time at which to choose the localization when only using data up to
+    `t_post` days after the nonlocalized event (None, i.e. the most recent
+    localization, if infinite)"""
+    if not np.isfinite(t_post):
+        return None
+    gw_disc_date = parse(
+        EventSequence.objects.filter(  # GW discovery time
+            nonlocalizedevent_id=nonlocalized_event.id
+        )
+        .last()
+        .details["time"]
     )
+    if gw_disc_date.tzinfo is None:
+        gw_disc_date = gw_disc_date.replace(tzinfo=timezone.utc)
+    return gw_disc_date + timedelta(days=t_post)
 
-    # finally we can execute this cumprob_query and return 1 - the result
-    with Session(sa_engine) as session:
-        cumprob = session.execute(cumprob_query).fetchall()
 
-    return 1 - cumprob[0][0]
+def skymap_association_for_event(
+    nonlocalized_event_name: str,
+    target_ids: list,
+    t_post: float = np.inf,
+) -> dict:
+    """Batched skymap association against the localization that the vetting
+    functions would use for this nonlocalized event and `t_post`"""
+    nonlocalized_event = NonLocalizedEvent.objects.get(event_id=nonlocalized_event_name)
+    max_time = skymap_max_time(nonlocalized_event, t_post)
+    localization = _localization_from_name(nonlocalized_event_name, max_time=max_time)
+    return skymap_association_batch(localization, target_ids)
 
 
-def get_eventcandidate_default_distance(target_id: int, nonlocalized_event_name: str):
+def get_eventcandidate_default_distance(
+    target_id: int, nonlocalized_event_name: str, localization=None, gw_distance=None
+):
+    """
+    Distance to the candidate: from its redshift, else from its most likely
+    host, else the GW distance at its position (gw_distance if given)
+    """
 
     # first check if this target has a redshift associated with it
     targ = Target.objects.get(id=target_id)
     if targ.redshift is not None and not np.isnan(targ.redshift):
-        targ_dist = cosmo.luminosity_distance(targ.redshift).to(u.Mpc).value
-        targ_dist_err = cosmo.luminosity_distance(1e-3).to(u.Mpc).value
+        targ_dist = luminosity_distance(targ.redshift)
+        targ_dist_err = luminosity_distance(1e-3)
         return targ_dist, targ_dist_err
 
     # then try to get out the host galaxy json file from target extra
-    hosts = TargetExtra.objects.filter(target_id=target_id, key="Host Galaxies")
-    if not hosts.count():
-        return _distance_at_healpix(nonlocalized_event_name, target_id)
-    host_df = pd.read_json(
-        io.StringIO(hosts[0].value)
-    )  # since we store the host info as a json str in the db
+    host_df = get_host_galaxies(target_id)
+    if host_df is None:
+        if gw_distance is not None:
+            return gw_distance
+        return _distance_at_healpix(nonlocalized_event_name, target_id, localization=localization)
 
     # clean up dataframe
-    if len(host_df): ### TODO: these are filler values, should just change them to nulls in our database
-        host_df = host_df[host_df.z != -99.0] # LS DR9 North
-        host_df = host_df[host_df.z != -999.0] # PS1-STRM
-        host_df = host_df[host_df.z != -9999.0] # SDSS DR12 photo-z
-        host_df = host_df[~np.isnan(host_df.z)]
+    host_df = drop_filler_redshifts(host_df)
 
     if not len(host_df):
-        return _distance_at_healpix(nonlocalized_event_name, target_id)
+        if gw_distance is not None:
+            return gw_distance
+        return _distance_at_healpix(nonlocalized_event_name, target_id, localization=localization)
 
     # if we've gotten to this point then the target has host galaxies associated with it!
     # first thing we need to do is assign a rank ordering to the various catalogs,
@@ -364,44 +442,45 @@ def get_eventcandidate_default_distance(target_id: int, nonlocalized_event_name:
     return to_ret.Dist, to_ret.DistErr
 
 
-def _distance_at_healpix(nonlocalized_event_name, target_id, max_time=Time.now()):
-    """Computes the GW distance at the target_id healpix location"""
-
-    localization = _localization_from_name(nonlocalized_event_name, max_time=max_time)
-    # find the distance at the healpix
-    query = sa.select(SaSkymapTile.distance_mean, SaSkymapTile.distance_std).filter(
-        SaTarget.basetarget_ptr_id == target_id,
-        SaSkymapTile.localization_id == localization.id,
-        SaSkymapTile.tile.contains(SaTarget.healpix),
-    )
+def distances_at_healpix(localization: EventLocalization, target_ids: list):
+    """
+    GW distance mean and standard deviation at the healpix location of every
+    target in `target_ids`, as arrays in the same order (NaN for targets outside
+    the localization). Reuses the cached tile index of `localization`; a batch
+    of targets vetted together looks their distances up with one call.
+    """
+    index = get_localization_index(localization.id)
+    ids, healpix = get_target_healpix(target_ids)
+    dist, dist_err = index.distances_at(healpix)
 
-    # execute the query
-    with Session(sa_engine) as session:
-        dist, dist_err = session.execute(query).fetchall()[0]
+    # align with the order of target_ids
+    lookup = dict(zip(ids.tolist(), zip(dist.tolist(), dist_err.tolist())))
+    distances = np.array(
+        [lookup.get(tid, (np.nan, np.nan)) for tid in target_ids], dtype=float
+    ).reshape(-1, 2)
+    return distances[:, 0], distances[:, 1]
 
-    return dist, dist_err
 
+def _distance_at_healpix(nonlocalized_event_name, target_id, max_time=None, localization=None):
+    """Computes the GW distance at the target_id healpix location"""
 
-def _localization_from_name(nonlocalized_event_name, max_time=Time.now()):
-    """Find the most recenet LocalizationEvent object from the nonlocalized event name"""
-    # first find the localization to use
-    localization_queryset = NonLocalizedEvent.objects.filter(
-        event_id=nonlocalized_event_name
-    )[0]
+    if localization is None:
+        localization = _localization_from_name(nonlocalized_event_name, max_time=max_time)
+    _, healpix = get_target_healpix([target_id])
+    if not len(healpix):
+        return np.nan, np.nan
+    return _cached_distance_at_healpix(localization.id, int(healpix[0]))
 
-    all_localizations = EventLocalization.objects.filter(
-        nonlocalizedevent_id=localization_queryset.id
-    )
 
-    all_localizations_sorted = sorted(all_localizations, key=lambda x: x.date)
+@functools.lru_cache(maxsize=NLE_DISTANCE_CACHE_SIZE)
+def _cached_distance_at_healpix(localization_id, healpix):
+    """GW distance at a healpix index, memoized per localization (a new localization
+    has a new id, so it never sees distances from an earlier one). Keyed on the
+    healpix rather than the target, so that edited coordinates are picked up"""
+    dist, dist_err = get_localization_index(localization_id).distances_at([healpix])
+    return float(dist[0]), float(dist_err[0])
 
-    # now choose the most recent localization
-    localization = all_localizations_sorted[0]
-    if len(all_localizations_sorted) > 1:
-        for loc in all_localizations_sorted[1:]:
-            curr_loc_time = Time(localization.date, format="datetime")
-            test_loc_time = Time(loc.date, format="datetime")
-            if test_loc_time > curr_loc_time and test_loc_time <= max_time:
-                localization = loc
 
-    return localization
+def _localization_from_name(nonlocalized_event_name, max_time=None):
+    """Find the most recent EventLocalization object from the nonlocalized event name"""
+    return get_localization(nonlocalized_event_name, max_time=max_time)
@@ -0,0 +1,122 @@
+"""
+Keep EventCandidateScoreSnapshot up to date.
+
+The snapshot of an event candidate is recomputed, in the database, whenever
+something its final score depends on changes: its score factors, or the
+ps_score and mpc_match_name TargetExtras of its target. Refreshes requested
+within one transaction are collected and run together once it commits.
+"""
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from tom_nonlocalizedevents.models import EventCandidate
+from tom_targets.models import TargetExtra
+
+from .models import EventCandidateScore, EventCandidateScoreSnapshot, ScoreFactor, score_columns
+
+logger = logging.getLogger(__name__)
+
+# TargetExtra keys that are part of the final score
+SNAPSHOT_TARGETEXTRA_KEYS = ("ps_score", "mpc_match_name")
+
+
+def refresh_score_snapshots(event_candidate_ids, batch_size=1000):
+    """Recompute the score snapshots of the given event candidates, for every transient"""
+    # scoring.util imports the vetting modules, which import this one through scoring.scoring
+    from .util import SCORE_ANNOTATIONS, TRANSIENTS, score_expressions
+
+    with_agn = score_expressions(TRANSIENTS, agn_toggle=True)
+    without_agn = {
+        f"{name}_without_agn": expression
+        for name, expression in score_expressions(TRANSIENTS, agn_toggle=False).items()
+    }
+
+    event_candidate_ids = sorted(set(event_candidate_ids))
+    for i in range(0, len(event_candidate_ids), batch_size):
+        rows = EventCandidate.objects.filter(
+            id__in=event_candidate_ids[i:i + batch_size]
+        ).annotate(**with_agn, **without_agn).values("id", *with_agn, *without_agn)
+        EventCandidateScoreSnapshot.objects.bulk_create(
+            [
+                EventCandidateScoreSnapshot(
+                    event_candidate_id=row["id"],
+                    transient=transient,
+                    score=row[SCORE_ANNOTATIONS[transient]],
+                    score_without_agn=row[f"{SCORE_ANNOTATIONS[transient]}_without_agn"],
+                )
+                for row in rows
+                for transient in TRANSIENTS
+            ],
+            update_conflicts=True,
+            unique_fields=["event_candidate", "transient"],
+            update_fields=["score", "score_without_agn", "modified"],
+        )
+    logger.debug(f"Refreshed the score snapshots of {len(event_candidate_ids)} event candidates")
+
+
+# event candidates whose snapshots are refreshed when the current transaction
+# of this thread commits, None when no refresh is queued
+_pending = threading.local()
+
+
+def _refresh_pending_score_snapshots():
+    event_candidate_ids, _pending.event_candidate_ids = _pending.event_candidate_ids, None
+    refresh_score_snapshots(event_candidate_ids)
+
+
+def schedule_score_snapshot_refresh(event_candidate_ids):
+    """Refresh the score snapshots of the given event candidates once the
+    current transaction commits (right away outside of a transaction). All the
+    refreshes requested within a transaction are run together."""
+    event_candidate_ids = set(event_candidate_ids)
+    if not event_candidate_ids:
+        return
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        refresh_score_snapshots(event_candidate_ids)
+        return
+
+    pending = getattr(_pending, "event_candidate_ids", None)
+    # a rollback drops the queued refresh, but not the set it would have refreshed
+    if pending is None or not any(
+        func is _refresh_pending_score_snapshots for _, func, _ in connection.run_on_commit
+    ):
+        pending = _pending.event_candidate_ids = set()
+        transaction.on_commit(_refresh_pending_score_snapshots)
+    # ids added in a savepoint that is rolled back are refreshed anyway,
+    # which only costs a little extra work
+    pending |= event_candidate_ids
+
+
+@receiver(post_save, sender=EventCandidate)
+def _event_candidate_saved(sender, instance, created, **kwargs):
+    if created:
+        schedule_score_snapshot_refresh([instance.id])
+
+
+# scoring.scoring.ScoreWriter upserts its score factors without signals and
+# refreshes the typed columns and snapshots itself; this covers score factors
+# saved one by one. Nothing listens to ScoreFactor deletes, so they stay a
+# single DELETE query (ScoreWriter clears the typed columns itself, and they
+# go away with the candidate on a cascade)
+@receiver(post_save, sender=ScoreFactor)
+def _score_factor_saved(sender, instance, **kwargs):
+    columns = score_columns({instance.key: instance.value})
+    if columns:
+        EventCandidateScore.objects.update_or_create(
+            event_candidate_id=instance.event_candidate_id, defaults=columns
+        )
+    schedule_score_snapshot_refresh([instance.event_candidate_id])
+
+
+@receiver(post_save, sender=TargetExtra)
+@receiver(post_delete, sender=TargetExtra)
+def _target_extra_changed(sender, instance, **kwargs):
+    if instance.key in SNAPSHOT_TARGETEXTRA_KEYS:
+        schedule_score_snapshot_refresh(
+            EventCandidate.objects.filter(target_id=instance.target_id).values_list("id", flat=True)
+        )
@@ -5,30 +5,35 @@ Asynchronous tasks for (1) querying public services that takes a long time,
 
 import logging
 from datetime import datetime, timedelta
-import numpy as np
-
-from django_tasks import task
-from django.conf import settings
 
+import numpy as np
 from candidate_vetting.public_catalogs.phot_catalogs import ATLAS_Forced_Phot
 from candidate_vetting.vet import run_mpc
+from django.conf import settings
+from django_tasks import task
+from tom_nonlocalizedevents.models import NonLocalizedEvent
 
 from custom_code.healpix_utils import (
-    get_target_ids_in_prob_credible_region,
     create_candidates_from_targets,
-    )
+    get_target_ids_in_prob_credible_region,
+)
 from trove_targets.models import Target
 
-from tom_nonlocalizedevents.models import NonLocalizedEvent
+from .light_curve import get_light_curve
 
 logger = logging.getLogger(__name__)
 
+# number of targets vetted per async_vet task, sharing one skymap pass
+VET_BATCH_SIZE = 100
+
 
 ## tasks
 @task(queue_name="atlas_fphot", priority=settings.PRIORITY_MID)
 def async_atlas_query(target_id: int, *args, **kwargs) -> None:
     t = Target.objects.get(id=target_id)
     ATLAS_Forced_Phot("atlas").query(t, token=settings.ATLAS_API_KEY, *args, **kwargs)
+    # add the new points to the cached light curve
+    get_light_curve(target_id)
 
 
 @task(queue_name="mpc", priority=settings.PRIORITY_MID)
@@ -45,14 +50,27 @@ def async_vet(
 ) -> None:
     from .config import (
         FORM_CHOICE_FUNC_MAP,
+        FORM_CHOICE_PARAM_RANGES,
     )  # import within function to avoid circular import error
+    from .scoring import _localization_from_name, distances_at_healpix, skymap_association_for_event
     if vetting_mode == "basic":
         for ti in target_ids:
             FORM_CHOICE_FUNC_MAP[vetting_mode](target_id=ti)
     else:
-        for ti in target_ids:
+        # one pass over the skymap for every target in this batch
+        skymap_scores = skymap_association_for_event(
+            nle_event_id,
+            target_ids,
+            t_post=FORM_CHOICE_PARAM_RANGES[vetting_mode]["t_post"],
+        )
+        # and one lookup of the GW distance at every target, in the latest localization
+        dist, dist_err = distances_at_healpix(_localization_from_name(nle_event_id), target_ids)
+        for ti, gw_distance in zip(target_ids, zip(dist.tolist(), dist_err.tolist())):
             FORM_CHOICE_FUNC_MAP[vetting_mode](
-                target_id=ti, nonlocalized_event_name=nle_event_id
+                target_id=ti,
+                nonlocalized_event_name=nle_event_id,
+                skymap_score=skymap_scores[ti],
+                gw_distance=gw_distance,
             )
 
 @task(queue_name="associate_targets", priority=settings.PRIORITY_HIGH)
@@ -121,14 +139,15 @@ def async_associate_targets_nle(
     
     
 ## functions which enqueue tasks
-def vet_all_async(eventcandidates, nle, vetting_mode) -> None:
+def vet_all_async(eventcandidates, nle, vetting_mode, batch_size=VET_BATCH_SIZE) -> None:
     """
     Asychronously vet according to vetting mode, wraps async_vet for a list of
-    eventcandidates
+    eventcandidates, `batch_size` targets per task
     """
-    for ec in eventcandidates:
+    target_ids = [ec.target_id for ec in eventcandidates]
+    for i in range(0, len(target_ids), batch_size):
         async_vet.enqueue(
-            target_ids=[ec.target_id],
+            target_ids=target_ids[i:i + batch_size],
             nle_event_id=nle.event_id,
             vetting_mode=vetting_mode,
         )
@@ -154,12 +173,10 @@ def associate_targets_with_nle_async(
     logger.info("Getting targets in the "+
                 f"{settings.SKYMAP_PROB_CONTOUR*100:.0f}% localization "+
                 f"region of {nle.event_id}")
-    tids = get_target_ids_in_prob_credible_region(
+    tids_ls = get_target_ids_in_prob_credible_region(
         seq,
         prob=settings.SKYMAP_PROB_CONTOUR,
         tdelta=first_det_tmin)
-    tids_ls = list(tids)
-    tids_ls = [tid[0] for tid in tids_ls]
     targets = Target.objects.filter(id__in=tids_ls,
                                     created__gte=nle_time+timedelta(first_det_tmin)).order_by("name")
     logger.info(f"Found {len(targets)} targets")
@@ -2,31 +2,38 @@
 Some common functions used in multiple places throughout the app
 """
 
-from collections import OrderedDict
-import math
 import logging
+import math
+from collections import OrderedDict
+
 from astropy.units import Quantity
-from django.db.models import FloatField
-from django.db.models.functions import Cast
+from candidate_vetting.vet import localization_sequence_from_name
+from django.db.models import (
+    Case,
+    ExpressionWrapper,
+    FloatField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce
 from tom_nonlocalizedevents.models import (
     EventCandidate,
     EventLocalization,
     NonLocalizedEvent,
 )
-from trove_targets.models import Target
 from tom_targets.models import TargetExtra
 
 from custom_code.templatetags.nonlocalizedevent_extras import get_most_likely_class
+from trove_targets.models import Target
 
-from candidate_vetting.vet import localization_sequence_from_name
-
-from .vet_phot import PHOT_SCORE_MIN
+from .models import EventCandidateScore, EventCandidateScoreSnapshot
 from .vet_bns import PARAM_RANGES as KN_PARAM_RANGES
 from .vet_kn_in_sn import PARAM_RANGES as KN_IN_SN_PARAM_RANGES
+from .vet_phot import PHOT_SCORE_MIN
 from .vet_super_kn import PARAM_RANGES as SUPER_KN_PARAM_RANGES
-from .models import ScoreFactor
-
-import time
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +44,12 @@ DICT_TRANSIENTS_PARAM_RANGES = {
     "KN-in-SN": KN_IN_SN_PARAM_RANGES,
     "super-KN": SUPER_KN_PARAM_RANGES,
 }
+# name of the queryset annotation holding the score of each transient
+SCORE_ANNOTATIONS = {
+    "KN": "kn_score",
+    "KN-in-SN": "kn_in_sn_score",
+    "super-KN": "super_kn_score",
+}
 
 
 # default subscore names
@@ -75,141 +88,214 @@ MPC_KEYS = [
 ]
 
 
-def _check_phot_val(val, param_ranges, param_range_key):
-    val_max = max(param_ranges[param_range_key])
+def get_typed_scores(event_candidates, keys=SUBSCORE_NAMES):
+    """Get the score factors in `keys` of each event candidate from the typed
+    score table, as {event candidate id: {key: value}} without the unset ones
+
+    event_candidates can be a django queryset of EventCandidate objects, or a
+    list of EventCandidate objects or ids
+    """
+    columns = [
+        key for key in keys
+        if key in EventCandidateScore.FLOAT_KEYS or key in EventCandidateScore.TEXT_KEYS
+    ]
+    rows = EventCandidateScore.objects.filter(
+        event_candidate__in=event_candidates
+    ).values_list("event_candidate_id", *columns)
+    return {
+        row[0]: {key: value for key, value in zip(columns, row[1:]) if value is not None}
+        for row in rows
+    }
+
+
+def _param_range(param_ranges, param_range_key):
+    """(min, max) of a parameter range as plain floats"""
     val_min = min(param_ranges[param_range_key])
+    val_max = max(param_ranges[param_range_key])
     if isinstance(val_min, Quantity):
         val_min = val_min.value
     if isinstance(val_max, Quantity):
         val_max = val_max.value
+    return float(val_min), float(val_max)
+
+
+def _check_phot_val_expression(subscore_key, param_ranges, param_range_key):
+    """SQL version of _check_phot_val for the typed score column subscore_key;
+    unset (NULL) values pass the check, like missing score factors do"""
+    val_min, val_max = _param_range(param_ranges, param_range_key)
+    out_of_range = Q()
+    if math.isfinite(val_min):
+        out_of_range |= Q(**{f"typed_score__{subscore_key}__lt": val_min})
+    if math.isfinite(val_max):
+        out_of_range |= Q(**{f"typed_score__{subscore_key}__gt": val_max})
+    if not out_of_range:
+        return Value(1.0)
+    return Case(
+        When(out_of_range, then=Value(PHOT_SCORE_MIN)),
+        default=Value(1.0),
+        output_field=FloatField(),
+    )
+
+
+def _product(expressions):
+    product = Value(1.0, output_field=FloatField())
+    for expression in expressions:
+        product = ExpressionWrapper(product * expression, output_field=FloatField())
+    return product
+
+
+def get_candidate_transients(event_candidates):
+    """The transient types to score a queryset of EventCandidate objects as,
+    from the nonlocalized event of the first one; None if there are none"""
+    first = event_candidates.select_related("nonlocalizedevent").first()
+    if first is None:
+        return None
 
-    if val < val_min or val > val_max:
-        # multiply photometry score by PHOT_SCORE_MIN
-        return PHOT_SCORE_MIN
-    return 1
+    ### TODO: Right now, just does KN unless SSM; change this for BBH events
+    nle_eventseq = localization_sequence_from_name(first.nonlocalizedevent.event_id)
+    if get_most_likely_class(nle_eventseq.details) == "SSM":
+        return TRANSIENTS
+    return ["KN"]
 
 
-def get_event_candidate_scores(
-    event_candidates,
+def score_expressions(
+    transients=TRANSIENTS,
     dict_transients_param_ranges=DICT_TRANSIENTS_PARAM_RANGES,
     subscore_names=SUBSCORE_NAMES,
-    agn_toggle=True
+    agn_toggle=True,
 ):
-    """Get the event candidate scores for everything in subscore_names
-
-    event_candidates should be a django queryset of EventCandidate objects
+    """Query expressions computing the score of each transient in transients
+    for an EventCandidate queryset, from the typed score columns and the
+    ps_score and mpc_match_name TargetExtras, keyed on the names in
+    SCORE_ANNOTATIONS
     """
-
-    val_not_score_keys = VAL_NOT_SCORE_KEYS
-    exclude_keys = set(val_not_score_keys.keys()) | set(TARGETEXTRA_KEYS)
-    
+    exclude_keys = set(VAL_NOT_SCORE_KEYS) | set(TARGETEXTRA_KEYS)
     if not agn_toggle:
-        exclude_keys.add('agn_score')
-
-    # only evaluate this once since it is time consuming
-    event_candidates_list = list(event_candidates)
-
-    # which transient types to consider?
-    ### TODO: Right now, just does KN unless SSM; change this for BBH events
-    try:
-        nle_eventseq = localization_sequence_from_name(
-            event_candidates_list[0].nonlocalizedevent.event_id
+        exclude_keys.add("agn_score")
+
+    # unset score factors do not change the product
+    subscores = [
+        Coalesce(f"typed_score__{key}", Value(1.0), output_field=FloatField())
+        for key in subscore_names
+        if key in EventCandidateScore.FLOAT_KEYS and key not in exclude_keys
+    ]
+
+    # now the scores stored in TargetExtra objects
+    target_extras = TargetExtra.objects.filter(target_id=OuterRef("target_id"))
+    ps_score = target_extras.filter(key="ps_score").annotate(
+        score=Cast("value", FloatField())
+    )
+    mpc_score = target_extras.filter(key="mpc_match_name").annotate(
+        score=Case(
+            When(value=str(None), then=Value(1.0)),
+            default=Value(0.0),
+            output_field=FloatField(),
         )
-        most_likely_class = get_most_likely_class(nle_eventseq.details)
-    except IndexError:
-        return []
+    )
+    subscores += [
+        Coalesce(Subquery(te.values("score")[:1]), Value(1.0), output_field=FloatField())
+        for te in (ps_score, mpc_score)
+    ]
+
+    annotations = {}
+    for transient in transients:
+        # allowed parameter ranges for given transient
+        param_ranges = dict_transients_param_ranges[transient]
+        phot_checks = [
+            _check_phot_val_expression(subscore_key, param_ranges, param_range_key)
+            for subscore_key, param_range_key in VAL_NOT_SCORE_KEYS.items()
+            if subscore_key in subscore_names
+        ]
+        annotations[SCORE_ANNOTATIONS[transient]] = _product(subscores + phot_checks)
+    return annotations
+
+
+def annotate_event_candidate_scores(
+    event_candidates,
+    transients=TRANSIENTS,
+    dict_transients_param_ranges=DICT_TRANSIENTS_PARAM_RANGES,
+    subscore_names=SUBSCORE_NAMES,
+    agn_toggle=True,
+    use_snapshots=True,
+):
+    """Annotate a queryset of EventCandidate objects with the score of each
+    transient in transients. The annotation names are given by
+    SCORE_ANNOTATIONS; the queryset is ordered by decreasing score of the
+    first transient.
 
-    if most_likely_class == "SSM":
-        transients = TRANSIENTS
-    else:
-        transients = ["KN"]
-
-    # Batch load all related data at once
-    target_ids = [ec.target_id for ec in event_candidates_list]
-
-    # Prefetch TargetExtra for all targets at once
-    target_extras_by_id = {}
-    for te in TargetExtra.objects.filter(target_id__in=target_ids):
-        if te.target_id not in target_extras_by_id:
-            target_extras_by_id[te.target_id] = {}
-        target_extras_by_id[te.target_id][te.key] = te.value
-
-    # Prefetch all ScoreFactor objects at once
-    score_factors = ScoreFactor.objects.filter(
-        event_candidate__in=event_candidates_list, key__in=subscore_names
-    ).annotate(value_float=Cast("value", FloatField()))
-
-    # Group score factors by event candidate
-    score_factors_by_ec = {}
-    for sf in score_factors:
-        ec_id = sf.event_candidate_id
-        if ec_id not in score_factors_by_ec:
-            score_factors_by_ec[ec_id] = {}
-        score_factors_by_ec[ec_id][sf.key] = sf.value_float
-
-    ecs_out = []
-    for ec in event_candidates_list:
-        # set ec.score to be a dictionary mapping transient : score
-        ec.score = {}
-
-        # get all 'subscores' (sometimes actually calculated values)
-        # for object; need to re-do this per transient because of step
-        # below where we exclude certain scores from the queryset
-        sf_dict = score_factors_by_ec.get(ec.id, {})
-
-        # Extract values that need special handling
-        val_dict = {
-            subscore_key: sf_dict[subscore_key]
-            for subscore_key, param_range_key in val_not_score_keys.items()
-            if subscore_key in sf_dict
+    With use_snapshots the scores are read from EventCandidateScoreSnapshot,
+    and only computed from the score factors for candidates without one.
+    """
+    annotations = score_expressions(
+        transients,
+        dict_transients_param_ranges=dict_transients_param_ranges,
+        subscore_names=subscore_names,
+        agn_toggle=agn_toggle,
+    )
+    if use_snapshots:
+        snapshots = EventCandidateScoreSnapshot.objects.filter(event_candidate=OuterRef("pk"))
+        snapshot_field = "score" if agn_toggle else "score_without_agn"
+        annotations = {
+            SCORE_ANNOTATIONS[transient]: Coalesce(
+                Subquery(snapshots.filter(transient=transient).values(snapshot_field)[:1]),
+                annotations[SCORE_ANNOTATIONS[transient]],
+                output_field=FloatField(),
+            )
+            for transient in transients
         }
 
-        # now get all the scores stored in TargetExtra objects
-        te = target_extras_by_id.get(ec.target_id, {})
-        ps_score = 1
-        if "ps_score" in te:
-            ps_score = float(te["ps_score"])
-
-        mpc_score = 1
-        if "mpc_match_name" in te:
-            mpc_score = int(te["mpc_match_name"] == str(None))
-
-        # remove keys we don't want and calculate a base subscore
-        # need to add "agn" to exclude keys if button is selected
-        # AGN enabled should be a global state of the website
-        subscore_no_phot = (
-            math.prod([sf_dict[key] for key in sf_dict if key not in exclude_keys])
-            * ps_score
-            * mpc_score
-        )
+    return event_candidates.annotate(**annotations).order_by(
+        f"-{SCORE_ANNOTATIONS[transients[0]]}", "id"
+    )
 
-        for transient in transients:
-            # allowed parameter ranges for given transient
-            param_ranges = dict_transients_param_ranges[transient]
-
-            # compute the photometry score
-            phot_score = math.prod(
-                [
-                    _check_phot_val(
-                        val_dict[subscore_key], param_ranges, param_range_key
-                    )
-                    for subscore_key, param_range_key in val_not_score_keys.items()
-                    if subscore_key in val_dict
-                ]
-            )
 
-            # save the score to a temporary field (dictionary) in the
-            # EventCandidate object
-            ec.score[transient] = (
-                subscore_no_phot * phot_score
-            )  # multiply the subscores
-        ecs_out.append(ec)
+def get_event_candidate_scores(
+    event_candidates,
+    dict_transients_param_ranges=DICT_TRANSIENTS_PARAM_RANGES,
+    subscore_names=SUBSCORE_NAMES,
+    agn_toggle=True,
+    limit=None,
+    offset=0,
+):
+    """Get the event candidate scores for everything in subscore_names, sorted
+    by decreasing KN score. Only the candidates from offset to offset + limit
+    are loaded from the database.
 
-    print("Finished computing the scores, sorting and returning...", time.time())
+    event_candidates should be a django queryset of EventCandidate objects,
+    all associated with the same nonlocalized event
+    """
+    transients = get_candidate_transients(event_candidates)
+    if transients is None:
+        return []
 
+    ecs = annotate_event_candidate_scores(
+        event_candidates,
+        transients=transients,
+        dict_transients_param_ranges=dict_transients_param_ranges,
+        subscore_names=subscore_names,
+        agn_toggle=agn_toggle,
+        # the snapshots hold the scores for the default parameters
+        use_snapshots=(
+            dict_transients_param_ranges is DICT_TRANSIENTS_PARAM_RANGES
+            and subscore_names is SUBSCORE_NAMES
+        ),
+    )
     # sort by kilonova score, for now
     ## TODO: generalize this
-    return sorted(ecs_out, reverse=True, key=lambda x: x.score["KN"])
+    ecs = ecs[offset:] if limit is None else ecs[offset:offset + limit]
+    return attach_scores(ecs, transients)
+
+
+def attach_scores(event_candidates, transients):
+    """Set ec.score to a dictionary mapping transient : score for each of the
+    event candidates annotated by annotate_event_candidate_scores"""
+    ecs_out = list(event_candidates)
+    for ec in ecs_out:
+        ec.score = {
+            transient: getattr(ec, SCORE_ANNOTATIONS[transient])
+            for transient in transients
+        }
+    return ecs_out
 
 
 def get_target_score(target_id):
@@ -3,23 +3,25 @@ Some general functions useful for vetting photometry
 """
 
 import logging
-from typing import Tuple, Optional, Iterable
-from datetime import datetime, timezone, timedelta
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional, Tuple
 
-from astropy.time import Time
-from astropy.stats import akaike_info_criterion_lsq as info_crit
-from astropy import units as u
 import numpy as np
 import pandas as pd
+from astropy import units as u
+from astropy.stats import akaike_info_criterion_lsq as info_crit
+from astropy.time import Time
+from candidate_vetting.public_catalogs.phot_catalogs import TNS_Phot
 from scipy.optimize import curve_fit
+from tom_nonlocalizedevents.models import EventSequence, NonLocalizedEvent
 
-from tom_nonlocalizedevents.models import NonLocalizedEvent, EventSequence
-from tom_dataproducts.models import ReducedDatum
+from custom_code.templatetags.photometry_extras import error_to_snr
 from trove_targets.models import Target
-from candidate_vetting.public_catalogs.phot_catalogs import TNS_Phot
-from .tasks import async_atlas_query
+
+from .light_curve import LightCurve, get_light_curve
 from .scoring import get_eventcandidate_default_distance
-from custom_code.templatetags.photometry_extras import error_to_snr
+from .tasks import async_atlas_query
 
 logger = logging.getLogger(__name__)
 
@@ -54,81 +56,47 @@ def _flux_to_lum(flux, lumdist):
     """convert flux to lum. Everything should be astropy quantities"""
     return 4 * np.pi * lumdist**2 * flux
 
-def _get_phot(target_id: int, nonlocalized_event: NonLocalizedEvent) -> pd.DataFrame:
-    """
-    Get the photometry for this target_id and parse into a dataframe for further analysis
-    """
-    target = Target.objects.filter(id=target_id)[0]
-
-    # get the photometry
-    phot = list(ReducedDatum.objects.filter(target=target, data_type="photometry"))
-
-    # clean up the photometry
-    fordf = dict(
-        telescope=[],
-        mjd=[],
-        mag=[],
-        magerr=[],
-        upperlimit=[],
-        filter=[],
-    )
 
-    if len(phot) == 0:
-        # just return an empty dataframe
-        return pd.DataFrame(fordf)
-
-    for p in phot:
-        if hasattr(p, "source_name"):
-            fordf["telescope"].append(p.source_name)
-        elif "telescope" in p.value:
-            fordf["telescope"].append(p.value["telescope"])
-        else:
-            fordf["telescope"].append("unknown")
-
-        if not hasattr(p, "timestamp"):
-            continue
-        fordf["mjd"].append(Time(p.timestamp).mjd)
+def gw_disc_mjd(nonlocalized_event: NonLocalizedEvent) -> float:
+    """MJD of the discovery of nonlocalized_event, from its latest EventSequence"""
+    return Time(
+        EventSequence.objects.filter(nonlocalizedevent_id=nonlocalized_event.id)
+        .last()
+        .details["time"]
+    ).mjd
 
-        if "filter" not in p.value:
-            continue
-        fordf["filter"].append(p.value["filter"])
 
-        if "magnitude" in p.value:
-            fordf["mag"].append(p.value["magnitude"])
-            fordf["upperlimit"].append(False)
-            if "error" in p.value:
-                fordf["magerr"].append(p.value["error"])
-            else:
-                fordf["magerr"].append(0)
-        elif "limit" in p.value:
-            fordf["upperlimit"].append(True)
-            fordf["mag"].append(p.value["limit"])
-            fordf["magerr"].append(np.nan)
-        else:
-            continue
+def _get_phot(
+    target_id: int,
+    nonlocalized_event: NonLocalizedEvent,
+    light_curve: Optional[LightCurve] = None,
+) -> pd.DataFrame:
+    """
+    Get the photometry for this target_id and parse into a dataframe for further analysis,
+    sorted by time. The dataframe shares the read-only columns of light_curve (the
+    cached light curve of the target if not given), so slices of it by time are views.
+    """
+    if light_curve is None:
+        light_curve = get_light_curve(target_id)
+    photdf = light_curve.to_frame()
 
-    fordf["filter"] = standardize_filter_names(fordf["filter"])
+    if len(photdf) == 0:
+        # just return an empty dataframe
+        return photdf
 
-    photdf = pd.DataFrame(fordf)
+    photdf["filter"] = standardize_filter_names(light_curve.filter)
 
     # clean out the 0's in the magerr column because it breaks the fitting
     # 2.5 / (3 * log(10)) is the constant 3 sigma uncertainty so let's assume this
     # as a worst case scenario
-    photdf["magerr"] = photdf.magerr.replace(0, 2.5 / (3 * np.log(10)))
-
-    # compute the days since the nonlocalized event passed in
-    # get the GW event discovery date
-    gw_disc_date = Time(
-        EventSequence.objects.filter(nonlocalizedevent_id=nonlocalized_event.id)
-        .last()
-        .details["time"]
-    ).mjd
+    magerr = np.where(light_curve.magerr == 0, 2.5 / (3 * np.log(10)), light_curve.magerr)
+    photdf["magerr"] = magerr
 
-    # add a dt column to the dataframe
-    photdf["dt"] = photdf.mjd - gw_disc_date
+    # add a dt column to the dataframe, the days since the nonlocalized event passed in
+    photdf["dt"] = light_curve.mjd - gw_disc_mjd(nonlocalized_event)
 
     # add a SNR column to the dataframe
-    photdf["snr"] = error_to_snr(photdf.magerr)
+    photdf["snr"] = error_to_snr(magerr)
 
     return photdf
 
@@ -138,11 +106,16 @@ def _get_post_disc_phot(
     nonlocalized_event: NonLocalizedEvent,
     t_post: float = np.inf,
     t_pre: float = 0,
+    photdf: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
-    photdf = _get_phot(target_id, nonlocalized_event)
+    if photdf is None:  # otherwise reuse the output of _get_phot for this target and event
+        photdf = _get_phot(target_id, nonlocalized_event)
     if not len(photdf):
         return
-    phot_post_disc = photdf.loc[(t_post >= photdf.dt) & (photdf.dt >= t_pre)]
+    # photdf is sorted by dt, so this is a contiguous slice
+    start = np.searchsorted(photdf.dt.values, t_pre, side="left")
+    stop = np.searchsorted(photdf.dt.values, t_post, side="right")
+    phot_post_disc = photdf.iloc[start:stop]
     return phot_post_disc
 
 
@@ -150,11 +123,14 @@ def _get_pre_disc_phot(
     target_id: int,
     nonlocalized_event: NonLocalizedEvent,
     t_pre: float = 0,
+    photdf: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
-    photdf = _get_phot(target_id, nonlocalized_event)
+    if photdf is None:  # otherwise reuse the output of _get_phot for this target and event
+        photdf = _get_phot(target_id, nonlocalized_event)
     if not len(photdf):
         return
-    phot_pre_disc = photdf[photdf.dt < t_pre]
+    # photdf is sorted by dt, so this is a contiguous slice
+    phot_pre_disc = photdf.iloc[:np.searchsorted(photdf.dt.values, t_pre, side="left")]
     return phot_pre_disc
 
 
@@ -163,16 +139,12 @@ def _get_window_stats(min_idx, max_idx, isdet):
 
 
 def standardize_filter_names(
-    filters: list[str], delimiters: list[str] = [".", "-", " "]
+    filters: Iterable[str], delimiters: list[str] = [".", "-", " "]
 ) -> list[str]:
-
-    newfilters = []
-    for filt in filters:
-        newfilt = filt
-        for delim in delimiters:
-            newfilt = newfilt.split(delim)[0]
-        newfilters.append(newfilt.strip())
-    return newfilters
+    """Cut the filter names at the first of any of the delimiters"""
+    pattern = "|".join(re.escape(delim) for delim in delimiters)
+    newfilters = pd.Series(list(filters), dtype=object).str.split(pattern, n=1, regex=True)
+    return newfilters.str[0].str.strip().tolist()
 
 
 def estimate_max_find_decay_rate(
@@ -555,7 +527,16 @@ def find_public_phot(
     return created_new_tns_phot
 
 
-def _score_phot(allphot, target, nonlocalized_event, param_ranges, filt=None):
+def _score_phot(allphot, target, nonlocalized_event, param_ranges, filt=None, cache=None, gw_distance=None):
+    """
+    Score the photometry allphot against param_ranges. The peak luminosity and
+    light curve fit only depend on the photometry used, so calls scoring the
+    same allphot against different param_ranges can pass the same cache dict
+    to reuse them. gw_distance, if given, is the GW distance mean and standard
+    deviation at the target, otherwise it is looked up when needed.
+    """
+    if cache is None:
+        cache = {}
 
     if allphot is None:  # this is if there is no photometry
         return 1, None, None, None, None, None
@@ -586,10 +567,19 @@ def _score_phot(allphot, target, nonlocalized_event, param_ranges, filt=None):
 
     # if we've made it to this point we have at least one detection so
     # we can calculate the luminosity
-    dist, _ = get_eventcandidate_default_distance(
-        target.id, nonlocalized_event.event_id
+    phot_key = (
+        param_ranges["phot_score_snr_min"],
+        tuple(sorted(filt)) if isinstance(filt, (list, set)) else filt,
     )
-    lum = compute_peak_lum(phot.mag, phot.magerr, phot["filter"].tolist(), dist * u.Mpc)
+    if ("lum", phot_key) not in cache:
+        dist, _ = get_eventcandidate_default_distance(
+            target.id, nonlocalized_event.event_id, gw_distance=gw_distance
+        )
+        # no luminosity without a distance (e.g. outside the stored localization tiles)
+        cache["lum", phot_key] = None if np.isnan(dist) else compute_peak_lum(
+            phot.mag, phot.magerr, phot["filter"].tolist(), dist * u.Mpc
+        )
+    lum = cache["lum", phot_key]
 
     phot_score = 1
     if lum is not None and (
@@ -602,20 +592,23 @@ def _score_phot(allphot, target, nonlocalized_event, param_ranges, filt=None):
     # has to be at least 2 points before max_decay_fit_time, to fit the powerlaw
     if len(phot[phot.dt < param_ranges["max_decay_fit_time"]]) > 1:
         # find the maximum and decay rate
-        try:
-            _model, _best_fit_params, max_time, decay_rate = (
-                estimate_max_find_decay_rate(
+        fit_key = ("fit", phot_key, param_ranges["max_decay_fit_time"])
+        if fit_key not in cache:
+            try:
+                cache[fit_key] = estimate_max_find_decay_rate(
                     phot.dt,
                     phot.mag,
                     phot.magerr,
                     max_decay_fit_time=param_ranges["max_decay_fit_time"],
                 )
-            )
-        except RuntimeError:
+            except RuntimeError:
+                cache[fit_key] = None
+        if cache[fit_key] is None:
             logger.warning(
                 "Could not fit a power law or broken power law --> not setting peak_time or decay_rate"
             )
             return phot_score, lum, None, None, None, None
+        _model, _best_fit_params, max_time, decay_rate = cache[fit_key]
 
         # check if these are within the appropriate ranges
         if (
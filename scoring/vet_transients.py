@@ -0,0 +1,246 @@
+"""
+The "pipeline" to vet candidate counterparts to nonlocalized events as one or
+more transient types in a single pass.
+
+The transient vetting modules (vet_bns, vet_kn_in_sn, vet_super_kn) only
+differ in their PARAM_RANGES. The skymap association, basic vetting, host
+distance and AGN scores and the photometry are therefore computed once per
+target and nonlocalized event and shared by every transient; only the
+photometry checks run per transient, reusing light curve fits with the same
+fit window.
+"""
+
+import functools
+import logging
+from typing import Optional
+
+import numpy as np
+from tom_nonlocalizedevents.models import (
+    EventCandidate,
+    NonLocalizedEvent,
+)
+
+from trove_targets.models import Target
+
+from .scoring import (
+    ScoreWriter,
+    _localization_from_name,
+    distances_at_healpix,
+    drop_filler_redshifts,
+    get_distance_score,
+    host_distance_match,
+    skymap_association_batch,
+    skymap_max_time,
+)
+from .vet_basic import vet_basic
+from .vet_phot import (
+    PHOT_SCORE_MIN,
+    PREDETECTION_SNR_THRESHOLD,
+    _get_phot,
+    _get_post_disc_phot,
+    _get_pre_disc_phot,
+    _score_phot,
+    get_predetection_stats,
+)
+
+logger = logging.getLogger(__name__)
+
+# common optical filters + some Roman filters + ATLAS o,c
+PHOT_SCORE_FILTERS = ["g", "r", "i", "z", "F129", "F158", "o", "c"]
+
+
+class _SharedStages:
+    """The vetting stages that do not depend on the transient parameter
+    ranges, each computed the first time it is needed"""
+
+    def __init__(self, target, nonlocalized_event, skymap_score=None, gw_distance=None):
+        self.target = target
+        self.nonlocalized_event = nonlocalized_event
+        self._skymap_score = skymap_score
+        self._gw_distance = gw_distance
+        self._localizations = {}
+        self._skymap_scores = {}
+        self._phot_caches = {}
+
+    def localization(self, t_post=np.inf):
+        """the localization used with data up to t_post days after the event,
+        resolved once per t_post"""
+        if t_post not in self._localizations:
+            max_time = skymap_max_time(self.nonlocalized_event, t_post)
+            self._localizations[t_post] = _localization_from_name(
+                self.nonlocalized_event.event_id, max_time=max_time
+            )
+        return self._localizations[t_post]
+
+    def skymap_score(self, t_post):
+        if self._skymap_score is not None:
+            return self._skymap_score
+        if t_post not in self._skymap_scores:
+            self._skymap_scores[t_post] = skymap_association_batch(
+                self.localization(t_post), [self.target.id]
+            )[self.target.id]
+        return self._skymap_scores[t_post]
+
+    @functools.cached_property
+    def gw_distance(self):
+        """GW distance mean and standard deviation at the target, in the latest localization"""
+        if self._gw_distance is not None:
+            return self._gw_distance
+        dist, dist_err = distances_at_healpix(self.localization(), [self.target.id])
+        return float(dist[0]), float(dist_err[0])
+
+    @functools.cached_property
+    def hosts(self):
+        """dataframes of potential hosts / AGN"""
+        host_df, agn_df = vet_basic(self.target.id)
+        return drop_filler_redshifts(host_df), agn_df
+
+    @functools.cached_property
+    def host_distance(self):
+        """score factors of the best matching host, empty without any distance information"""
+        if np.isnan(self.gw_distance).any():
+            # the target is outside the stored tiles of the localization
+            return {}
+        host_df, _ = self.hosts
+        event_name = self.nonlocalized_event.event_id
+        if self.target.redshift is not None and not np.isnan(self.target.redshift):
+            # use target redshift, so no need to compute distance scores for galaxies
+            host_score, _ = get_distance_score(
+                host_df, self.target.id, event_name, gw_distance=self.gw_distance
+            )
+            return {"host_distance_score": host_score}
+        if len(host_df) != 0:
+            # then run the distance comparison for each of these hosts
+            host_df = host_distance_match(
+                host_df, self.target.id, event_name, gw_distance=self.gw_distance
+            )
+            # choose the maximum score
+            host_score, host_name = get_distance_score(
+                host_df, self.target.id, event_name, gw_distance=self.gw_distance
+            )
+            return {"host_distance_score": host_score, "host_name": host_name}
+        return {}
+
+    @functools.cached_property
+    def phot(self):
+        return _get_phot(self.target.id, self.nonlocalized_event)
+
+    def post_disc_phot(self, t_post):
+        return _get_post_disc_phot(
+            self.target.id, self.nonlocalized_event, t_post=t_post, photdf=self.phot
+        )
+
+    def pre_disc_phot(self, t_pre):
+        return _get_pre_disc_phot(
+            self.target.id, self.nonlocalized_event, t_pre=t_pre, photdf=self.phot
+        )
+
+    def phot_cache(self, t_post):
+        """cache for _score_phot, shared by the transients scoring the same photometry"""
+        return self._phot_caches.setdefault(t_post, {})
+
+
+def _vet_transient(shared, scores, param_ranges):
+    """Score one transient on the shared stages, like one of the vet_* functions"""
+    ## check skymap association
+    skymap_score = shared.skymap_score(param_ranges["t_post"])
+    scores.set("skymap_score", skymap_score)
+    if skymap_score < 1e-2:
+        return
+
+    ## distance scoring
+    if shared.host_distance:
+        for key, value in shared.host_distance.items():
+            scores.set(key, value)
+    else:
+        # if no target redshift is known and no hosts are found, we don't want
+        # to bias the final score (host may just be too far), and we should
+        # also clear out any existing scores / host names for it
+        scores.delete("host_distance_score")
+        scores.delete("host_name")
+
+    ## AGN scoring
+    _, agn_df = shared.hosts
+    agn_score = 0 if len(agn_df) != 0 else 1  # association with an AGN is bad
+    scores.set("agn_score", agn_score)
+
+    ## photometry scoring
+    phot_score, lum, max_time, decay_rate, _, _ = _score_phot(
+        allphot=shared.post_disc_phot(param_ranges["t_post"]),
+        target=shared.target,
+        nonlocalized_event=shared.nonlocalized_event,
+        param_ranges=param_ranges,
+        filt=PHOT_SCORE_FILTERS,
+        cache=shared.phot_cache(param_ranges["t_post"]),
+        gw_distance=shared.gw_distance,
+    )
+    if lum is not None:
+        scores.set("phot_peak_lum", lum.value)
+    else:
+        scores.delete("phot_peak_lum")
+
+    if max_time is not None:
+        scores.set("phot_peak_time", max_time)
+    else:
+        scores.delete("phot_peak_time")
+
+    if decay_rate is not None:
+        scores.set("phot_decay_rate", decay_rate)
+    else:
+        scores.delete("phot_decay_rate")
+
+    # check for *reliable* predetections before time t_pre
+    prephot = shared.pre_disc_phot(param_ranges["t_pre"])
+    if prephot is not None and len(prephot):
+        try:
+            n_predets, _ = get_predetection_stats(
+                prephot.mjd.values,
+                prephot.magerr.values,
+                window_size=5,  # +/-5 day window size
+                det_snr_thresh=PREDETECTION_SNR_THRESHOLD,
+            )
+        except ValueError:
+            n_predets = [
+                0
+            ]  # this ValueError only happens when there aren't any predets
+        if any(v >= param_ranges["max_predets"] for v in n_predets):
+            scores.set("predetection_score", PHOT_SCORE_MIN)
+        else:
+            scores.delete("predetection_score")
+
+
+def vet_transients(
+    target_id: int,
+    nonlocalized_event_name: str,
+    transient_param_ranges: dict,
+    skymap_score: Optional[float] = None,
+    gw_distance: Optional[tuple] = None,
+):
+    """
+    Vet the candidate target_id of nonlocalized_event_name as each transient in
+    transient_param_ranges, a dictionary mapping transient : PARAM_RANGES.
+
+    The transients share their score factors, so the score factors written
+    are the same as running the transient vetting functions one after the
+    other in that order, but every stage they have in common runs once and
+    everything is written in one go. skymap_score, if given, is used for
+    every transient instead of running the skymap association, and
+    gw_distance, if given, as the GW distance at the target (see
+    scoring.scoring.distances_at_healpix).
+    """
+    logger.info(f"Running {', '.join(transient_param_ranges)} vetting")
+
+    # get the correct EventCandidate object for this target_id and nonlocalized event
+    nonlocalized_event = NonLocalizedEvent.objects.get(event_id=nonlocalized_event_name)
+    event_candidate = EventCandidate.objects.get(
+        nonlocalizedevent_id=nonlocalized_event.id, target_id=target_id
+    )
+    target = Target.objects.get(id=target_id)
+
+    shared = _SharedStages(
+        target, nonlocalized_event, skymap_score=skymap_score, gw_distance=gw_distance
+    )
+    # score factors are written all at once when the block exits
+    with ScoreWriter(event_candidate) as scores:
+        for param_ranges in transient_param_ranges.values():
+            _vet_transient(shared, scores, param_ranges)
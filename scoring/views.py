@@ -2,47 +2,44 @@
 Page views for candidate vetting
 """
 
-import numpy as np
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 
+import numpy as np
+from candidate_vetting.public_catalogs.phot_catalogs import ZTF_Forced_Phot
+from candidate_vetting.vet import host_association, localization_sequence_from_name
+from dal import autocomplete
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic.base import RedirectView
-from django.views.generic.edit import FormView
 from django.http import HttpResponseRedirect
-from django.urls import reverse
 from django.shortcuts import redirect
-from dal import autocomplete
-
-from trove_targets.models import Target
+from django.urls import reverse
+from django.views.generic.base import RedirectView
+from django.views.generic.edit import FormView
 from tom_nonlocalizedevents.models import (
     EventCandidate,
-    NonLocalizedEvent,
     EventLocalization,
+    NonLocalizedEvent,
 )
 
-from candidate_vetting.vet import host_association, localization_sequence_from_name
-from candidate_vetting.public_catalogs.phot_catalogs import ZTF_Forced_Phot
-
-from .forms import (VettingChoiceForm,
-                    RedshiftUpdateForm,
-                    NonLocalizedEventAssociateTargetsForm
-                    )
-from .config import (FORM_CHOICE_FUNC_MAP,
-                     VETTING_FORM_CHOICES,
-                     VETTING_FORM_INITIALS,
-                     DETECTION_HORIZON_DEFAULTS
-                     )
-from .tasks import vet_all_async, associate_targets_with_nle_async
-from .vet_basic import vet_basic
-from .vet_phot import find_public_phot
-from .dynamic_catalogs import UserGalaxy
-
 from custom_code.templatetags.nonlocalizedevent_extras import get_most_likely_class
 from custom_code.templatetags.target_list_extras import galaxy_table
+from trove_targets.models import Target
 
+from .config import (
+    DETECTION_HORIZON_DEFAULTS,
+    FORM_CHOICE_FUNC_MAP,
+    FORM_CHOICE_PARAM_RANGES,
+    VETTING_FORM_CHOICES,
+    VETTING_FORM_INITIALS,
+)
+from .dynamic_catalogs import UserGalaxy
+from .forms import NonLocalizedEventAssociateTargetsForm, RedshiftUpdateForm, VettingChoiceForm
+from .tasks import associate_targets_with_nle_async, vet_all_async
+from .vet_basic import vet_basic
+from .vet_phot import find_public_phot
+from .vet_transients import vet_transients
 
 
 class TargetVettingFormView(FormView):
@@ -268,10 +265,11 @@ class TargetRedshiftUpdateFormView(FormView):
 
             vetting_modes = [v for v, _ in vetting_choices]
             vetting_modes.remove("basic")  # no need to re-run basic vetting
-            for vm in vetting_modes:
-                FORM_CHOICE_FUNC_MAP[vm](
-                    target_id=pk, nonlocalized_event_name=nle.event_id
-                )
+            vet_transients(
+                pk,
+                nle.event_id,
+                {vm: FORM_CHOICE_PARAM_RANGES[vm] for vm in vetting_modes},
+            )
             messages.info(
                 self.request,
                 "Added a new host galaxy redshift, re-ran host association, and "
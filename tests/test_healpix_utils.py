@@ -0,0 +1,308 @@
+"""
+Unit tests for the in-memory skymap helpers in custom_code/healpix_utils.py
+"""
+
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+
+class TestLocalizationIndex:
+    """Tests for LocalizationIndex lookups against a brute-force reference"""
+
+    @staticmethod
+    def _tiles():
+        lower = np.array([0, 10, 20, 40, 60])
+        upper = np.array([10, 20, 40, 60, 100])
+        probdensity = np.array([1., 3., 2., 3., 0.5])
+        return lower, upper, probdensity
+
+    def test_cumprob_matches_window_sum(self):
+        """Cumulative probability includes every tile with an equal or higher probability density."""
+        from custom_code.healpix_utils import PIXEL_AREA, LocalizationIndex
+
+        lower, upper, probdensity = self._tiles()
+        index = LocalizationIndex(lower[::-1], upper[::-1], probdensity[::-1])
+        healpix = np.arange(0, 100, 7)
+        area = (upper - lower) * PIXEL_AREA
+
+        for hpx, cumprob in zip(healpix, index.cumprob_at(healpix)):
+            tile = np.where((lower <= hpx) & (hpx < upper))[0][0]
+            expected = np.sum((probdensity * area)[probdensity >= probdensity[tile]])
+            assert np.isclose(cumprob, expected)
+
+    def test_tied_tiles_share_cumprob(self):
+        """Tiles with the same probability density have the same cumulative probability."""
+        from custom_code.healpix_utils import LocalizationIndex
+
+        index = LocalizationIndex(*self._tiles())
+        assert index.cumprob_at([15])[0] == index.cumprob_at([45])[0]
+
+    def test_outside_localization(self):
+        """Healpix indices outside every tile are never in a credible region."""
+        from custom_code.healpix_utils import LocalizationIndex
+
+        index = LocalizationIndex(*self._tiles())
+        assert index.tile_indices([100, 1000]).tolist() == [-1, -1]
+        assert not index.in_credible_region([100], prob=1.).any()
+
+    def test_distances_at(self):
+        """Distances come from the containing tile and are NaN outside the localization."""
+        from custom_code.healpix_utils import LocalizationIndex
+
+        lower, upper, probdensity = self._tiles()
+        index = LocalizationIndex(lower, upper, probdensity,
+                                  distance_mean=np.arange(5.) * 100, distance_std=np.arange(5.) * 10)
+        dist, dist_err = index.distances_at([5, 45, 200])
+        assert dist[:2].tolist() == [0., 300.]
+        assert dist_err[:2].tolist() == [0., 30.]
+        assert np.isnan(dist[2]) and np.isnan(dist_err[2])
+
+    def test_smallest_credible_region_percents(self):
+        """Each cumulative probability maps to the smallest credible region that contains it."""
+        from custom_code.healpix_utils import smallest_credible_region_percents
+
+        percents = smallest_credible_region_percents([0.1, 0.25, 0.26, 0.9, 0.96], [0.95, 0.9, 0.5, 0.25])
+        assert percents.tolist() == [25, 25, 50, 90, -1]
+
+    def test_cutoff_keeps_cumprob(self):
+        """Dropping the tiles beyond the cutoff leaves the cumulative probability of the others unchanged."""
+        from custom_code.healpix_utils import PIXEL_AREA, LocalizationIndex, tiles_within_cutoff
+
+        lower, upper, probdensity = self._tiles()
+        area = (upper - lower) * PIXEL_AREA
+        full = LocalizationIndex(lower, upper, probdensity)
+        cutoff = full.cumprob_at([25])[0]
+        keep, tail = tiles_within_cutoff(probdensity, area, cutoff)
+        assert keep.tolist() == [False, True, True, True, False]
+        assert np.isclose(tail, np.sum((probdensity * area)[[0, 4]]))
+
+        trimmed = LocalizationIndex(lower[keep], upper[keep], probdensity[keep])
+        assert np.allclose(trimmed.cumprob_at([15, 25, 45]), full.cumprob_at([15, 25, 45]))
+        assert tiles_within_cutoff(probdensity, area, 1.)[0].all()
+
+    def test_tail_outside_stored_tiles(self):
+        """Positions outside the stored tiles of a trimmed localization are in its dropped tail."""
+        from custom_code.healpix_utils import (
+            ALL_SKY_RANGES,
+            PIXEL_AREA,
+            LocalizationIndex,
+            credible_region_percents,
+            ranges_contain,
+            tiles_within_cutoff,
+        )
+
+        lower, upper, probdensity = self._tiles()
+        area = (upper - lower) * PIXEL_AREA
+        total = np.sum(probdensity * area)
+        keep, tail = tiles_within_cutoff(probdensity / total, area, 0.9)
+        index = LocalizationIndex(lower[keep], upper[keep], probdensity[keep] / total, tail_probability=tail)
+
+        outside = [65, 1000]
+        assert np.allclose(index.cumprob_at(outside), 1 - tail / 2)
+        assert index.covers(outside).all()
+        assert not index.in_credible_region(outside, prob=0.9).any()
+        assert index.in_credible_region(outside, prob=1.).all()
+        assert credible_region_percents(index, outside, [0.95, 0.9]).tolist() == [95, 95]
+        assert credible_region_percents(index, outside, [0.9, 0.5]).tolist() == [-1, -1]
+        ranges = index.credible_region_ranges(1.)
+        assert ranges.tolist() == ALL_SKY_RANGES.tolist()
+        assert ranges_contain(index.credible_region_ranges(0.9), outside).tolist() == [False, False]
+
+    def test_coarse_pixels(self):
+        """Coarse pixels cover every tile of the credible region, including tiles spanning several of them."""
+        from custom_code.healpix_utils import LEVEL, LocalizationIndex
+
+        shift = 2 * (LEVEL - 6)
+        lower = np.array([0, 3 << shift, (5 << shift) + 7, 100 << shift])
+        upper = np.array([2 << shift, 4 << shift, (5 << shift) + 9, 104 << shift])
+        index = LocalizationIndex(lower, upper, np.ones(4), cumprob=[0.1, 0.2, 0.3, 0.99])
+        assert index.coarse_pixels(0.95, level=6).tolist() == [0, 1, 3, 5]
+        assert index.coarse_pixels(1., level=6).tolist() == [0, 1, 3, 5, 100, 101, 102, 103]
+
+    def test_credible_region_tiles_use_rank_index(self):
+        """The credible region is read with a range scan on (localization, cumprob) of the stored ranks."""
+        from custom_code.healpix_utils import credible_region_tiles
+
+        sql, params = credible_region_tiles(7, 0.9).values_list('tile__tile').query.sql_with_params()
+        where = sql.split('WHERE')[1]
+        assert '"custom_code_skymaptilerank"."localization_id" =' in where
+        assert '"custom_code_skymaptilerank"."cumprob" <=' in where
+        assert 0.9 in params
+
+    def test_index_reloaded_after_tiles_deleted(self):
+        """The memoized index is reloaded once tiles of the localization have been deleted."""
+        from custom_code import healpix_utils
+
+        with patch.object(healpix_utils.SkymapTile, 'objects') as tiles, \
+                patch.object(healpix_utils.LocalizationIndex, 'from_localization_id', side_effect=lambda lid: object()):
+            tiles.filter.return_value.count.return_value = 5
+            index = healpix_utils.get_localization_index(-1)
+            assert healpix_utils.get_localization_index(-1) is index
+            tiles.filter.return_value.count.return_value = 4
+            assert healpix_utils.get_localization_index(-1) is not index
+
+
+class TestIncrementalCredibleRegions:
+    """Tests for updating the credible region percents of linked candidates when a localization changes"""
+
+    @staticmethod
+    def _localizations():
+        from custom_code.healpix_utils import PIXEL_AREA, LocalizationIndex
+
+        rng = np.random.default_rng(42)
+        edges = np.unique(rng.integers(0, 1 << 20, 400))
+        lower, upper = edges[:-1], edges[1:]
+        probdensity = rng.random(len(lower))
+        old = LocalizationIndex(lower, upper, probdensity / np.sum(probdensity * (upper - lower) * PIXEL_AREA))
+        # the update shifts the probability around, so candidates move between the 25-95% regions
+        probdensity = probdensity * np.exp(rng.normal(0, 0.5, len(lower)))
+        new = LocalizationIndex(lower, upper, probdensity / np.sum(probdensity * (upper - lower) * PIXEL_AREA))
+        return old, new, rng.integers(0, 1 << 20, 2000)
+
+    def test_changed_ranges_cover_every_level(self):
+        """Candidates outside the changed ranges have the same percent in both localizations."""
+        from custom_code.healpix_utils import (
+            CREDIBLE_REGION_PROBABILITIES,
+            changed_credible_region_ranges,
+            credible_region_percents,
+            ranges_contain,
+        )
+
+        old, new, healpix = self._localizations()
+        changed_ranges = changed_credible_region_ranges(
+            [old.credible_region_ranges(p) for p in CREDIBLE_REGION_PROBABILITIES],
+            [new.credible_region_ranges(p) for p in CREDIBLE_REGION_PROBABILITIES],
+        )
+        old_percents = credible_region_percents(old, healpix)
+        new_percents = credible_region_percents(new, healpix)
+        changed = ranges_contain(changed_ranges, healpix)
+        assert (old_percents[~changed] == new_percents[~changed]).all()
+        # some candidates changed regions without leaving the 95% region
+        assert ((old_percents != new_percents) & (old_percents > 0) & (new_percents > 0)).any()
+
+    def test_incremental_matches_full_run(self):
+        """Every linked candidate gets the same percent for the new localization as a full run would give it."""
+        from custom_code import healpix_utils
+
+        old, new, healpix = self._localizations()
+        indexes = {1: old, 2: new}
+        candidate_ids = np.arange(len(healpix)) + 100
+        full = dict(zip(candidate_ids.tolist(), healpix_utils.credible_region_percents(new, healpix).tolist()))
+        old_percents = {
+            cid: percent for cid, percent in
+            zip(candidate_ids.tolist(), healpix_utils.credible_region_percents(old, healpix).tolist())
+            if percent >= 0
+        }
+
+        written = {}
+
+        def bulk_create(credible_regions, **kwargs):
+            written.update((cr.candidate_id, cr.smallest_percent) for cr in credible_regions)
+
+        def update_percents(localizations, event_candidate_ids):
+            written.update((cid, full[cid]) for cid in event_candidate_ids if full[cid] >= 0)
+
+        def previous_percents(localization, candidate_id__in):
+            rows = MagicMock()
+            rows.values_list.return_value = [(cid, old_percents[cid]) for cid in candidate_id__in if cid in old_percents]
+            return rows
+
+        eventsequence = MagicMock()
+        eventsequence.localization.id = 2
+        previous = MagicMock(id=1)
+        with patch.object(healpix_utils, 'credible_region_ranges',
+                          side_effect=lambda lid, p: indexes[lid].credible_region_ranges(p)), \
+                patch.object(healpix_utils, 'get_target_healpix', return_value=(np.empty(0, dtype=np.int64),) * 2), \
+                patch.object(healpix_utils, 'create_candidates_from_targets', return_value=[]), \
+                patch.object(healpix_utils, 'update_credible_region_percents', side_effect=update_percents), \
+                patch.object(healpix_utils.EventCandidate, 'objects') as candidates, \
+                patch.object(healpix_utils.CredibleRegion, 'objects') as credible_regions:
+            candidates.filter.return_value.values_list.return_value = []
+            candidates.filter.return_value.exclude.return_value.values_list.return_value = \
+                list(zip(candidate_ids.tolist(), healpix.tolist()))
+            credible_regions.filter.side_effect = previous_percents
+            credible_regions.bulk_create.side_effect = bulk_create
+            healpix_utils.update_candidates_from_targets(eventsequence, previous)
+
+        assert written == {cid: percent for cid, percent in full.items() if percent >= 0}
+
+
+class TestRangeEncoding:
+    """Tests for the compact range encoding of credible region contours"""
+
+    def test_pixels_merge_into_ranges(self):
+        """Sibling pixels merge into one range at the coarser level."""
+        from custom_code.healpix_utils import pixels_to_ranges, ranges_max_depth
+
+        # the four children of level-1 pixel 0, plus level-2 pixel 9
+        ranges = pixels_to_ranges([2, 2, 2, 2, 2], [3, 1, 0, 2, 9])
+        assert ranges.tolist() == [[0, 4 << 54], [9 << 54, 10 << 54]]
+        assert ranges_max_depth(ranges) == 2
+
+    def test_symmetric_difference_and_containment(self):
+        """Only pixels in exactly one of the two regions are in the symmetric difference."""
+        from custom_code.healpix_utils import ranges_contain, ranges_symmetric_difference
+
+        old = np.array([[0, 100], [200, 300]])
+        new = np.array([[50, 250]])
+        changed = ranges_symmetric_difference(old, new)
+        assert changed.tolist() == [[0, 50], [100, 200], [250, 300]]
+        assert ranges_contain(changed, [10, 75, 150, 225, 275, 400]).tolist() == [
+            True, False, True, False, True, False
+        ]
+
+    def test_encode_roundtrip(self):
+        """Encoded ranges decode to the same array."""
+        from custom_code.healpix_utils import decode_ranges, encode_ranges
+
+        ranges = np.array([[0, 16], [32, 1 << 60]])
+        data = encode_ranges(ranges)
+        assert len(data) == ranges.size * 8
+        assert (decode_ranges(data) == ranges).all()
+
+
+class TestEllipticalGaussianGrid:
+    """Tests for the analytic elliptical localization grid"""
+
+    def test_grid_tiles_sky_and_is_normalized(self):
+        """The grid covers the sphere exactly once and integrates to one."""
+        import astropy_healpix as ah
+        from astropy import units as u
+
+        from custom_code.healpix_utils import elliptical_gaussian_grid
+
+        center = np.deg2rad([150., 20.])
+        cov = np.diag(np.deg2rad([1., 2.]))
+        grid = elliptical_gaussian_grid(center, cov)
+
+        level, _ = ah.uniq_to_level_ipix(grid['UNIQ'])
+        area = ah.nside_to_pixel_area(ah.level_to_nside(level)).to_value(u.sr)
+        assert len(np.unique(grid['UNIQ'])) == len(grid)
+        assert np.isclose(area.sum(), 4 * np.pi)
+        assert np.isclose(np.sum(area * grid['PROBDENSITY']), 1.)
+        # the most probable pixel is next to the center
+        peak_level, peak_ipix = ah.uniq_to_level_ipix(grid['UNIQ'][np.argmax(grid['PROBDENSITY'])])
+        lon, lat = ah.healpix_to_lonlat(peak_ipix, ah.level_to_nside(peak_level), order='nested')
+        assert np.isclose(lon.to_value(u.rad), center[0], atol=0.05)
+        assert np.isclose(lat.to_value(u.rad), center[1], atol=0.05)
+
+
+class TestIgwnSkymapLocalization:
+    """Tests for creating IGWN skymap localizations through tom_nonlocalizedevents"""
+
+    def test_row_tile_inserts_skipped_while_loading(self):
+        """Upstream's row-by-row tile inserts are skipped only while the tiles are loaded in bulk."""
+        import tom_nonlocalizedevents.healpix_utils as upstream_healpix_utils
+
+        from custom_code import healpix_utils
+
+        with patch.object(healpix_utils.SkymapTile.objects, "create") as create:
+            upstream_healpix_utils.SkymapTile.objects.create(probdensity=1.)
+            healpix_utils._RowTileInserts.skip.active = True
+            try:
+                upstream_healpix_utils.SkymapTile.objects.create(probdensity=2.)
+            finally:
+                healpix_utils._RowTileInserts.skip.active = False
+
+        create.assert_called_once_with(probdensity=1.)
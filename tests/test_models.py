@@ -4,6 +4,7 @@ Unit tests for Django models and model methods.
 These test the models in trove_targets/models.py and candidate_vetting/models.py.
 """
 import numpy as np
+import pytest
 
 
 class TestTargetModel:
@@ -22,3 +23,60 @@ class TestTargetModel:
         
         assert isinstance(healpix, (int, np.integer))
         assert healpix >= 0
+
+
+class TestEventCandidateScoreModel:
+    """Tests for EventCandidateScore in scoring/models.py"""
+
+    def test_score_columns(self):
+        """Test mapping score factors to typed columns."""
+        from scoring.models import score_columns
+
+        columns = score_columns({
+            "skymap_score": "0.5",
+            "phot_peak_time": 3,
+            "agn_score": "not a number",
+            "host_name": "NGC 4993",
+            "predetection_score": None,
+            "ps_score": 1,
+        })
+
+        assert columns == {
+            "skymap_score": 0.5,
+            "phot_peak_time": 3.0,
+            "agn_score": None,
+            "host_name": "NGC 4993",
+            "predetection_score": None,
+        }
+
+
+class TestScoreWriter:
+    """Tests for ScoreWriter in scoring/scoring.py"""
+
+    @pytest.mark.django_db
+    def test_flush_queries(self, django_assert_num_queries):
+        """Test that a flush upserts and deletes the score factors in one query each."""
+        from tom_nonlocalizedevents.models import EventCandidate, NonLocalizedEvent
+        from tom_targets.models import Target
+
+        from scoring.models import EventCandidateScore, ScoreFactor
+        from scoring.scoring import ScoreWriter
+
+        target = Target.objects.create(name="AT2024abc", type="SIDEREAL", ra=150.0, dec=30.0)
+        nonlocalized_event = NonLocalizedEvent.objects.create(event_id="S240101a")
+        event_candidate = EventCandidate.objects.create(target=target, nonlocalizedevent=nonlocalized_event)
+        with ScoreWriter(event_candidate) as scores:
+            scores.set("skymap_score", 0.5)
+            scores.set("host_name", "NGC 4993")
+            scores.set("agn_score", 1)
+
+        # savepoint, DELETE, the two upserts, release
+        with django_assert_num_queries(5):
+            with ScoreWriter(event_candidate) as scores:
+                scores.set("skymap_score", 0.7)
+                scores.delete("host_name")
+                scores.delete("agn_score")
+
+        assert dict(ScoreFactor.objects.values_list("key", "value")) == {"skymap_score": "0.7"}
+        columns = EventCandidateScore.objects.values("skymap_score", "host_name", "agn_score").get()
+        assert columns == {"skymap_score": 0.7, "host_name": None, "agn_score": None}
@@ -4,19 +4,21 @@ Unit tests for candidate vetting functions.
 These test the pure logic functions in candidate_vetting/.
 """
 
-import pytest
-import numpy as np
 from unittest.mock import MagicMock, patch
 
+import numpy as np
+import pytest
+
 
 class TestAsymmetricGaussian:
     """Tests for AsymmetricGaussian distribution in candidate_vetting/vet.py"""
 
     def test_pdf_symmetric_gaussian(self):
         """Test AsymmetricGaussian with equal uncertainties (should match normal)."""
-        from scoring.scoring import AsymmetricGaussian
         from scipy.stats import norm
 
+        from scoring.scoring import AsymmetricGaussian
+
         ag = AsymmetricGaussian()
         x = np.array([0.0, 0.5, 1.0, 1.5, 2.0])
         mean = np.array([1.0] * 5)
@@ -78,6 +80,249 @@ class TestAsymmetricGaussian:
         assert all(p > 0 for p in pdf_vals)
 
 
+class TestBhattacharyyaCoefficient:
+    """Tests for the closed-form distance overlap in scoring/distance_match.py"""
+
+    @staticmethod
+    def _grid_coefficient(nle_mean, nle_std, mean, unc_minus, unc_plus, lower=1e-5, upper=1e4):
+        """Reference: the dense-grid integral that host_distance_match used to compute"""
+        from scipy.integrate import trapezoid
+        from scipy.stats import norm
+
+        def unnorm(x):
+            return np.where(x < mean, np.exp(-0.5 * ((x - mean) / unc_minus) ** 2),
+                            np.exp(-0.5 * ((x - mean) / unc_plus) ** 2))
+
+        x = np.linspace(lower, upper, int(10 * upper))
+        integ_x = np.linspace(1e-9, upper, len(x))
+        host_pdf = unnorm(x) / trapezoid(unnorm(integ_x), integ_x)
+        return trapezoid(np.sqrt(host_pdf * norm.pdf(x, nle_mean, nle_std)), x)
+
+    def test_asymmetric_gaussian_norm(self):
+        """The analytic normalization matches the numerical one."""
+        from scipy.integrate import trapezoid
+
+        from scoring.distance_match import asymmetric_gaussian_norm
+
+        x = np.linspace(1e-9, 1e3, 1000001)
+        unnorm = np.where(x < 50., np.exp(-0.5 * ((x - 50.) / 30.) ** 2), np.exp(-0.5 * ((x - 50.) / 10.) ** 2))
+        assert np.isclose(asymmetric_gaussian_norm(50., 30., 10., 1e-9, 1e3), trapezoid(unnorm, x), rtol=1e-6)
+
+    def test_matches_grid_integral(self):
+        """Closed-form coefficients for many hosts match the grid integral."""
+        from scoring.distance_match import bhattacharyya_coefficients
+
+        rng = np.random.default_rng(42)
+        mean = rng.uniform(5., 800., 10)
+        unc_minus = rng.uniform(2., 200., 10)
+        unc_plus = rng.uniform(2., 200., 10)
+        coefficients = bhattacharyya_coefficients(
+            150., 40., mean, unc_minus, unc_plus, lower=1e-5, upper=1e4, host_norm_range=(1e-9, 1e4)
+        )
+        expected = [self._grid_coefficient(150., 40., *host) for host in zip(mean, unc_minus, unc_plus)]
+        assert np.allclose(coefficients, expected, atol=1e-6)
+
+    def test_identical_distributions(self):
+        """Identical Gaussians far from the integration bounds overlap completely."""
+        from scoring.distance_match import bhattacharyya_coefficients
+
+        assert np.isclose(bhattacharyya_coefficients(300., 20., [300.], [20.], [20.], 1e-5, 1e4)[0], 1.)
+
+    def test_invalid_distances(self):
+        """Missing event distances and non-positive host uncertainties give NaN."""
+        from scoring.distance_match import bhattacharyya_coefficients
+
+        assert np.isnan(bhattacharyya_coefficients(np.nan, np.nan, [100.], [10.], [10.], 1e-5, 1e4)).all()
+        assert np.isnan(bhattacharyya_coefficients(100., 10., [100.], [0.], [10.], 1e-5, 1e4)).all()
+
+
+class TestCosmology:
+    """Tests for the interpolated distance conversions in scoring/cosmology.py"""
+
+    def test_luminosity_distance_matches_astropy(self):
+        """Interpolated luminosity distances agree with the astropy cosmology."""
+        from astropy import units as u
+        from django.conf import settings
+
+        from scoring.cosmology import luminosity_distance
+
+        z = np.concatenate([np.geomspace(1e-6, 15., 500), [0., 1e-3, 25.]])
+        expected = settings.COSMO.luminosity_distance(z).to_value(u.Mpc)
+        assert np.allclose(luminosity_distance(z), expected, rtol=1e-6, atol=0.)
+        assert isinstance(luminosity_distance(0.1), float)
+        assert np.isnan(luminosity_distance(np.nan))
+
+    def test_redshift_roundtrip(self):
+        """Redshifts recovered from luminosity distances match the input."""
+        from scoring.cosmology import luminosity_distance, redshift_at_distance
+
+        z = np.geomspace(1e-5, 10., 200)
+        assert np.allclose(redshift_at_distance(luminosity_distance(z)), z, rtol=1e-6)
+        assert redshift_at_distance(0.) == 0.
+
+
+class TestHostGalaxies:
+    """Tests for the cached host galaxy accessors in scoring/host_galaxies.py"""
+
+    def test_parsed_once_and_copied(self):
+        """Each stored host list is parsed once, and callers get their own copies."""
+        import json
+
+        from scoring import host_galaxies
+
+        value = json.dumps([
+            {"name": "G1", "z": 0.01, "z_type": "spec-z", "PCC": 0.01},
+            {"name": "G2", "z": 0.02, "z_type": "photo-z", "PCC": 0.1},
+        ])
+        with patch.object(host_galaxies, "_host_galaxies_value", return_value=value), \
+                patch.object(host_galaxies.json, "loads", wraps=json.loads) as loads:
+            records = host_galaxies.get_host_galaxy_records(1)
+            records[0]["z"] = -1
+            df = host_galaxies.get_host_galaxies(1)
+            df["z"] = 0.
+
+            assert host_galaxies.get_host_galaxy_records(1)[0]["z"] == 0.01
+            assert list(host_galaxies.get_host_galaxies(1).z) == [0.01, 0.02]
+            assert loads.call_count == 1
+
+    def test_no_hosts(self):
+        """Targets without a host list return None."""
+        from scoring import host_galaxies
+
+        with patch.object(host_galaxies, "_host_galaxies_value", return_value=None):
+            assert host_galaxies.get_host_galaxy_records(1) is None
+            assert host_galaxies.get_host_galaxies(1) is None
+
+    def test_drop_filler_redshifts(self):
+        """Hosts with a NaN or catalog placeholder redshift are dropped."""
+        import pandas as pd
+
+        from scoring.scoring import drop_filler_redshifts
+
+        df = pd.DataFrame({"z": [0.1, -99.0, np.nan, -999.0, -9999.0, 0.2]})
+        assert list(drop_filler_redshifts(df).z) == [0.1, 0.2]
+        assert len(drop_filler_redshifts(pd.DataFrame())) == 0
+
+
+class TestLightCurve:
+    """Tests for the columnar light curve in scoring/light_curve.py"""
+
+    def test_sorted_and_read_only(self):
+        """Columns are sorted by MJD and cannot be modified."""
+        from scoring.light_curve import LightCurve
+
+        lc = LightCurve(
+            telescope=["ZTF", "ATLAS", "ZTF"],
+            mjd=[60002., 60000., 60001.],
+            mag=[19., 18., 20.],
+            magerr=[0.1, np.nan, 0.],
+            upperlimit=[False, True, False],
+            filter=["g", "o", "r"],
+        )
+        assert list(lc.mjd) == [60000., 60001., 60002.]
+        assert list(lc.filter) == ["o", "r", "g"]
+        assert list(lc.upperlimit) == [True, False, False]
+        with pytest.raises(ValueError):
+            lc.mag[0] = 0.
+        with pytest.raises(ValueError):
+            lc.to_frame().mag.values[0] = 0.
+
+    def test_timestamps_to_mjd(self):
+        """Vectorized MJDs match astropy."""
+        from datetime import datetime, timezone
+
+        from astropy.time import Time
+
+        from scoring.light_curve import timestamps_to_mjd
+
+        timestamps = [
+            datetime(2024, 5, 1, 3, 4, 5, 123456, tzinfo=timezone.utc),
+            datetime(2019, 4, 25, 8, 18, 5, tzinfo=timezone.utc),
+        ]
+        mjd = timestamps_to_mjd(timestamps)
+        assert np.allclose(mjd, [Time(t).mjd for t in timestamps], rtol=0, atol=1e-9)
+        assert len(timestamps_to_mjd([])) == 0
+
+    def test_detections_and_limits(self):
+        """A magnitude key makes a detection, whose magerr is 0 without an error key and NaN with a null one."""
+        from datetime import datetime, timezone
+
+        from scoring.light_curve import _light_curve_from_rows
+
+        t = [datetime(2024, 5, 1, h, tzinfo=timezone.utc) for h in range(5)]
+        lc = _light_curve_from_rows([
+            # timestamp, source_name, filter, magnitude, error, limit, has_magnitude, has_error
+            (t[0], "ZTF", "g", 19., 0.1, None, True, True),
+            (t[1], "ZTF", "g", 19., None, None, True, False),
+            (t[2], "ZTF", "g", 19., None, None, True, True),
+            (t[3], "ZTF", "g", None, None, 21., True, False),
+            (t[4], "ATLAS", "o", None, None, 20., False, False),
+        ])
+        assert list(lc.upperlimit) == [False, False, False, False, True]
+        assert np.allclose(lc.magerr[:2], [0.1, 0.])
+        assert np.isnan(lc.magerr[2]) and np.isnan(lc.magerr[4])
+        assert np.isnan(lc.mag[3]) and lc.mag[4] == 20.
+
+    def test_bytes_roundtrip_and_append(self):
+        """Light curves survive the cache blob, and appending keeps them sorted."""
+        from scoring.light_curve import LightCurve
+
+        old = LightCurve(["ZTF", "ZTF"], [60000., 60002.], [19., 20.], [0.1, np.nan], [False, True], ["g", "r"])
+        new = LightCurve(["ATLAS"], [60001.], [18.], [0.2], [False], ["o"])
+
+        lc = LightCurve.from_bytes(old.to_bytes()).append(new)
+        assert list(lc.mjd) == [60000., 60001., 60002.]
+        assert list(lc.telescope) == ["ZTF", "ATLAS", "ZTF"]
+        assert list(lc.filter) == ["g", "o", "r"]
+        assert np.isnan(lc.magerr[2]) and lc.upperlimit[2]
+
+    def test_cache_appends_new_points(self):
+        """Only the points newer than the cached ones are read from the database."""
+        from scoring import light_curve
+
+        old = light_curve.LightCurve(["ZTF"], [60000.], [19.], [0.1], [False], ["g"])
+        new = light_curve.LightCurve(["ZTF"], [60001.], [19.5], [0.1], [False], ["g"])
+        cached = MagicMock(data=old.to_bytes(), last_datum_id=10, n_datums=1)
+        with patch.object(light_curve, "TargetLightCurve") as TargetLightCurve, \
+                patch.object(light_curve, "ReducedDatum") as ReducedDatum, \
+                patch.object(light_curve, "load_light_curve", return_value=new) as load:
+            TargetLightCurve.objects.filter.return_value.first.return_value = cached
+            ReducedDatum.objects.filter.return_value.aggregate.return_value = {
+                "last_datum_id": 12, "n_datums": 2, "n_new": 1,
+            }
+            lc = light_curve.get_light_curve(1)
+
+            load.assert_called_once_with(1, after_id=10, last_id=12)
+            assert list(lc.mjd) == [60000., 60001.]
+            defaults = TargetLightCurve.objects.update_or_create.call_args.kwargs["defaults"]
+            assert defaults["last_datum_id"] == 12 and defaults["n_datums"] == 2
+
+            # a deleted point means a rebuild
+            ReducedDatum.objects.filter.return_value.aggregate.return_value = {
+                "last_datum_id": 12, "n_datums": 1, "n_new": 1,
+            }
+            light_curve.get_light_curve(1)
+            load.assert_called_with(1, last_id=12)
+
+    def test_read_only_cache(self):
+        """With update_cache=False a stale cached copy is updated in memory only."""
+        from scoring import light_curve
+
+        old = light_curve.LightCurve(["ZTF"], [60000.], [19.], [0.1], [False], ["g"])
+        new = light_curve.LightCurve(["ZTF"], [60001.], [19.5], [0.1], [False], ["g"])
+        cached = MagicMock(data=old.to_bytes(), last_datum_id=10, n_datums=1)
+        with patch.object(light_curve, "TargetLightCurve") as TargetLightCurve, \
+                patch.object(light_curve, "ReducedDatum") as ReducedDatum, \
+                patch.object(light_curve, "load_light_curve", return_value=new):
+            TargetLightCurve.objects.filter.return_value.first.return_value = cached
+            ReducedDatum.objects.filter.return_value.aggregate.return_value = {
+                "last_datum_id": 12, "n_datums": 2, "n_new": 1,
+            }
+            lc = light_curve.get_light_curve(1, update_cache=False)
+
+            assert list(lc.mjd) == [60000., 60001.]
+            TargetLightCurve.objects.update_or_create.assert_not_called()
+
 class TestPcc:
     """Tests for the probability of chance coincidence function."""
 
@@ -387,6 +632,7 @@ class TestAtlasForcedPhotParsing:
     def test_atlas_read_and_sigma_clip(self):
         """Test ATLAS sigma clipping function."""
         import logging
+
         from candidate_vetting.public_catalogs.phot_catalogs import ATLAS_Forced_Phot
 
         log = logging.getLogger(__name__)
@@ -1,10 +1,12 @@
 from django.urls import path
+
 from .views import (
+    CredibleRegionMOCView,
     EventCandidateCreateFromNLEView,
-    generate_report,
-    ToggleAgnCacheView,
     RefreshCandidateList,
     SkymapPartialView,
+    ToggleAgnCacheView,
+    generate_report,
 )
 
 app_name = "trove_nonlocalizedevents"
@@ -31,4 +33,9 @@ urlpatterns = [
         SkymapPartialView.as_view(),
         name="skymap"
     ),
+    path(
+        "skymap/<int:localization_id>/moc.fits",
+        CredibleRegionMOCView.as_view(),
+        name="skymap-moc"
+    ),
 ]
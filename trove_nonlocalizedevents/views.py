@@ -1,27 +1,36 @@
-import json
-from django_filters.views import FilterView
+from io import BytesIO
+
+import numpy as np
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.cache import cache
 from django.core.paginator import Paginator
-from django.shortcuts import redirect, render
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.http import JsonResponse, HttpResponse
-from django.contrib.auth.mixins import LoginRequiredMixin
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.generic.base import View
-
-from trove_targets.models import Target
-from tom_targets.models import TargetExtra
-from tom_targets.permissions import targets_for_user
-from tom_nonlocalizedevents.models import NonLocalizedEvent, EventCandidate
-from scoring.models import ScoreFactor
-from scoring.util import get_event_candidate_scores
+from django_filters.views import FilterView
+from mocpy import MOC
 from tom_dataproducts.models import ReducedDatum
-from custom_code.templatetags.skymap_extras import skymap, get_preferred_localization
+from tom_nonlocalizedevents.models import EventCandidate, NonLocalizedEvent
+from tom_targets.permissions import targets_for_user
 
-from astropy.coordinates import SkyCoord
-from astropy.time import Time
+from custom_code.healpix_utils import decode_ranges, ranges_max_depth
+from custom_code.models import CredibleRegionContour
+from custom_code.templatetags.skymap_extras import get_preferred_localization, skymap
+from scoring.host_galaxies import get_host_galaxy_records
+from scoring.util import (
+    annotate_event_candidate_scores,
+    attach_scores,
+    get_candidate_transients,
+    get_event_candidate_scores,
+    get_typed_scores,
+)
+from trove_targets.models import Target
 
-from .forms import EventCandidateSearchForm, CreateEventCandidateFromNLEForm
+from .forms import CreateEventCandidateFromNLEForm, EventCandidateSearchForm
 
 
 class EventCandidateListView(FilterView):
@@ -76,26 +85,17 @@ class EventCandidateListView(FilterView):
 
         agn_toggle = cache.get("agn_toggle", True)
 
-        # Create cache key from filters (excluding page number)
-        query_params = self.request.GET.copy()
-        query_params.pop("page", None)
-        filter_key = query_params.urlencode()
-        cache_key = f"event_candidates_scored_{filter_key}_{agn_toggle}"
-
-        # Check cache first (ToggleAgnCacheView pre-warms this key for the
-        # current NLE when the AGN toggle is flipped)
-        scored_candidates = cache.get(cache_key)
-        if scored_candidates is None:
-            # Not in cache—score all candidates
-            all_candidates = self.filterset.qs
-            scored_candidates = get_event_candidate_scores(all_candidates, agn_toggle=agn_toggle)
-            # Cache for 5 minutes
-            cache.set(cache_key, scored_candidates, 60 * 5)
-
-        # Paginate the cached scored list
+        # score and sort in the database, and only load the candidates on this page
+        all_candidates = self.filterset.qs
+        transients = get_candidate_transients(all_candidates) or ["KN"]
+        scored_candidates = annotate_event_candidate_scores(
+            all_candidates, transients=transients, agn_toggle=agn_toggle
+        )
+
         paginator = Paginator(scored_candidates, self.paginate_by)
         page_number = self.request.GET.get("page", 1)
         page_obj = paginator.get_page(page_number)
+        page_obj.object_list = attach_scores(page_obj.object_list, transients)
 
         context["page_obj"] = page_obj
         context["object_list"] = page_obj.object_list
@@ -165,7 +165,7 @@ def generate_report(request):
         nonlocalizedevent_id=nle_id
     ).select_related("target", "nonlocalizedevent")
 
-    candidates = list(get_event_candidate_scores(candidates, agn_toggle=False))  # [:ncands]
+    candidates = get_event_candidate_scores(candidates, agn_toggle=False, limit=ncands)
 
     nle_name = NonLocalizedEvent.objects.get(id=nle_id)
 
@@ -178,12 +178,12 @@ Below, we report the top {ncands} candidates that remain viable after running ou
 | :------- | :------: | -------: | -------: | -------: | -------: | -------: | -------: | -------: | -------: |"""
 
     subscore_keys_to_report = ["skymap_score", "host_distance_score"]
+    typed_scores = get_typed_scores(
+        [ec.id for ec in candidates], keys=subscore_keys_to_report
+    )
 
     lines = [text]
-    for i, ec in enumerate(candidates, 1):
-        if i > ncands:
-            break
-
+    for ec in candidates:
         # get target info
         t = ec.target
         ra, dec = (
@@ -193,37 +193,19 @@ Below, we report the top {ncands} candidates that remain viable after running ou
         )
 
         # get subscore info
-        sf = ScoreFactor.objects.filter(
-            event_candidate=ec, key__in=subscore_keys_to_report
+        sf = typed_scores.get(ec.id, {})
+        loc_prob = f"{sf['skymap_score']:.2f}" if "skymap_score" in sf else None
+        host_score = (
+            f"{sf['host_distance_score']:.2f}" if "host_distance_score" in sf else None
         )
 
-        try:
-            loc_prob = f"{float(sf.filter(key='skymap_score').first().value):.2f}"
-        except AttributeError:
-            loc_prob = None
-
-        try:
-            host_score = (
-                f"{float(sf.filter(key='host_distance_score').first().value):.2f}"
-            )
-        except AttributeError:
-            host_score = None
-
         # get details of the best matching host galaxy
         try:
-            host_info = json.loads(
-                TargetExtra.objects.filter(target_id=t.id, key="Host Galaxies")
-                .first()
-                .value
-            )
-            if isinstance(host_info, list):
-                # this is if there are multiple hosts, otherwise host_info is already a
-                # dict with the most likely info
-                host_info = host_info[0]  # the first is the most likely because we sort
-
+            # the first is the most likely because we sort
+            host_info = get_host_galaxy_records(t.id)[0]
             host_str = f"{float(host_info['z']):.3f} ({host_info['Source']} {host_info['z_type']})"
 
-        except (AttributeError, IndexError):
+        except (TypeError, IndexError):
             host_str = None
 
         except KeyError:
@@ -296,19 +278,11 @@ class ToggleAgnCacheView(LoginRequiredMixin, View):
 
         nle_id = request.GET.get("nonlocalizedevent")
         if nle_id:
-            candidates = EventCandidate.objects.filter(
-                nonlocalizedevent_id=nle_id
-            ).select_related("target", "nonlocalizedevent")
-            scored_candidates = get_event_candidate_scores(candidates, agn_toggle=new_val)
-
-            # Re-sores all candidates after AGN-toggle change and saves to cache
-            cache_key = f"event_candidates_scored_nonlocalizedevent={nle_id}_{new_val}"
-            cache.set(cache_key, scored_candidates, 60 * 5)
             return redirect(reverse("custom_code:event-candidates") + f"?nonlocalizedevent={nle_id}")
         return redirect(reverse("custom_code:event-candidates"))
 
 
-class SkymapPartialView(View):
+class SkymapPartialView(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         nle_id = request.GET.get("nonlocalizedevent")
         if not nle_id:
@@ -321,6 +295,34 @@ class SkymapPartialView(View):
         return render(request, "tom_nonlocalizedevents/partials/skymap.html", context)
 
 
+class CredibleRegionMOCView(LoginRequiredMixin, View):
+    """
+    Stream the credible region contour of a localization as a FITS MOC, which
+    Aladin Lite decodes directly with ``A.MOCFromURL``
+    """
+    def get(self, request, localization_id, *args, **kwargs):
+        try:
+            probability = float(request.GET.get("probability", 0.9))
+        except ValueError:
+            return HttpResponseBadRequest("probability must be a number")
+        if not 0 < probability <= 1:
+            return HttpResponseBadRequest("probability must be in (0, 1]")
+        contour = get_object_or_404(
+            CredibleRegionContour.objects.only("ranges"),
+            localization_id=localization_id,
+            probability=probability,
+        )
+        if contour.ranges is None:
+            raise Http404("Credible region contour has not been encoded")
+        ranges = decode_ranges(contour.ranges)
+        moc = MOC.from_depth29_ranges(ranges_max_depth(ranges), ranges.astype(np.uint64))
+        buffer = BytesIO()
+        moc.serialize(format="fits").writeto(buffer)
+        response = HttpResponse(buffer.getvalue(), content_type="application/fits")
+        response["Cache-Control"] = "private, max-age=86400"  # contours never change once computed
+        return response
+
+
 class RefreshCandidateList(LoginRequiredMixin, View):
     def get(self, request, *args, **kwargs):
         nle_id = request.GET.get("nonlocalizedevent")
@@ -1,12 +1,15 @@
 from typing import List
+
 from astropy.time import Time, TimezoneInfo
+from candidate_vetting.public_catalogs.util import create_phot
 from ninja import Router, Schema
 from ninja.orm import create_schema
 from tom_nonlocalizedevents.models import EventCandidate
 from tom_targets.utils import cone_search_filter
-from trove_targets.models import Target
+
 from custom_code.hooks import target_post_save
-from candidate_vetting.public_catalogs.util import create_phot
+from scoring.light_curve import get_light_curve
+from trove_targets.models import Target
 
 router = Router()
 
@@ -61,6 +64,9 @@ def _save_target(payload:UploadTargetSchema):
                 fluxdict = d,
                 source = source
             )
+
+        # add the new points to the cached light curve
+        get_light_curve(target.id)
     
     # run the target post save hook
     target_post_save(target, created=True)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trove_targets', '0003_alter_target_healpix'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='target',
+            name='healpix_coarse',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -1,8 +1,11 @@
-from django.db import models
-from tom_targets.models import BaseTarget
 from astropy.coordinates import SkyCoord
-from healpix_alchemy.constants import HPX
 from django.conf import settings
+from django.db import models
+from healpix_alchemy.constants import HPX, LEVEL
+from tom_targets.models import BaseTarget
+
+# healpix level of healpix_coarse (nside 64), used to prefilter targets before exact containment tests
+HEALPIX_COARSE_LEVEL = 6
 
 
 class Target(BaseTarget):
@@ -11,6 +14,8 @@ class Target(BaseTarget):
     mwebv = models.FloatField(verbose_name='Milky Way E(B-V)', null=True, blank=True)
     healpix = models.BigIntegerField(null=True, blank=True)
     healpix.hidden = True
+    healpix_coarse = models.IntegerField(null=True, blank=True, db_index=True)
+    healpix_coarse.hidden = True
 
     def save(self, *args, **kwargs):
         ra = self.ra if self.ra is not None else self.basetarget_ptr.ra
@@ -20,5 +25,6 @@ class Target(BaseTarget):
         self.galactic_lng = coord.galactic.l.deg
         self.galactic_lat = coord.galactic.b.deg
         self.healpix = HPX.skycoord_to_healpix(coord)
+        self.healpix_coarse = int(self.healpix) >> 2 * (LEVEL - HEALPIX_COARSE_LEVEL)
         self.mwebv = settings.DUST_MAP(coord)
         super().save(*args, **kwargs)
@@ -11,19 +11,21 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
-from .settings_local import *
+import datetime as _datetime
 import os
 import tempfile
-import datetime as _datetime
-from astropy.cosmology import FlatLambdaCDM
-from astropy import units as _u
 import warnings
 
+from astropy import units as _u
+from astropy.cosmology import FlatLambdaCDM
+
 # Django 5.0 removed django.utils.timezone.utc (deprecated since 4.1), but the installed
 # tom_nonlocalizedevents still references it (healpix_utils.create_localization_for_skymap),
 # which otherwise breaks skymap/localization ingestion. Restore it for compatibility.
 from django.utils import timezone as _timezone
 
+from .settings_local import *
+
 if not hasattr(_timezone, "utc"):
     _timezone.utc = _datetime.timezone.utc
 
@@ -417,6 +419,8 @@ WEBPACK_LOADER = {
 TOM_API_URL = os.getenv("TOM_API_URL", os.path.join(ALLOWED_HOST, FORCE_SCRIPT_NAME))
 HERMES_API_URL = os.getenv("HERMES_API_URL", "https://hermes.lco.global")
 CREDIBLE_REGION_PROBABILITIES = "[0.25, 0.5, 0.75, 0.9, 0.95]"
+# on-disk cache of the healpix grids generated for Einstein Probe / IceCube error ellipses
+SKYMAP_GRID_CACHE_DIR = os.getenv("SKYMAP_GRID_CACHE_DIR", os.path.join(tempfile.gettempdir(), "trove_skymap_grids"))
 
 TARGET_MODEL_CLASS = os.getenv("TARGET_MODEL_CLASS", "trove_targets.models.Target")
 
@@ -480,3 +484,7 @@ PRIORITY_LOW = 0
 
 # skymap probability contour within which we may consider a target and nonlocalized event associated
 SKYMAP_PROB_CONTOUR = 0.95
+
+# skymap tiles beyond this cumulative probability are not stored; the probability they held is kept in SkymapTail.
+# Off (1) unless set, e.g. SKYMAP_TILE_PROB_CUTOFF=0.999
+SKYMAP_TILE_PROB_CUTOFF = float(os.getenv("SKYMAP_TILE_PROB_CUTOFF", 1.))